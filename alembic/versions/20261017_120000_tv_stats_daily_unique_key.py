@@ -0,0 +1,56 @@
+"""tv_stats daily unique key
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '002'
+down_revision: Union[str, None] = '001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+GROUP_KEY = "tv_id, COALESCE(tv_link_id, 0), stat_date"
+SAME_KEY = (
+    "s.tv_id = tv_stats.tv_id"
+    " AND COALESCE(s.tv_link_id, 0) = COALESCE(tv_stats.tv_link_id, 0)"
+    " AND s.stat_date = tv_stats.stat_date"
+)
+
+
+def upgrade() -> None:
+    # Сливаем дубликаты (tv_id, tv_link_id, stat_date) в строку с минимальным id
+    op.execute(f"""
+        UPDATE tv_stats SET
+            impressions = (SELECT SUM(COALESCE(s.impressions, 0)) FROM tv_stats s WHERE {SAME_KEY}),
+            clicks = (SELECT SUM(COALESCE(s.clicks, 0)) FROM tv_stats s WHERE {SAME_KEY}),
+            unique_views = (SELECT SUM(COALESCE(s.unique_views, 0)) FROM tv_stats s WHERE {SAME_KEY}),
+            screen_time_seconds = (SELECT SUM(COALESCE(s.screen_time_seconds, 0)) FROM tv_stats s WHERE {SAME_KEY})
+        WHERE id IN (
+            SELECT MIN(id) FROM tv_stats GROUP BY {GROUP_KEY} HAVING COUNT(*) > 1
+        )
+    """)
+    op.execute(f"""
+        DELETE FROM tv_stats WHERE id NOT IN (
+            SELECT keep_id FROM (SELECT MIN(id) AS keep_id FROM tv_stats GROUP BY {GROUP_KEY}) AS keep
+        )
+    """)
+    
+    op.create_index(
+        'uq_tv_stats_daily',
+        'tv_stats',
+        ['tv_id', sa.text('COALESCE(tv_link_id, 0)'), 'stat_date'],
+        unique=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('uq_tv_stats_daily', table_name='tv_stats')
@@ -0,0 +1,40 @@
+"""tv link changes
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '004'
+down_revision: Union[str, None] = '003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'tv_link_changes',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('tv_id', sa.Integer(), nullable=False),
+        sa.Column('link_id', sa.Integer(), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('action', sa.String(length=20), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['tv_id'], ['tvs.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_tv_link_changes_id'), 'tv_link_changes', ['id'], unique=False)
+    op.create_index('ix_tv_link_changes_tv_version', 'tv_link_changes', ['tv_id', 'version'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tv_link_changes_tv_version', table_name='tv_link_changes')
+    op.drop_index(op.f('ix_tv_link_changes_id'), table_name='tv_link_changes')
+    op.drop_table('tv_link_changes')
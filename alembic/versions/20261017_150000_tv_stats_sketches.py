@@ -0,0 +1,48 @@
+"""tv stats sketches
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '005'
+down_revision: Union[str, None] = '004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'tv_stats_sketches',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('tv_id', sa.Integer(), nullable=False),
+        sa.Column('tv_link_id', sa.Integer(), nullable=True),
+        sa.Column('stat_date', sa.Date(), nullable=False),
+        sa.Column('registers', sa.LargeBinary(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['tv_id'], ['tvs.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['tv_link_id'], ['tv_links.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_tv_stats_sketches_id'), 'tv_stats_sketches', ['id'], unique=False)
+    op.create_index(op.f('ix_tv_stats_sketches_stat_date'), 'tv_stats_sketches', ['stat_date'], unique=False)
+    op.create_index(
+        'uq_tv_stats_sketches_daily',
+        'tv_stats_sketches',
+        ['tv_id', sa.text('COALESCE(tv_link_id, 0)'), 'stat_date'],
+        unique=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('uq_tv_stats_sketches_daily', table_name='tv_stats_sketches')
+    op.drop_index(op.f('ix_tv_stats_sketches_stat_date'), table_name='tv_stats_sketches')
+    op.drop_index(op.f('ix_tv_stats_sketches_id'), table_name='tv_stats_sketches')
+    op.drop_table('tv_stats_sketches')
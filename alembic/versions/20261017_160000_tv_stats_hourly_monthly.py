@@ -0,0 +1,87 @@
+"""tv stats hourly and monthly
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '006'
+down_revision: Union[str, None] = '005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'tv_stats_hourly',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('tv_id', sa.Integer(), nullable=False),
+        sa.Column('tv_link_id', sa.Integer(), nullable=True),
+        sa.Column('advertiser_id', sa.Integer(), nullable=True),
+        sa.Column('stat_hour', sa.DateTime(), nullable=False),
+        sa.Column('impressions', sa.Integer(), nullable=True),
+        sa.Column('clicks', sa.Integer(), nullable=True),
+        sa.Column('views', sa.Integer(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['tv_id'], ['tvs.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['tv_link_id'], ['tv_links.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['advertiser_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_tv_stats_hourly_id'), 'tv_stats_hourly', ['id'], unique=False)
+    op.create_index(op.f('ix_tv_stats_hourly_advertiser_id'), 'tv_stats_hourly', ['advertiser_id'], unique=False)
+    op.create_index(op.f('ix_tv_stats_hourly_stat_hour'), 'tv_stats_hourly', ['stat_hour'], unique=False)
+    op.create_index(
+        'uq_tv_stats_hourly',
+        'tv_stats_hourly',
+        ['tv_id', sa.text('COALESCE(tv_link_id, 0)'), 'stat_hour'],
+        unique=True,
+    )
+
+    op.create_table(
+        'tv_stats_monthly',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('tv_id', sa.Integer(), nullable=False),
+        sa.Column('tv_link_id', sa.Integer(), nullable=True),
+        sa.Column('advertiser_id', sa.Integer(), nullable=True),
+        sa.Column('stat_month', sa.Date(), nullable=False),
+        sa.Column('impressions', sa.Integer(), nullable=True),
+        sa.Column('clicks', sa.Integer(), nullable=True),
+        sa.Column('screen_time_seconds', sa.Integer(), nullable=True),
+        sa.Column('unique_views', sa.Integer(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['tv_id'], ['tvs.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['tv_link_id'], ['tv_links.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['advertiser_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_tv_stats_monthly_id'), 'tv_stats_monthly', ['id'], unique=False)
+    op.create_index(op.f('ix_tv_stats_monthly_advertiser_id'), 'tv_stats_monthly', ['advertiser_id'], unique=False)
+    op.create_index(op.f('ix_tv_stats_monthly_stat_month'), 'tv_stats_monthly', ['stat_month'], unique=False)
+    op.create_index(
+        'uq_tv_stats_monthly',
+        'tv_stats_monthly',
+        ['tv_id', sa.text('COALESCE(tv_link_id, 0)'), 'stat_month'],
+        unique=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('uq_tv_stats_monthly', table_name='tv_stats_monthly')
+    op.drop_index(op.f('ix_tv_stats_monthly_stat_month'), table_name='tv_stats_monthly')
+    op.drop_index(op.f('ix_tv_stats_monthly_advertiser_id'), table_name='tv_stats_monthly')
+    op.drop_index(op.f('ix_tv_stats_monthly_id'), table_name='tv_stats_monthly')
+    op.drop_table('tv_stats_monthly')
+
+    op.drop_index('uq_tv_stats_hourly', table_name='tv_stats_hourly')
+    op.drop_index(op.f('ix_tv_stats_hourly_stat_hour'), table_name='tv_stats_hourly')
+    op.drop_index(op.f('ix_tv_stats_hourly_advertiser_id'), table_name='tv_stats_hourly')
+    op.drop_index(op.f('ix_tv_stats_hourly_id'), table_name='tv_stats_hourly')
+    op.drop_table('tv_stats_hourly')
@@ -0,0 +1,34 @@
+"""stats event segments
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '007'
+down_revision: Union[str, None] = '006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'stats_event_segments',
+        sa.Column('name', sa.String(length=128), nullable=False),
+        sa.Column('records', sa.Integer(), nullable=False),
+        sa.Column('compacted_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('name'),
+    )
+    op.create_index(op.f('ix_stats_event_segments_compacted_at'), 'stats_event_segments', ['compacted_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_stats_event_segments_compacted_at'), table_name='stats_event_segments')
+    op.drop_table('stats_event_segments')
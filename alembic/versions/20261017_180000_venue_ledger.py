@@ -0,0 +1,98 @@
+"""venue ledger and balances
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '008'
+down_revision: Union[str, None] = '007'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'venue_ledger',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('venue_id', sa.Integer(), nullable=False),
+        sa.Column('tv_id', sa.Integer(), nullable=True),
+        sa.Column('subscription_id', sa.Integer(), nullable=True),
+        sa.Column('payout_id', sa.Integer(), nullable=True),
+        sa.Column('entry_type', sa.String(length=20), nullable=False),
+        sa.Column('amount', sa.Numeric(precision=12, scale=2), nullable=False),
+        sa.Column('entry_date', sa.Date(), nullable=False),
+        sa.Column('description', sa.String(length=500), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['venue_id'], ['users.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['tv_id'], ['tvs.id'], ondelete='SET NULL'),
+        sa.ForeignKeyConstraint(['subscription_id'], ['subscriptions.id'], ondelete='SET NULL'),
+        sa.ForeignKeyConstraint(['payout_id'], ['venue_payouts.id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('subscription_id'),
+        sa.UniqueConstraint('payout_id'),
+    )
+    op.create_index(op.f('ix_venue_ledger_id'), 'venue_ledger', ['id'], unique=False)
+    op.create_index(op.f('ix_venue_ledger_venue_id'), 'venue_ledger', ['venue_id'], unique=False)
+    op.create_index('ix_venue_ledger_venue_created', 'venue_ledger', ['venue_id', 'created_at', 'id'], unique=False)
+
+    op.create_table(
+        'venue_balances',
+        sa.Column('venue_id', sa.Integer(), nullable=False),
+        sa.Column('earned', sa.Numeric(precision=12, scale=2), nullable=False),
+        sa.Column('paid', sa.Numeric(precision=12, scale=2), nullable=False),
+        sa.Column('balance', sa.Numeric(precision=12, scale=2), nullable=False),
+        sa.Column('subscriptions_count', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['venue_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('venue_id'),
+    )
+
+    # Журнал из истории: начисления по подпискам и проведённые выплаты
+    op.execute(
+        """
+        INSERT INTO venue_ledger (venue_id, tv_id, subscription_id, entry_type, amount, entry_date, description, created_at)
+        SELECT tvs.venue_id, s.tv_id, s.id, 'credit', COALESCE(s.venue_payout, 0), s.start_date,
+               'Подписка #' || s.id || ': ' || tvs.name, s.created_at
+        FROM subscriptions s
+        JOIN tvs ON tvs.id = s.tv_id
+        WHERE tvs.venue_id IS NOT NULL
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO venue_ledger (venue_id, tv_id, payout_id, entry_type, amount, entry_date, description, created_at)
+        SELECT p.venue_id, p.tv_id, p.id, 'debit', p.amount, DATE(COALESCE(p.paid_at, p.created_at)),
+               'Выплата #' || p.id, COALESCE(p.paid_at, p.created_at)
+        FROM venue_payouts p
+        WHERE p.status = 'paid'
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO venue_balances (venue_id, earned, paid, balance, subscriptions_count, updated_at)
+        SELECT venue_id,
+               SUM(CASE WHEN entry_type = 'credit' THEN amount ELSE 0 END),
+               SUM(CASE WHEN entry_type = 'debit' THEN amount ELSE 0 END),
+               SUM(CASE WHEN entry_type = 'credit' THEN amount ELSE -amount END),
+               SUM(CASE WHEN entry_type = 'credit' THEN 1 ELSE 0 END),
+               CURRENT_TIMESTAMP
+        FROM venue_ledger
+        GROUP BY venue_id
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('venue_balances')
+    op.drop_index('ix_venue_ledger_venue_created', table_name='venue_ledger')
+    op.drop_index(op.f('ix_venue_ledger_venue_id'), table_name='venue_ledger')
+    op.drop_index(op.f('ix_venue_ledger_id'), table_name='venue_ledger')
+    op.drop_table('venue_ledger')
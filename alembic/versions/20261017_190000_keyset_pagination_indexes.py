@@ -0,0 +1,40 @@
+"""keyset pagination indexes
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '009'
+down_revision: Union[str, None] = '008'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Keyset-пагинация сравнивает (created_at, id): строки без даты выпали бы из списков
+    op.execute("UPDATE users SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL")
+    op.execute("UPDATE tvs SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL")
+    # payments.created_at объявлен NOT NULL, но базы, созданные не миграциями, могли его не получить
+    op.execute("UPDATE payments SET created_at = COALESCE(paid_at, updated_at, CURRENT_TIMESTAMP) WHERE created_at IS NULL")
+
+    op.create_index('ix_users_created_id', 'users', ['created_at', 'id'], unique=False)
+    op.create_index('ix_users_offer_accepted_id', 'users', ['offer_accepted_at', 'id'], unique=False)
+    op.create_index('ix_tvs_created_id', 'tvs', ['created_at', 'id'], unique=False)
+    op.create_index('ix_payments_created_id', 'payments', ['created_at', 'id'], unique=False)
+    op.create_index('ix_payments_user_created_id', 'payments', ['user_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_payments_user_created_id', table_name='payments')
+    op.drop_index('ix_payments_created_id', table_name='payments')
+    op.drop_index('ix_tvs_created_id', table_name='tvs')
+    op.drop_index('ix_users_offer_accepted_id', table_name='users')
+    op.drop_index('ix_users_created_id', table_name='users')
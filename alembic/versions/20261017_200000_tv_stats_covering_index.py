@@ -0,0 +1,31 @@
+"""tv stats covering index for period reports
+
+Revision ID: 010
+Revises: 009
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '010'
+down_revision: Union[str, None] = '009'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_tv_stats_advertiser_date_cover',
+        'tv_stats',
+        ['advertiser_id', 'stat_date', 'tv_id', 'tv_link_id', 'impressions', 'clicks'],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tv_stats_advertiser_date_cover', table_name='tv_stats')
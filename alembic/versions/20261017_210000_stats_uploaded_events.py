@@ -0,0 +1,35 @@
+"""stats uploaded events
+
+Revision ID: 011
+Revises: 010
+Create Date: 2026-10-17
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '011'
+down_revision: Union[str, None] = '010'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'stats_uploaded_events',
+        sa.Column('tv_id', sa.Integer(), nullable=False),
+        sa.Column('event_id', sa.String(length=64), nullable=False),
+        sa.Column('received_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['tv_id'], ['tvs.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('tv_id', 'event_id'),
+    )
+    op.create_index(op.f('ix_stats_uploaded_events_received_at'), 'stats_uploaded_events', ['received_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_stats_uploaded_events_received_at'), table_name='stats_uploaded_events')
+    op.drop_table('stats_uploaded_events')
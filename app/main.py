@@ -1,4 +1,5 @@
-from contextlib import asynccontextmanager
+import asyncio
+from contextlib import asynccontextmanager, suppress
 
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
@@ -26,8 +27,34 @@ async def lifespan(app: FastAPI):
     finally:
         db.close()
     
+    # Background flush of buffered player stats
+    from app.services.stats_buffer import stats_buffer
+    flush_task = asyncio.create_task(stats_buffer.run(settings.STATS_FLUSH_INTERVAL_SECONDS))
+    
+    # Background monthly rollups and retention of hourly/daily/monthly stats
+    from app.services.stats_rollup import run_periodic_rollup
+    rollup_task = asyncio.create_task(run_periodic_rollup(settings.STATS_ROLLUP_INTERVAL_SECONDS))
+    
+    # Background refresh of the admin KPI snapshot
+    from app.services.admin_kpi import admin_kpis
+    kpi_task = asyncio.create_task(admin_kpis.run(settings.ADMIN_KPI_REFRESH_SECONDS))
+    
+    # Background compaction of the raw event log into TVStats
+    from app.services.event_log import event_log
+    tasks = [flush_task, rollup_task, kpi_task]
+    if settings.STATS_EVENT_LOG:
+        tasks.append(asyncio.create_task(event_log.run(settings.EVENT_LOG_COMPACT_INTERVAL_SECONDS)))
+    
     yield
-    # Shutdown: cleanup if needed
+    
+    # Shutdown: stop background tasks and flush buffered stats so no counts are lost
+    for task in tasks:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    stats_buffer.flush()
+    if settings.STATS_EVENT_LOG:
+        event_log.close()
 
 
 app = FastAPI(
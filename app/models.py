@@ -4,9 +4,9 @@ SQLAlchemy models - compatible with both SQLite and PostgreSQL.
 
 from datetime import datetime, date
 
-from sqlalchemy import Column, Integer, String, DateTime, Date, Numeric, Text, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Date, Numeric, Text, Boolean, ForeignKey, Index, LargeBinary
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, literal_column
 
 from app.db import Base
 
@@ -143,6 +143,9 @@ class TV(Base):
     is_active = Column(Boolean, default=True)
     is_approved = Column(Boolean, default=False)          # Одобрен ли модерацией
     
+    # ─── Версия контента для плееров (растёт при изменении ссылок и отображаемых полей) ───
+    content_version = Column(Integer, nullable=False, default=1, server_default="1")
+    
     # ─── Timestamps ───
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -152,6 +155,12 @@ class TV(Base):
     subscriptions = relationship("Subscription", back_populates="tv", cascade="all, delete-orphan")
     venue_owner = relationship("User", back_populates="owned_tvs", foreign_keys=[venue_id])
     documents = relationship("VenueDocument", back_populates="tv", cascade="all, delete-orphan")
+    link_changes = relationship("TVLinkChange", back_populates="tv", cascade="all, delete-orphan")
+    
+    # ─── Keyset-пагинация списков админки по (created_at, id) ───
+    __table_args__ = (
+        Index("ix_tvs_created_id", created_at, id),
+    )
 
 
 # ─────────────────────────────────────────────────────────────
@@ -196,6 +205,32 @@ class TVLink(Base):
     advertiser = relationship("User", back_populates="tv_links")
 
 
+class LinkChangeAction:
+    """Тип изменения ссылки ТВ"""
+    CREATED = "created"
+    UPDATED = "updated"
+    DELETED = "deleted"
+
+
+class TVLinkChange(Base):
+    """Change log entry for a TV link (delta sync for players)."""
+    __tablename__ = "tv_link_changes"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    tv_id = Column(Integer, ForeignKey("tvs.id", ondelete="CASCADE"), nullable=False)
+    link_id = Column(Integer, nullable=False)              # Без FK: ссылка может быть уже удалена
+    version = Column(Integer, nullable=False)              # TV.content_version после изменения
+    action = Column(String(20), nullable=False)            # LinkChangeAction
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    tv = relationship("TV", back_populates="link_changes")
+    
+    __table_args__ = (
+        Index("ix_tv_link_changes_tv_version", tv_id, version),
+    )
+
+
 # ─────────────────────────────────────────────────────────────
 # User model (расширенная)
 # ─────────────────────────────────────────────────────────────
@@ -255,6 +290,12 @@ class User(Base):
     subscriptions = relationship("Subscription", back_populates="advertiser")
     payments = relationship("Payment", back_populates="user")
     tv_links = relationship("TVLink", back_populates="advertiser")
+    
+    # ─── Keyset-пагинация списков админки по (created_at, id) ───
+    __table_args__ = (
+        Index("ix_users_created_id", created_at, id),
+        Index("ix_users_offer_accepted_id", offer_accepted_at, id),
+    )
 
 
 # ─────────────────────────────────────────────────────────────
@@ -338,6 +379,12 @@ class Payment(Base):
     # ─── Relationships ───
     user = relationship("User", back_populates="payments")
     subscription = relationship("Subscription", back_populates="payment", uselist=False)
+    
+    # ─── Keyset-пагинация по (created_at, id): все платежи и платежи пользователя ───
+    __table_args__ = (
+        Index("ix_payments_created_id", created_at, id),
+        Index("ix_payments_user_created_id", user_id, created_at, id),
+    )
 
 
 # ─────────────────────────────────────────────────────────────
@@ -370,6 +417,58 @@ class VenuePayout(Base):
     paid_at = Column(DateTime, nullable=True)
 
 
+# ─────────────────────────────────────────────────────────────
+# Venue ledger (журнал начислений/выплат и баланс площадок)
+# ─────────────────────────────────────────────────────────────
+
+class LedgerEntryType:
+    CREDIT = "credit"      # Начисление за подписку
+    DEBIT = "debit"        # Проведённая выплата
+    REVERSAL = "reversal"  # Сторно начисления (подписка удалена вместе с рекламодателем)
+
+
+class VenueLedgerEntry(Base):
+    """Запись журнала площадки (только добавление): начисление, выплата или сторно."""
+    __tablename__ = "venue_ledger"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    
+    # ─── Связи ───
+    venue_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    tv_id = Column(Integer, ForeignKey("tvs.id", ondelete="SET NULL"), nullable=True)
+    subscription_id = Column(Integer, ForeignKey("subscriptions.id", ondelete="SET NULL"), nullable=True, unique=True)
+    payout_id = Column(Integer, ForeignKey("venue_payouts.id", ondelete="SET NULL"), nullable=True, unique=True)
+    
+    # ─── Операция ───
+    entry_type = Column(String(20), nullable=False)       # LedgerEntryType
+    amount = Column(Numeric(12, 2), nullable=False)       # Всегда положительная
+    entry_date = Column(Date, nullable=False)             # Начало подписки / дата выплаты
+    description = Column(String(500), nullable=True)
+    
+    # ─── Timestamps ───
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("ix_venue_ledger_venue_created", venue_id, created_at, id),
+    )
+
+
+class VenueBalance(Base):
+    """Текущий баланс площадки - сумма журнала, обновляется вместе с ним."""
+    __tablename__ = "venue_balances"
+    
+    venue_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    
+    # ─── Суммы ───
+    earned = Column(Numeric(12, 2), nullable=False, default=0)     # Начислено
+    paid = Column(Numeric(12, 2), nullable=False, default=0)       # Выплачено
+    balance = Column(Numeric(12, 2), nullable=False, default=0)    # К выплате: earned - paid
+    subscriptions_count = Column(Integer, nullable=False, default=0)
+    
+    # ─── Timestamps ───
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
 # ─────────────────────────────────────────────────────────────
 # TVStats model (статистика показов по дням)
 # ─────────────────────────────────────────────────────────────
@@ -397,6 +496,114 @@ class TVStats(Base):
     # ─── Timestamps ───
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # ─── Одна строка на (ТВ, ссылка, день) — ключ для атомарного upsert ───
+    # tv_link_id может быть NULL (просмотры страницы ТВ), поэтому в ключе COALESCE(tv_link_id, 0)
+    __table_args__ = (
+        Index(
+            "uq_tv_stats_daily",
+            tv_id, func.coalesce(tv_link_id, literal_column("0")), stat_date,
+            unique=True,
+        ),
+        # Покрывающие индексы для отчётов за период (stats_query): без чтения строк таблицы
+        Index(
+            "ix_tv_stats_advertiser_date_cover",
+            advertiser_id, stat_date, tv_id, tv_link_id, impressions, clicks,
+        ),
+        Index(
+            "ix_tv_stats_tv_date_cover",
+            tv_id, stat_date, tv_link_id, impressions, clicks,
+        ),
+    )
+
+
+class TVStatsHourly(Base):
+    """Почасовая статистика ТВ (заполняется вместе с TVStats, хранится STATS_HOURLY_RETENTION_DAYS)."""
+    __tablename__ = "tv_stats_hourly"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    tv_id = Column(Integer, ForeignKey("tvs.id", ondelete="CASCADE"), nullable=False)
+    tv_link_id = Column(Integer, ForeignKey("tv_links.id", ondelete="CASCADE"), nullable=True)
+    advertiser_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)
+    stat_hour = Column(DateTime, nullable=False, index=True)  # Начало часа (UTC)
+    
+    impressions = Column(Integer, default=0)
+    clicks = Column(Integer, default=0)
+    views = Column(Integer, default=0)                    # Просмотры (не уникальные)
+    
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        Index(
+            "uq_tv_stats_hourly",
+            tv_id, func.coalesce(tv_link_id, literal_column("0")), stat_hour,
+            unique=True,
+        ),
+    )
+
+
+class TVStatsMonthly(Base):
+    """Месячная статистика ТВ (свёртка TVStats, хранится дольше дневной)."""
+    __tablename__ = "tv_stats_monthly"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    tv_id = Column(Integer, ForeignKey("tvs.id", ondelete="CASCADE"), nullable=False)
+    tv_link_id = Column(Integer, ForeignKey("tv_links.id", ondelete="CASCADE"), nullable=True)
+    advertiser_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)
+    stat_month = Column(Date, nullable=False, index=True)  # Первое число месяца
+    
+    impressions = Column(Integer, default=0)
+    clicks = Column(Integer, default=0)
+    screen_time_seconds = Column(Integer, default=0)
+    unique_views = Column(Integer, default=0)             # Оценка по объединению дневных скетчей
+    
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        Index(
+            "uq_tv_stats_monthly",
+            tv_id, func.coalesce(tv_link_id, literal_column("0")), stat_month,
+            unique=True,
+        ),
+    )
+
+
+class TVStatsSketch(Base):
+    """HyperLogLog-скетч уникальных зрителей за день (рядом с TVStats, тот же ключ)."""
+    __tablename__ = "tv_stats_sketches"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    tv_id = Column(Integer, ForeignKey("tvs.id", ondelete="CASCADE"), nullable=False)
+    tv_link_id = Column(Integer, ForeignKey("tv_links.id", ondelete="CASCADE"), nullable=True)
+    stat_date = Column(Date, nullable=False, index=True)
+    registers = Column(LargeBinary, nullable=False)       # Регистры HLL (2^STATS_HLL_PRECISION байт)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        Index(
+            "uq_tv_stats_sketches_daily",
+            tv_id, func.coalesce(tv_link_id, literal_column("0")), stat_date,
+            unique=True,
+        ),
+    )
+
+
+class StatsEventSegment(Base):
+    """Сегмент журнала событий статистики, уже свёрнутый в TVStats (защита от повторной свёртки)."""
+    __tablename__ = "stats_event_segments"
+    
+    name = Column(String(128), primary_key=True)          # Имя файла сегмента
+    records = Column(Integer, nullable=False, default=0)
+    compacted_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+class StatsUploadedEvent(Base):
+    """ID события офлайн-выгрузки плеера, уже принятого (защита от повторного учёта)."""
+    __tablename__ = "stats_uploaded_events"
+    
+    tv_id = Column(Integer, ForeignKey("tvs.id", ondelete="CASCADE"), primary_key=True)
+    event_id = Column(String(64), primary_key=True)       # ID события от плеера (уникален на ТВ)
+    received_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
 
 
 # ─────────────────────────────────────────────────────────────
@@ -1,13 +1,20 @@
 """
-Admin API routes для проверки OAuth конфигурации
+Admin API routes: проверка OAuth конфигурации, журнал событий статистики
 """
-from fastapi import APIRouter, Depends, Request
+import asyncio
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 
 from app.deps import get_db
 from app.deps_auth import require_role_for_page
 from app.models import User, Role
+from app.services.event_log import event_log, utc_naive
+from app.services.stats_buffer import stats_buffer
+from app.services.stats_guard import stats_guard
 from app.settings import settings
 
 router = APIRouter(prefix="/api/admin", tags=["Admin"])
@@ -37,3 +44,47 @@ async def check_oauth_config(
     }
     
     return JSONResponse(content=config)
+
+
+@router.get("/events/{tv_id}")
+async def scan_tv_events(
+    tv_id: int,
+    date_from: datetime = Query(..., description="Начало периода (UTC)"),
+    date_to: datetime = Query(..., description="Конец периода (UTC, не включительно)"),
+    link_id: Optional[int] = Query(None),
+    limit: int = Query(1000, ge=1, le=100000),
+    current_user: User = Depends(require_role_for_page(Role.ADMIN)),
+):
+    """Сырые события ТВ из журнала за период (разбор споров с рекламодателями)."""
+    date_from, date_to = utc_naive(date_from), utc_naive(date_to)
+    if date_to <= date_from:
+        raise HTTPException(status_code=400, detail="date_to должна быть позже date_from")
+    
+    # Чтение сегментов с диска - в потоке, чтобы не блокировать event loop
+    events = await asyncio.to_thread(event_log.scan, tv_id, date_from, date_to, link_id, limit)
+    return JSONResponse(content={
+        "tv_id": tv_id,
+        "date_from": date_from.isoformat(),
+        "date_to": date_to.isoformat(),
+        "count": len(events),
+        "events": [
+            {
+                "occurred_at": e.occurred_at.isoformat(),
+                "link_id": e.link_id,
+                "event_type": e.event_type,
+                "device_hash": f"{e.device_hash:016x}" if e.device_hash else None,
+            }
+            for e in events
+        ],
+    })
+
+
+@router.get("/stats/ingest")
+async def stats_ingest_status(
+    current_user: User = Depends(require_role_for_page(Role.ADMIN)),
+):
+    """Счётчики приёма статистики в этом воркере: принятые, отброшенные лимитером, ожидающие записи."""
+    return JSONResponse(content={
+        "guard": stats_guard.counters(),
+        "buffer_pending": stats_buffer.pending(),
+    })
@@ -3,14 +3,16 @@ Advertiser routes - payments and profile management.
 """
 
 import uuid
+from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 
 from app.deps import get_db
 from app.models import Payment, PaymentStatus, User
 from app.schemas import CreateAdvertiserPaymentIn, PaymentOut
 from app.payments.yookassa_client import create_payment
+from app.services.pagination import keyset_paginate
 from app.settings import settings
 
 router = APIRouter(prefix="/api/advertiser", tags=["Advertiser API"])
@@ -79,11 +81,24 @@ def create_payment_for_advertiser(
 
 @router.get("/payments", response_model=list[PaymentOut])
 def list_advertiser_payments(
+    response: Response,
     db: Session = Depends(get_db),
     user_id: int = 1,
+    limit: Optional[int] = Query(None, ge=1, le=settings.PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
 ):
-    """List all payments for current advertiser."""
-    payments = db.query(Payment).filter(Payment.user_id == user_id).order_by(Payment.created_at.desc()).all()
+    """
+    List payments for current advertiser, newest first.
+    
+    Returns at most `limit` payments; if there are more, the X-Next-Cursor
+    header holds the cursor to pass as `cursor` for the next page.
+    """
+    payments = keyset_paginate(
+        db.query(Payment).filter(Payment.user_id == user_id),
+        Payment.created_at, Payment.id, after=cursor, per_page=limit,
+    )
+    if payments.next_cursor:
+        response.headers["X-Next-Cursor"] = payments.next_cursor
     
     return [
         PaymentOut(
@@ -11,12 +11,14 @@ from email.mime.text import MIMEText
 from email.mime.base import MIMEBase
 from email import encoders
 from pathlib import Path
+from urllib.parse import urlencode
 from datetime import datetime, date
 from decimal import Decimal
 
-from fastapi import APIRouter, Request, Depends, Form, UploadFile, File, BackgroundTasks
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi import APIRouter, Request, Depends, Form, UploadFile, File, BackgroundTasks, Path as PathParam
+from fastapi.responses import HTMLResponse, RedirectResponse, Response
 from fastapi.templating import Jinja2Templates
+from sqlalchemy import case, func
 from sqlalchemy.orm import Session, joinedload
 
 from app.deps import get_db
@@ -24,9 +26,28 @@ from app.deps_auth import get_current_user_from_cookie, require_role_for_page
 from app.models import (
     Payment, User, Role, TV, TVLink, PaymentStatus,
     VenueCategory, TargetAudience, Subscription, VenuePayout, TVStats,
-    EquipmentType, VenueDocument, DocumentType, SiteSettings
+    EquipmentType, VenueDocument, DocumentType, SiteSettings, LinkChangeAction
 )
 from app.security import get_password_hash, verify_password
+from app.services.admin_kpi import admin_kpis
+from app.services.advertiser_summary import AdvertiserSummaryService
+from app.services.content_cache import (
+    RenderedShowcase, invalidate_tv_content, invalidate_all_tv_content,
+    make_rendered_showcase, showcase_cache
+)
+from app.services.content_version import bump_content_version, content_fields_changed, record_link_changes
+from app.services.event_log import event_log
+from app.services.http_cache import etag_matches
+from app.services.response_encoding import select_encoding
+from app.services.link_redirects import resolve_link_target
+from app.services.pagination import keyset_paginate, paginate
+from app.services.stats_buffer import stats_buffer
+from app.services.stats_guard import client_fingerprint, stats_guard
+from app.services.stats_query import GRANULARITIES, StatsQueryService, auto_granularity
+from app.services.stats_rollup import StatsRollupService, add_months
+from app.services.tv_resolver import MAX_TV_ID, tv_resolver
+from app.services.venue_ledger import VenueLedgerService
+from app.services.venue_summary import TVSummary, VenueSummaryService
 from app.settings import settings
 
 router = APIRouter(tags=["Pages"])
@@ -382,11 +403,17 @@ async def offer_page(request: Request, db: Session = Depends(get_db)):
 # Advertiser pages
 # ─────────────────────────────────────────────────────────────
 
+# Rows of the campaigns table on the dashboard; the full list is /advertiser/campaigns
+DASHBOARD_CAMPAIGNS_LIMIT = 10
+
+
 @router.get("/advertiser", response_class=HTMLResponse)
 async def advertiser_dashboard(request: Request, user: User = Depends(require_role_for_page(Role.ADVERTISER)), db: Session = Depends(get_db)):
     """Advertiser dashboard."""
+    summary = AdvertiserSummaryService(db)
     payments = db.query(Payment).filter(Payment.user_id == user.id).order_by(Payment.created_at.desc()).limit(5).all()
-    campaigns = db.query(TVLink).options(joinedload(TVLink.tv)).filter(TVLink.advertiser_id == user.id).all()
+    campaign_totals = summary.campaign_totals(user.id)
+    campaigns = summary.campaigns_page(user.id, per_page=DASHBOARD_CAMPAIGNS_LIMIT, total=campaign_totals["campaigns_count"])
     subscriptions = db.query(Subscription).options(joinedload(Subscription.tv)).filter(Subscription.advertiser_id == user.id).order_by(Subscription.end_date.desc()).limit(5).all()
     
     # Mark active subscriptions
@@ -399,18 +426,14 @@ async def advertiser_dashboard(request: Request, user: User = Depends(require_ro
         if hasattr(p.status, 'value'):
             p.status = p.status.value
     
-    total_impressions = sum(c.impressions or 0 for c in campaigns)
-    total_clicks = sum(c.clicks or 0 for c in campaigns)
-    active_tvs = sum(1 for c in campaigns if c.is_active)
-    
-    # Calculate total paid (handle both string and enum status)
-    all_payments = db.query(Payment).filter(Payment.user_id == user.id).all()
-    total_paid = sum(float(p.amount) for p in all_payments if (p.status.value if hasattr(p.status, 'value') else p.status) == 'succeeded')
+    total_paid = summary.payment_totals(user.id)["total_paid"]
     
     stats = {
-        "total_impressions": total_impressions,
-        "total_clicks": total_clicks,
-        "active_tvs": active_tvs,
+        "total_impressions": campaign_totals["total_impressions"],
+        "total_clicks": campaign_totals["total_clicks"],
+        "active_tvs": campaign_totals["active_count"],
+        "campaigns_count": campaign_totals["campaigns_count"],
+        "subscriptions_count": summary.subscription_totals(user.id)["subscriptions_count"],
         "total_paid": f"{total_paid:.0f}",
         "balance": f"{float(user.balance or 0):.0f}"
     }
@@ -549,28 +572,25 @@ async def advertiser_upload_video(
 
 
 @router.get("/advertiser/payments", response_class=HTMLResponse)
-async def advertiser_payments_page(request: Request, warning: str = None, error: str = None, msg: str = None, success: str = None, user: User = Depends(require_role_for_page(Role.ADVERTISER)), db: Session = Depends(get_db)):
+async def advertiser_payments_page(request: Request, after: str = None, before: str = None, warning: str = None, error: str = None, msg: str = None, success: str = None, user: User = Depends(require_role_for_page(Role.ADVERTISER)), db: Session = Depends(get_db)):
     """Advertiser payments page."""
-    payments = db.query(Payment).filter(Payment.user_id == user.id).order_by(Payment.created_at.desc()).all()
+    summary = AdvertiserSummaryService(db)
+    payment_totals = summary.payment_totals(user.id)
+    payments = summary.payments_page(user.id, after, before)
     
     # Normalize status to string for template
     for p in payments:
         if hasattr(p.status, 'value'):
             p.status = p.status.value
     
-    # Calculate stats
-    success_payments = [p for p in payments if p.status == 'succeeded']
-    total_paid = sum(float(p.amount) for p in success_payments)
-    
     # Total spent on subscriptions
-    subscriptions = db.query(Subscription).filter(Subscription.advertiser_id == user.id).all()
-    total_spent = sum(float(s.price) for s in subscriptions)
+    total_spent = summary.subscription_totals(user.id)["total_spent"]
     
     stats = {
-        "total_paid": f"{total_paid:.0f}",
+        "total_paid": f"{payment_totals['total_paid']:.0f}",
         "total_spent": f"{total_spent:.0f}",
-        "payments_count": len(payments),
-        "success_count": len(success_payments)
+        "payments_count": payment_totals["payments_count"],
+        "success_count": payment_totals["success_count"]
     }
     
     warning_message = None
@@ -636,8 +656,26 @@ async def advertiser_create_payment_page(request: Request, user: User = Depends(
         return RedirectResponse(url=f"/advertiser/payments?error=yookassa&msg={error_msg[:50]}", status_code=303)
 
 
+def _stats_range(period: str = None, date_from: str = None, date_to: str = None):
+    """Resolve the stats page filters to (date_from, date_to) in UTC days; None means all time."""
+    from datetime import timedelta
+    
+    today = datetime.utcnow().date()
+    presets = {"today": 0, "week": 6, "month": 29}
+    if period in presets and not (date_from or date_to):
+        return today - timedelta(days=presets[period]), today
+    if not (date_from or date_to):
+        return None
+    try:
+        start = datetime.strptime(date_from, "%Y-%m-%d").date() if date_from else today - timedelta(days=29)
+        end = datetime.strptime(date_to, "%Y-%m-%d").date() if date_to else today
+    except ValueError:
+        return None
+    return (start, end) if start <= end else (end, start)
+
+
 @router.get("/advertiser/stats", response_class=HTMLResponse)
-async def advertiser_stats(request: Request, period: str = None, date_from: str = None, date_to: str = None, tv_id: int = None, user: User = Depends(require_role_for_page(Role.ADVERTISER)), db: Session = Depends(get_db)):
+async def advertiser_stats(request: Request, period: str = None, date_from: str = None, date_to: str = None, tv_id: int = None, granularity: str = None, user: User = Depends(require_role_for_page(Role.ADVERTISER)), db: Session = Depends(get_db)):
     """Advertiser stats with filters."""
     from datetime import timedelta
     
@@ -651,9 +689,23 @@ async def advertiser_stats(request: Request, period: str = None, date_from: str
         campaigns = [c for c in campaigns if c.tv_id == tv_id]
         selected_tv_id = tv_id
     
+    # Per-link stats: TVStats for the selected range, lifetime counters for "all time"
+    query = StatsQueryService(db)
+    stats_range = _stats_range(period, date_from, date_to)
+    if stats_range:
+        range_from, range_to = stats_range
+        link_stats = query.by_link(range_from, range_to, advertiser_id=user.id, tv_id=selected_tv_id)
+    else:
+        range_to = datetime.utcnow().date()
+        range_from = query.first_date(advertiser_id=user.id, tv_id=selected_tv_id) or range_to - timedelta(days=29)
+        link_stats = {
+            c.id: {"impressions": c.impressions or 0, "clicks": c.clicks or 0}
+            for c in campaigns
+        }
+    
     # Calculate stats
-    total_impressions = sum(c.impressions or 0 for c in campaigns)
-    total_clicks = sum(c.clicks or 0 for c in campaigns)
+    total_impressions = sum(link_stats.get(c.id, {}).get("impressions", 0) for c in campaigns)
+    total_clicks = sum(link_stats.get(c.id, {}).get("clicks", 0) for c in campaigns)
     active_count = sum(1 for c in campaigns if c.is_active)
     conversion = f"{(total_clicks / total_impressions * 100):.2f}" if total_impressions > 0 else "0"
     
@@ -664,17 +716,41 @@ async def advertiser_stats(request: Request, period: str = None, date_from: str
         "conversion": conversion
     }
     
-    # Daily stats placeholder (will be populated from API later)
-    daily_stats = []
+    # Dense time series for the chart
+    if granularity not in GRANULARITIES:
+        granularity = auto_granularity(range_from, range_to)
+    daily_stats = query.series(range_from, range_to, granularity, advertiser_id=user.id, tv_id=selected_tv_id)
+    if not any(d["impressions"] or d["clicks"] for d in daily_stats):
+        daily_stats = []
+    
+    date_from_val = range_from.strftime("%Y-%m-%d")
+    date_to_val = range_to.strftime("%Y-%m-%d")
+    
+    # Performance by hour of day (from hourly stats, within their retention)
+    rollup = StatsRollupService(db)
+    hourly_from = range_from
+    hourly_cutoff = rollup.hourly_cutoff(datetime.utcnow().date())
+    if not stats_range and hourly_cutoff is not None:
+        hourly_from = max(range_from, hourly_cutoff)
+    hourly_stats = rollup.hourly_profile(
+        hourly_from, range_to,
+        advertiser_id=user.id,
+        tv_id=selected_tv_id,
+    )
+    if not any(h["impressions"] or h["clicks"] for h in hourly_stats):
+        hourly_stats = []
     
-    today = date.today()
-    date_from_val = date_from or (today - timedelta(days=30)).strftime("%Y-%m-%d")
-    date_to_val = date_to or today.strftime("%Y-%m-%d")
+    # Export the same selection as CSV
+    export_params = {"tv_id": selected_tv_id, "granularity": granularity}
+    if stats_range:
+        export_params.update(date_from=date_from_val, date_to=date_to_val)
+    export_url = "/advertiser/export/csv?" + urlencode({k: v for k, v in export_params.items() if v})
     
     return templates.TemplateResponse("advertiser_stats.html", {
         "request": request, "user": user, "campaigns": campaigns, "all_campaigns": all_campaigns,
-        "stats": stats, "daily_stats": daily_stats, "period": period,
-        "date_from": date_from_val, "date_to": date_to_val, "selected_tv_id": selected_tv_id
+        "stats": stats, "link_stats": link_stats, "daily_stats": daily_stats, "hourly_stats": hourly_stats,
+        "period": period, "granularity": granularity, "export_url": export_url,
+        "hourly_from": hourly_from.strftime("%Y-%m-%d"), "date_from": date_from_val, "date_to": date_to_val, "selected_tv_id": selected_tv_id
     })
 
 
@@ -757,10 +833,11 @@ async def advertiser_subscriptions_create(request: Request, background_tasks: Ba
         start_date=start_dt,
         end_date=end_dt,
         price=Decimal(str(price)),
-        venue_payout=Decimal(str(price * (tv.revenue_share or 30) / 100)),
+        venue_payout=Decimal(str(price)) * Decimal(str(tv.revenue_share or 30)) / 100,
         is_active=True
     )
     db.add(subscription)
+    VenueLedgerService(db).credit_subscription(subscription, tv)
     
     # Create TV link
     link = TVLink(
@@ -777,8 +854,10 @@ async def advertiser_subscriptions_create(request: Request, background_tasks: Ba
     # Deduct from balance
     user.balance = Decimal(str(current_balance - price))
     
+    record_link_changes(db, LinkChangeAction.CREATED, link)
     db.commit()
     db.refresh(subscription)
+    invalidate_tv_content(tv_id)
     
     # Отправляем уведомление о создании подписки (в фоне)
     try:
@@ -800,23 +879,43 @@ async def advertiser_subscriptions_create(request: Request, background_tasks: Ba
 
 
 @router.get("/advertiser/export/csv")
-async def advertiser_export_csv(request: Request, date_from: str = None, date_to: str = None, user: User = Depends(require_role_for_page(Role.ADVERTISER)), db: Session = Depends(get_db)):
+async def advertiser_export_csv(request: Request, period: str = None, date_from: str = None, date_to: str = None, tv_id: int = None, granularity: str = None, user: User = Depends(require_role_for_page(Role.ADVERTISER)), db: Session = Depends(get_db)):
     """Export advertiser stats to CSV."""
     from fastapi.responses import Response
     import csv
     import io
     
-    campaigns = db.query(TVLink).options(joinedload(TVLink.tv)).filter(TVLink.advertiser_id == user.id).all()
+    query = db.query(TVLink).options(joinedload(TVLink.tv)).filter(TVLink.advertiser_id == user.id)
+    if tv_id:
+        query = query.filter(TVLink.tv_id == tv_id)
+    campaigns = query.all()
+    
+    # Range figures from TVStats, lifetime counters without a range
+    stats_query = StatsQueryService(db)
+    stats_range = _stats_range(period, date_from, date_to)
+    if stats_range:
+        link_stats = stats_query.by_link(*stats_range, advertiser_id=user.id, tv_id=tv_id)
+    else:
+        link_stats = {c.id: {"impressions": c.impressions or 0, "clicks": c.clicks or 0} for c in campaigns}
     
     output = io.StringIO()
     writer = csv.writer(output, delimiter=';')
     
+    if stats_range:
+        writer.writerow(['Период', f"{stats_range[0].strftime('%d.%m.%Y')} — {stats_range[1].strftime('%d.%m.%Y')}"])
+    
     # Header
     writer.writerow(['ТВ-экран', 'Место размещения', 'Город', 'Адрес', 'Название рекламы', 'URL', 'Показы', 'Переходы (CPC)', 'Конверсия %', 'Статус'])
     
     # Data
+    total_imp = 0
+    total_clicks = 0
     for c in campaigns:
-        conv = f"{(c.clicks or 0) / (c.impressions or 1) * 100:.2f}" if c.impressions else "0"
+        impressions = link_stats.get(c.id, {}).get("impressions", 0)
+        clicks = link_stats.get(c.id, {}).get("clicks", 0)
+        total_imp += impressions
+        total_clicks += clicks
+        conv = f"{clicks / impressions * 100:.2f}" if impressions else "0"
         writer.writerow([
             c.tv.name,
             c.tv.venue_name or '',
@@ -824,18 +923,25 @@ async def advertiser_export_csv(request: Request, date_from: str = None, date_to
             c.tv.address or '',
             c.title,
             c.url,
-            c.impressions or 0,
-            c.clicks or 0,
+            impressions,
+            clicks,
             conv,
             'Активна' if c.is_active else 'Неактивна'
         ])
     
     # Totals
-    total_imp = sum(c.impressions or 0 for c in campaigns)
-    total_clicks = sum(c.clicks or 0 for c in campaigns)
     total_conv = f"{total_clicks / total_imp * 100:.2f}" if total_imp else "0"
     writer.writerow(['ИТОГО', '', '', '', '', '', total_imp, total_clicks, total_conv, ''])
     
+    # Time series for the range
+    if stats_range:
+        if granularity not in GRANULARITIES:
+            granularity = auto_granularity(*stats_range)
+        writer.writerow([])
+        writer.writerow(['Период', 'Показы', 'Переходы (CPC)', 'Конверсия %'])
+        for row in stats_query.series(*stats_range, granularity, advertiser_id=user.id, tv_id=tv_id):
+            writer.writerow([row["period"].strftime("%d.%m.%Y"), row["impressions"], row["clicks"], f"{row['ctr']:.2f}"])
+    
     content = output.getvalue()
     
     return Response(
@@ -846,19 +952,11 @@ async def advertiser_export_csv(request: Request, date_from: str = None, date_to
 
 
 @router.get("/advertiser/campaigns", response_class=HTMLResponse)
-async def advertiser_campaigns(request: Request, user: User = Depends(require_role_for_page(Role.ADVERTISER)), db: Session = Depends(get_db)):
+async def advertiser_campaigns(request: Request, page: int = 1, user: User = Depends(require_role_for_page(Role.ADVERTISER)), db: Session = Depends(get_db)):
     """Advertiser campaigns list."""
-    campaigns = db.query(TVLink).options(joinedload(TVLink.tv)).filter(TVLink.advertiser_id == user.id).all()
-    
-    total_impressions = sum(c.impressions or 0 for c in campaigns)
-    total_clicks = sum(c.clicks or 0 for c in campaigns)
-    active_count = sum(1 for c in campaigns if c.is_active)
-    
-    stats = {
-        "total_impressions": total_impressions,
-        "total_clicks": total_clicks,
-        "active_count": active_count
-    }
+    summary = AdvertiserSummaryService(db)
+    stats = summary.campaign_totals(user.id)
+    campaigns = summary.campaigns_page(user.id, page, total=stats["campaigns_count"])
     
     return templates.TemplateResponse("advertiser_campaigns.html", {
         "request": request, "user": user, "campaigns": campaigns, "stats": stats
@@ -930,33 +1028,7 @@ async def advertiser_profile_password(request: Request, user: User = Depends(req
 async def venue_dashboard(request: Request, user: User = Depends(require_role_for_page(Role.VENUE)), db: Session = Depends(get_db)):
     """Venue dashboard with earnings overview."""
     tvs = db.query(TV).filter(TV.venue_id == user.id).all()
-    
-    # Calculate earnings
-    total_earnings = Decimal('0')
-    total_paid = Decimal('0')
-    total_impressions = 0
-    total_clicks = 0
-    active_advertisers = set()
-    
-    for tv in tvs:
-        # Get subscriptions for this TV
-        subscriptions = db.query(Subscription).filter(Subscription.tv_id == tv.id).all()
-        for sub in subscriptions:
-            total_earnings += sub.venue_payout or Decimal('0')
-            active_advertisers.add(sub.advertiser_id)
-        
-        # Get impressions from links
-        links = db.query(TVLink).filter(TVLink.tv_id == tv.id).all()
-        for link in links:
-            total_impressions += link.impressions or 0
-            total_clicks += link.clicks or 0
-    
-    # Get paid payouts
-    payouts = db.query(VenuePayout).filter(VenuePayout.venue_id == user.id, VenuePayout.status == "paid").all()
-    total_paid = sum(Decimal(str(p.amount)) for p in payouts)
-    
-    # Pending payouts
-    pending = total_earnings - total_paid
+    totals = VenueSummaryService(db).totals(user.id)
     
     # Recent payouts
     recent_payouts = db.query(VenuePayout).filter(VenuePayout.venue_id == user.id).order_by(VenuePayout.created_at.desc()).limit(5).all()
@@ -964,12 +1036,12 @@ async def venue_dashboard(request: Request, user: User = Depends(require_role_fo
     stats = {
         "total_tvs": len(tvs),
         "active_tvs": sum(1 for tv in tvs if tv.is_active and tv.is_approved),
-        "total_impressions": total_impressions,
-        "total_clicks": total_clicks,
-        "total_earnings": f"{float(total_earnings):.0f}",
-        "total_paid": f"{float(total_paid):.0f}",
-        "pending": f"{float(pending):.0f}",
-        "advertisers_count": len(active_advertisers)
+        "total_impressions": totals["total_impressions"],
+        "total_clicks": totals["total_clicks"],
+        "total_earnings": f"{float(totals['total_earnings']):.0f}",
+        "total_paid": f"{float(totals['total_paid']):.0f}",
+        "pending": f"{float(totals['pending']):.0f}",
+        "advertisers_count": totals["advertisers_count"]
     }
     
     return templates.TemplateResponse("venue_dashboard.html", {
@@ -983,14 +1055,12 @@ async def venue_tvs_list(request: Request, success: str = None, error: str = Non
     tvs = db.query(TV).filter(TV.venue_id == user.id).order_by(TV.created_at.desc()).all()
     
     # Enrich TVs with stats
+    tv_stats = VenueSummaryService(db).tv_stats(user.id)
     for tv in tvs:
-        tv.links_count = db.query(TVLink).filter(TVLink.tv_id == tv.id).count()
-        tv.active_subscriptions = db.query(Subscription).filter(
-            Subscription.tv_id == tv.id,
-            Subscription.end_date >= date.today()
-        ).count()
-        impressions = db.query(TVLink).filter(TVLink.tv_id == tv.id).all()
-        tv.total_impressions = sum(l.impressions or 0 for l in impressions)
+        summary = tv_stats.get(tv.id, TVSummary())
+        tv.links_count = summary.links_count
+        tv.active_subscriptions = summary.active_subscriptions
+        tv.total_impressions = summary.impressions
     
     success_message = None
     if success == "created":
@@ -1075,6 +1145,7 @@ async def venue_tv_add(request: Request, user: User = Depends(require_role_for_p
     )
     db.add(tv)
     db.commit()
+    invalidate_all_tv_content()
     
     return RedirectResponse(url="/venue/tvs?success=created", status_code=303)
 
@@ -1132,7 +1203,10 @@ async def venue_tv_update(request: Request, tv_id: int, user: User = Depends(req
     tv.avg_check = float(form.get("avg_check", 0) or 0)
     tv.working_hours = form.get("working_hours") or None
     
+    if content_fields_changed(tv):
+        bump_content_version(db, tv.id)
     db.commit()
+    invalidate_tv_content(tv.id)
     return RedirectResponse(url=f"/venue/tv/{tv_id}?success=updated", status_code=303)
 
 
@@ -1214,55 +1288,44 @@ async def venue_advertisers(request: Request, tv_id: int = None, user: User = De
 
 
 @router.get("/venue/earnings", response_class=HTMLResponse)
-async def venue_earnings(request: Request, period: str = None, user: User = Depends(require_role_for_page(Role.VENUE)), db: Session = Depends(get_db)):
+async def venue_earnings(request: Request, period: str = None, page: int = 1, user: User = Depends(require_role_for_page(Role.VENUE)), db: Session = Depends(get_db)):
     """Venue earnings and payouts page."""
-    from datetime import timedelta
-    
+    ledger = VenueLedgerService(db)
     tvs = db.query(TV).filter(TV.venue_id == user.id).all()
-    tv_ids = [tv.id for tv in tvs]
+    balance = ledger.balance(user.id)
     
-    # Get all subscriptions for earnings calculation
+    # Last 20 subscriptions
     subscriptions = db.query(Subscription).options(
         joinedload(Subscription.tv),
         joinedload(Subscription.advertiser)
-    ).filter(Subscription.tv_id.in_(tv_ids)).order_by(Subscription.created_at.desc()).all() if tv_ids else []
-    
-    # Get payouts
-    payouts = db.query(VenuePayout).filter(VenuePayout.venue_id == user.id).order_by(VenuePayout.created_at.desc()).all()
+    ).join(TV, TV.id == Subscription.tv_id).filter(
+        TV.venue_id == user.id
+    ).order_by(Subscription.created_at.desc()).limit(20).all()
     
-    # Calculate totals
-    total_earned = sum(float(s.venue_payout or 0) for s in subscriptions)
-    total_paid = sum(float(p.amount) for p in payouts if p.status == "paid")
-    pending = total_earned - total_paid
-    
-    # Pending payouts
-    pending_payouts = [p for p in payouts if p.status in ["pending", "processing"]]
-    completed_payouts = [p for p in payouts if p.status == "paid"]
-    
-    # Monthly breakdown
-    monthly_data = {}
-    for sub in subscriptions:
-        month_key = sub.start_date.strftime("%Y-%m") if sub.start_date else "unknown"
-        if month_key not in monthly_data:
-            monthly_data[month_key] = {"earnings": 0, "count": 0}
-        monthly_data[month_key]["earnings"] += float(sub.venue_payout or 0)
-        monthly_data[month_key]["count"] += 1
+    # Pending and last completed payouts
+    pending_payouts = db.query(VenuePayout).filter(
+        VenuePayout.venue_id == user.id, VenuePayout.status.in_(["pending", "processing"])
+    ).order_by(VenuePayout.created_at.desc()).all()
+    completed_payouts = db.query(VenuePayout).filter(
+        VenuePayout.venue_id == user.id, VenuePayout.status == "paid"
+    ).order_by(VenuePayout.created_at.desc()).limit(10).all()
     
-    # Sort by month
-    monthly_breakdown = sorted(monthly_data.items(), key=lambda x: x[0], reverse=True)
+    # Monthly breakdown for the last 6 months (by subscription start)
+    monthly_breakdown = ledger.monthly_credits(user.id, add_months(date.today(), -5))
     
     stats = {
-        "total_earned": f"{total_earned:.0f}",
-        "total_paid": f"{total_paid:.0f}",
-        "pending": f"{pending:.0f}",
-        "subscriptions_count": len(subscriptions)
+        "total_earned": f"{float(balance.earned):.0f}",
+        "total_paid": f"{float(balance.paid):.0f}",
+        "pending": f"{float(balance.balance):.0f}",
+        "subscriptions_count": balance.subscriptions_count
     }
     
     return templates.TemplateResponse("venue_earnings.html", {
         "request": request, "user": user, "stats": stats,
-        "subscriptions": subscriptions[:20],  # Last 20
+        "subscriptions": subscriptions,
         "pending_payouts": pending_payouts,
-        "completed_payouts": completed_payouts[:10],
+        "completed_payouts": completed_payouts,
+        "ledger": ledger.entries_page(user.id, page),
         "monthly_breakdown": monthly_breakdown,
         "tvs": tvs
     })
@@ -1392,15 +1455,11 @@ async def admin_dashboard(request: Request, user: User = Depends(require_role_fo
     """Admin dashboard."""
     payments = db.query(Payment).order_by(Payment.created_at.desc()).limit(5).all()
     
-    total_users = db.query(User).count()
-    advertisers = db.query(User).filter(User.role == Role.ADVERTISER).count()
-    venues = db.query(User).filter(User.role == Role.VENUE).count()
-    total_tvs = db.query(TV).count()
-    total_revenue = sum(float(p.amount) for p in db.query(Payment).filter(Payment.status == "succeeded").all())
+    kpis = admin_kpis.get(db)
     
     stats = {
-        "total_users": total_users, "total_tvs": total_tvs,
-        "total_revenue": f"{total_revenue:.0f}", "advertisers": advertisers, "venues": venues
+        "total_users": kpis.total_users, "total_tvs": kpis.total_tvs,
+        "total_revenue": f"{kpis.total_revenue:.0f}", "advertisers": kpis.advertisers, "venues": kpis.venues
     }
     
     return templates.TemplateResponse("admin_dashboard.html", {"request": request, "user": user, "stats": stats, "payments": payments})
@@ -1411,14 +1470,19 @@ async def admin_dashboard(request: Request, user: User = Depends(require_role_fo
 # ─────────────────────────────────────────────────────────────
 
 @router.get("/admin/users", response_class=HTMLResponse)
-async def admin_users_list(request: Request, role: str = None, user: User = Depends(require_role_for_page(Role.ADMIN)), db: Session = Depends(get_db)):
+async def admin_users_list(request: Request, role: str = None, after: str = None, before: str = None, user: User = Depends(require_role_for_page(Role.ADMIN)), db: Session = Depends(get_db)):
     """Admin users list."""
     query = db.query(User)
     if role:
         query = query.filter(User.role == role)
-    users = query.order_by(User.created_at.desc()).all()
+    users = keyset_paginate(query, User.created_at, User.id, after, before)
+    
+    # Totals come from the KPI snapshot; other roles are counted directly
+    kpis = admin_kpis.get(db)
+    totals = {None: kpis.total_users, "": kpis.total_users, Role.ADVERTISER: kpis.advertisers, Role.VENUE: kpis.venues}
+    total = totals[role] if role in totals else query.count()
     
-    return templates.TemplateResponse("admin_users.html", {"request": request, "user": user, "users": users, "role_filter": role})
+    return templates.TemplateResponse("admin_users.html", {"request": request, "user": user, "users": users, "total": total, "role_filter": role})
 
 
 @router.get("/admin/user/{user_id}", response_class=HTMLResponse)
@@ -1532,11 +1596,15 @@ async def admin_user_delete(request: Request, user_id: int, user: User = Depends
         return RedirectResponse(url=f"/admin/user/{user_id}?error=cannot_delete_admin", status_code=303)
     
     # Удаляем все связанные данные
-    # Подписки
+    # Подписки (начисления площадкам по ним сторнируются)
+    ledger = VenueLedgerService(db)
+    ledger.reverse_advertiser_credits(user_id)
     db.query(Subscription).filter(Subscription.advertiser_id == user_id).delete()
     
-    # Рекламные ссылки
+    # Рекламные ссылки (ТВ, с которых они пропадут, получают новую версию контента)
+    removed_links = db.query(TVLink.id, TVLink.tv_id).filter(TVLink.advertiser_id == user_id).all()
     db.query(TVLink).filter(TVLink.advertiser_id == user_id).delete()
+    record_link_changes(db, LinkChangeAction.DELETED, *removed_links)
     
     # Платежи
     db.query(Payment).filter(Payment.user_id == user_id).delete()
@@ -1551,12 +1619,14 @@ async def admin_user_delete(request: Request, user_id: int, user: User = Depends
             db.query(VenuePayout).filter(VenuePayout.tv_id == tv.id).delete()
             db.delete(tv)
         
-        # Выплаты площадке
+        # Журнал, баланс и выплаты площадке
+        ledger.delete_venue(user_id)
         db.query(VenuePayout).filter(VenuePayout.venue_id == user_id).delete()
     
     # Удаляем пользователя
     db.delete(target_user)
     db.commit()
+    invalidate_all_tv_content()
     
     return RedirectResponse(url="/admin/users?deleted=1", status_code=303)
 
@@ -1612,14 +1682,24 @@ async def admin_advertiser_add(request: Request, user: User = Depends(require_ro
 # ─────────────────────────────────────────────────────────────
 
 @router.get("/admin/tvs", response_class=HTMLResponse)
-async def admin_tvs_list(request: Request, user: User = Depends(require_role_for_page(Role.ADMIN)), db: Session = Depends(get_db)):
+async def admin_tvs_list(request: Request, after: str = None, before: str = None, user: User = Depends(require_role_for_page(Role.ADMIN)), db: Session = Depends(get_db)):
     """Admin TV list."""
-    tvs = db.query(TV).order_by(TV.id.desc()).all()
+    tvs = keyset_paginate(db.query(TV), TV.created_at, TV.id, after, before)
+    
+    # Link counts for this page only, in one grouped query
+    links_counts = dict(db.query(TVLink.tv_id, func.count(TVLink.id)).filter(
+        TVLink.tv_id.in_([tv.id for tv in tvs])
+    ).group_by(TVLink.tv_id).all()) if tvs else {}
     for tv in tvs:
-        tv.links_count = len(tv.links) if tv.links else 0
+        tv.links_count = links_counts.get(tv.id, 0)
+    
+    total, active = db.query(
+        func.count(TV.id), func.coalesce(func.sum(case((TV.is_active.is_(True), 1), else_=0)), 0)
+    ).one()
+    tv_stats = {"total": total, "active": int(active), "inactive": total - int(active)}
     
     return templates.TemplateResponse("admin_tvs.html", {
-        "request": request, "user": user, "tvs": tvs,
+        "request": request, "user": user, "tvs": tvs, "tv_stats": tv_stats,
         "categories": VenueCategory.CHOICES, "audiences": TargetAudience.CHOICES
     })
 
@@ -1733,6 +1813,7 @@ async def admin_tvs_add(
     )
     db.add(tv)
     db.commit()
+    invalidate_all_tv_content()
     
     return RedirectResponse(url=f"/admin/tv/{tv.code}", status_code=303)
 
@@ -1740,12 +1821,7 @@ async def admin_tvs_add(
 @router.get("/admin/tv/{tv_code}", response_class=HTMLResponse)
 async def admin_tv_detail(request: Request, tv_code: str, user: User = Depends(require_role_for_page(Role.ADMIN)), db: Session = Depends(get_db)):
     """Admin TV detail page."""
-    tv = db.query(TV).filter(TV.code == tv_code).first()
-    if not tv:
-        try:
-            tv = db.query(TV).filter(TV.id == int(tv_code)).first()
-        except ValueError:
-            pass
+    tv = tv_resolver.resolve(db, tv_code, use_negative_cache=False)
     
     if not tv:
         return RedirectResponse(url="/admin/tvs", status_code=303)
@@ -1859,7 +1935,10 @@ async def admin_tv_update(
     if photo_url is not None:
         tv.photo_url = photo_url
     
+    if content_fields_changed(tv):
+        bump_content_version(db, tv.id)
     db.commit()
+    invalidate_tv_content(tv.id)
     
     # #region agent log
     try:
@@ -1887,7 +1966,10 @@ async def admin_tv_update_location(request: Request, tv_code: str, user: User =
     tv.contact_person = form.get("contact_person") or None
     tv.contact_phone = form.get("contact_phone") or None
     tv.contact_email = form.get("contact_email") or None
+    if content_fields_changed(tv):
+        bump_content_version(db, tv.id)
     db.commit()
+    invalidate_tv_content(tv.id)
     
     return RedirectResponse(url=f"/admin/tv/{tv.code}", status_code=303)
 
@@ -1912,8 +1994,12 @@ async def admin_tv_delete(request: Request, tv_code: str, user: User = Depends(r
     """Delete TV."""
     tv = db.query(TV).filter(TV.code == tv_code).first()
     if tv:
+        tv_id = tv.id
+        # Подписки удаляются вместе с ТВ, начисления площадке по ним сторнируются
+        VenueLedgerService(db).reverse_tv_credits(tv_id)
         db.delete(tv)
         db.commit()
+        invalidate_tv_content(tv_id)
     return RedirectResponse(url="/admin/tvs", status_code=303)
 
 
@@ -1940,7 +2026,9 @@ async def admin_tv_add_link(request: Request, tv_code: str, user: User = Depends
             title=title, url=url, description=description, position=max_pos
         )
         db.add(link)
+        record_link_changes(db, LinkChangeAction.CREATED, link)
         db.commit()
+        invalidate_tv_content(tv.id)
     
     return RedirectResponse(url=f"/admin/tv/{tv.code}", status_code=303)
 
@@ -1950,8 +2038,11 @@ async def admin_tv_delete_link(request: Request, tv_code: str, link_id: int, use
     """Delete advertiser link from TV."""
     link = db.query(TVLink).filter(TVLink.id == link_id).first()
     if link:
+        tv_id = link.tv_id
         db.delete(link)
+        record_link_changes(db, LinkChangeAction.DELETED, link)
         db.commit()
+        invalidate_tv_content(tv_id)
     return RedirectResponse(url=f"/admin/tv/{tv_code}", status_code=303)
 
 
@@ -2003,7 +2094,9 @@ async def admin_tv_advertisers_add(request: Request, tv_code: str, user: User =
             is_active=True
         )
         db.add(link)
+        record_link_changes(db, LinkChangeAction.CREATED, link)
         db.commit()
+        invalidate_tv_content(tv.id)
     
     return RedirectResponse(url=f"/admin/tv/{tv_code}/advertisers", status_code=303)
 
@@ -2049,7 +2142,10 @@ async def admin_tv_advertiser_edit(request: Request, tv_code: str, link_id: int,
     link.impressions = int(form.get("impressions", link.impressions or 0))
     link.clicks = int(form.get("clicks", link.clicks or 0))
     
+    if content_fields_changed(link):
+        record_link_changes(db, LinkChangeAction.UPDATED, link)
     db.commit()
+    invalidate_tv_content(link.tv_id)
     return RedirectResponse(url=f"/admin/tv/{tv_code}/advertisers", status_code=303)
 
 
@@ -2059,7 +2155,9 @@ async def admin_tv_advertiser_toggle(request: Request, tv_code: str, link_id: in
     link = db.query(TVLink).filter(TVLink.id == link_id).first()
     if link:
         link.is_active = not link.is_active
+        record_link_changes(db, LinkChangeAction.UPDATED, link)
         db.commit()
+        invalidate_tv_content(link.tv_id)
     return RedirectResponse(url=f"/admin/tv/{tv_code}/advertisers", status_code=303)
 
 
@@ -2068,8 +2166,11 @@ async def admin_tv_advertiser_delete(request: Request, tv_code: str, link_id: in
     """Delete TV advertiser."""
     link = db.query(TVLink).filter(TVLink.id == link_id).first()
     if link:
+        tv_id = link.tv_id
         db.delete(link)
+        record_link_changes(db, LinkChangeAction.DELETED, link)
         db.commit()
+        invalidate_tv_content(tv_id)
     return RedirectResponse(url=f"/admin/tv/{tv_code}/advertisers", status_code=303)
 
 
@@ -2078,27 +2179,20 @@ async def admin_tv_advertiser_delete(request: Request, tv_code: str, link_id: in
 # ─────────────────────────────────────────────────────────────
 
 @router.get("/admin/payments", response_class=HTMLResponse)
-async def admin_payments_list(request: Request, status: str = None, user: User = Depends(require_role_for_page(Role.ADMIN)), db: Session = Depends(get_db)):
+async def admin_payments_list(request: Request, status: str = None, after: str = None, before: str = None, user: User = Depends(require_role_for_page(Role.ADMIN)), db: Session = Depends(get_db)):
     """Admin payments list."""
     query = db.query(Payment)
     if status:
         query = query.filter(Payment.status == status)
-    payments = query.order_by(Payment.created_at.desc()).all()
+    payments = keyset_paginate(query, Payment.created_at, Payment.id, after, before)
     
     # Stats
-    all_payments = db.query(Payment).all()
-    total_revenue = sum(float(p.amount) for p in all_payments if p.status == "succeeded")
-    
-    # This month
-    now = datetime.utcnow()
-    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    month_revenue = sum(float(p.amount) for p in all_payments if p.status == "succeeded" and p.paid_at and p.paid_at >= month_start)
-    pending_count = sum(1 for p in all_payments if p.status in ["pending", "waiting"])
+    kpis = admin_kpis.get(db)
     
     stats = {
-        "total_revenue": f"{total_revenue:.0f}",
-        "month_revenue": f"{month_revenue:.0f}",
-        "pending_count": pending_count
+        "total_revenue": f"{kpis.total_revenue:.0f}",
+        "month_revenue": f"{kpis.month_revenue:.0f}",
+        "pending_count": kpis.pending_count
     }
     
     return templates.TemplateResponse("admin_payments.html", {
@@ -2121,6 +2215,7 @@ async def admin_payment_confirm(request: Request, payment_id: int, user: User =
             target_user.balance = Decimal(str(float(target_user.balance or 0) + float(payment.amount)))
         
         db.commit()
+        admin_kpis.invalidate()
     
     return RedirectResponse(url="/admin/payments", status_code=303)
 
@@ -2132,6 +2227,7 @@ async def admin_payment_cancel(request: Request, payment_id: int, user: User = D
     if payment and payment.status in ["pending", "waiting"]:
         payment.status = PaymentStatus.CANCELED
         db.commit()
+        admin_kpis.invalidate()
     
     return RedirectResponse(url="/admin/payments", status_code=303)
 
@@ -2141,34 +2237,22 @@ async def admin_payment_cancel(request: Request, payment_id: int, user: User = D
 # ─────────────────────────────────────────────────────────────
 
 @router.get("/admin/payouts", response_class=HTMLResponse)
-async def admin_payouts_list(request: Request, user: User = Depends(require_role_for_page(Role.ADMIN)), db: Session = Depends(get_db)):
+async def admin_payouts_list(request: Request, page: int = 1, payouts_page: int = 1, user: User = Depends(require_role_for_page(Role.ADMIN)), db: Session = Depends(get_db)):
     """Admin payouts list."""
-    payouts = db.query(VenuePayout).order_by(VenuePayout.created_at.desc()).all()
-    venues = db.query(User).filter(User.role == Role.VENUE).all()
+    summary = VenueSummaryService(db)
+    payouts = paginate(db.query(VenuePayout).order_by(VenuePayout.created_at.desc(), VenuePayout.id.desc()), payouts_page)
+    venue_stats = summary.balances_page(page)
+    
+    # Venues for the "create payout" form
+    venues = db.query(User.id, User.company_name, User.email).filter(User.role == Role.VENUE).order_by(User.id).all()
     
     # Calculate stats
-    total_payouts = sum(float(p.amount) for p in payouts if p.status == "paid")
-    pending_payouts = sum(float(p.amount) for p in payouts if p.status in ["pending", "processing"])
-    
-    # Venue stats
-    venue_stats = []
-    for venue in venues:
-        tv_count = db.query(TV).filter(TV.venue_id == venue.id).count()
-        total_earned = sum(float(s.venue_payout or 0) for s in db.query(Subscription).join(TV).filter(TV.venue_id == venue.id).all())
-        total_paid = sum(float(p.amount) for p in db.query(VenuePayout).filter(VenuePayout.venue_id == venue.id, VenuePayout.status == "paid").all())
-        
-        venue_stats.append({
-            "venue": venue,
-            "tv_count": tv_count,
-            "total_earned": total_earned,
-            "total_paid": total_paid,
-            "pending": total_earned - total_paid
-        })
+    totals = summary.payout_totals()
     
     stats = {
-        "total_payouts": f"{total_payouts:.0f}",
-        "pending_payouts": f"{pending_payouts:.0f}",
-        "venues_count": len(venues)
+        "total_payouts": f"{totals['total_payouts']:.0f}",
+        "pending_payouts": f"{totals['pending_payouts']:.0f}",
+        "venues_count": venue_stats.total
     }
     
     return templates.TemplateResponse("admin_payouts.html", {
@@ -2209,10 +2293,14 @@ async def admin_payout_process(request: Request, payout_id: int, user: User = De
 @router.get("/admin/payout/{payout_id}/complete", response_class=HTMLResponse)
 async def admin_payout_complete(request: Request, payout_id: int, user: User = Depends(require_role_for_page(Role.ADMIN)), db: Session = Depends(get_db)):
     """Mark payout as paid."""
-    payout = db.query(VenuePayout).filter(VenuePayout.id == payout_id).first()
-    if payout:
-        payout.status = "paid"
-        payout.paid_at = datetime.utcnow()
+    # Conditional update: a payout is debited from the venue ledger exactly once
+    paid_at = datetime.utcnow()
+    updated = db.query(VenuePayout).filter(
+        VenuePayout.id == payout_id, VenuePayout.status != "paid"
+    ).update({"status": "paid", "paid_at": paid_at}, synchronize_session=False)
+    if updated:
+        payout = db.query(VenuePayout).filter(VenuePayout.id == payout_id).first()
+        VenueLedgerService(db).debit_payout(payout)
         db.commit()
     return RedirectResponse(url="/admin/payouts", status_code=303)
 
@@ -2221,42 +2309,20 @@ async def admin_payout_complete(request: Request, payout_id: int, user: User = D
 # Public TV showcase
 # ─────────────────────────────────────────────────────────────
 
-@router.get("/tv/{tv_code}", response_class=HTMLResponse)
-async def public_tv_showcase(request: Request, tv_code: str, db: Session = Depends(get_db)):
-    """
-    Public TV showcase page (what users see after scanning QR).
-    Совмещение digital и оффлайн - показывает рекламодателей на данном ТВ.
-    Поддерживает доступ по коду (tv_code) или по ID.
-    """
-    tv = db.query(TV).filter(TV.code == tv_code).first()
-    if not tv:
-        try:
-            tv = db.query(TV).filter(TV.id == int(tv_code)).first()
-        except ValueError:
-            pass
-    
-    if not tv:
-        return HTMLResponse(content="<h1>ТВ не найден</h1>", status_code=404)
-    
-    if not tv.is_active:
-        return HTMLResponse(content="<h1>ТВ неактивен</h1>", status_code=403)
-    
-    links = db.query(TVLink).filter(TVLink.tv_id == tv.id, TVLink.is_active == True).order_by(TVLink.position).all()
-    
+def _render_tv_showcase(tv: TV, links: list) -> str:
+    """Render the public showcase HTML for a TV and its active links."""
     # Формируем ссылки с отслеживанием кликов
     links_html = ""
     if links:
         for link in links:
-            # URL для отслеживания кликов через API
-            track_url = f"/api/public/stats"
-            # Прямая ссылка с отслеживанием через JavaScript
+            # Клик засчитывается сервером при переходе через /r/{link_id}
             links_html += f'''
-            <a href="{link.url}" 
+            <a href="/r/{link.id}" 
                class="link-card" 
                target="_blank"
+               rel="noopener"
                data-link-id="{link.id}"
-               data-tv-id="{tv.id}"
-               onclick="trackClick(event, {link.id}, {tv.id})">
+               data-tv-id="{tv.id}">
                 <div class="link-title">{link.title}</div>
                 <div class="link-desc">{link.description or ""}</div>
             </a>
@@ -2305,29 +2371,6 @@ async def public_tv_showcase(request: Request, tv_code: str, db: Session = Depen
             .footer {{ text-align: center; margin-top: 2rem; font-size: 0.75rem; color: #8d99ae; }}
         </style>
         <script>
-            // Отслеживание кликов для статистики (омниканальность)
-            async function trackClick(event, linkId, tvId) {{
-                try {{
-                    // Отправляем статистику о клике
-                    await fetch('/api/public/stats', {{
-                        method: 'POST',
-                        headers: {{
-                            'Content-Type': 'application/json',
-                        }},
-                        body: JSON.stringify({{
-                            tv_id: tvId,
-                            link_id: linkId,
-                            event_type: 'click',
-                            timestamp: new Date().toISOString(),
-                            user_agent: navigator.userAgent
-                        }})
-                    }});
-                }} catch (error) {{
-                    console.error('Ошибка отслеживания:', error);
-                }}
-                // Продолжаем переход по ссылке
-            }}
-            
             // Отслеживание просмотра страницы
             window.addEventListener('load', function() {{
                 fetch('/api/public/stats', {{
@@ -2358,7 +2401,73 @@ async def public_tv_showcase(request: Request, tv_code: str, db: Session = Depen
     </html>
     """
     
-    return HTMLResponse(content=html)
+    return html
+
+
+def _showcase_response(request: Request, page: RenderedShowcase) -> Response:
+    """Serve a rendered showcase: 304 on matching ETag, precompressed when the client accepts it."""
+    headers = {
+        "ETag": page.etag,
+        "Cache-Control": f"public, max-age={settings.SHOWCASE_MAX_AGE_SECONDS}",
+        "Vary": "Accept-Encoding",
+    }
+    if etag_matches(request.headers.get("if-none-match"), page.etag):
+        return Response(status_code=304, headers=headers)
+    content, encoding = select_encoding(page.body, request.headers.get("accept-encoding"))
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return HTMLResponse(content=content, headers=headers)
+
+
+@router.get("/tv/{tv_code}", response_class=HTMLResponse)
+async def public_tv_showcase(request: Request, tv_code: str, db: Session = Depends(get_db)):
+    """
+    Public TV showcase page (what users see after scanning QR).
+    Совмещение digital и оффлайн - показывает рекламодателей на данном ТВ.
+    Поддерживает доступ по коду (tv_code) или по ID.
+    
+    The rendered page is cached per TV (raw and gzip) until the TV or its
+    links change, so a burst of scans costs no queries and no rendering.
+    """
+    page = showcase_cache.get(tv_code)
+    if page:
+        return _showcase_response(request, page)
+    
+    tv = tv_resolver.resolve(db, tv_code)
+    
+    if not tv:
+        return HTMLResponse(content="<h1>ТВ не найден</h1>", status_code=404)
+    
+    if not tv.is_active:
+        return HTMLResponse(content="<h1>ТВ неактивен</h1>", status_code=403)
+    
+    links = db.query(TVLink).filter(TVLink.tv_id == tv.id, TVLink.is_active == True).order_by(TVLink.position).all()
+    
+    page = make_rendered_showcase(_render_tv_showcase(tv, links))
+    showcase_cache.put(tv.id, page, tv.code, tv_code)
+    return _showcase_response(request, page)
+
+
+@router.get("/r/{link_id}")
+async def public_link_redirect(request: Request, link_id: int = PathParam(..., ge=1, le=MAX_TV_ID)):
+    """
+    Click-tracking redirect for advertiser links (showcase page and QR codes).
+    
+    The destination comes from the in-memory link cache and the click goes to
+    the stats buffer (or the raw event log), so a repeated hit does no
+    database work at all. Click loops from one device are not counted.
+    """
+    target = resolve_link_target(link_id)
+    if not target:
+        return HTMLResponse(content="<h1>Ссылка не найдена</h1>", status_code=404)
+    
+    fingerprint = client_fingerprint(request)
+    if not stats_guard.check(str(target.tv_id), target.link_id, fingerprint, "click"):
+        if settings.STATS_EVENT_LOG:
+            event_log.append(target.tv_id, target.link_id, datetime.utcnow(), "click", fingerprint)
+        else:
+            stats_buffer.add(target.tv_id, target.link_id, datetime.utcnow(), "click")
+    return RedirectResponse(url=target.url, status_code=302)
 
 
 # ─────────────────────────────────────────────────────────────
@@ -2512,14 +2621,16 @@ async def admin_settings_oauth(request: Request, user: User = Depends(require_ro
 
 
 @router.get("/admin/users/offers", response_class=HTMLResponse)
-async def admin_users_offers(request: Request, user: User = Depends(require_role_for_page(Role.ADMIN)), db: Session = Depends(get_db)):
+async def admin_users_offers(request: Request, after: str = None, before: str = None, user: User = Depends(require_role_for_page(Role.ADMIN)), db: Session = Depends(get_db)):
     """View users who accepted offer."""
-    users = db.query(User).filter(User.offer_accepted_at != None).order_by(User.offer_accepted_at.desc()).all()
+    accepted = db.query(User).filter(User.offer_accepted_at != None)
+    users = keyset_paginate(accepted, User.offer_accepted_at, User.id, after, before)
     
     # Stats
-    total_accepted = len(users)
-    advertisers = sum(1 for u in users if u.role == Role.ADVERTISER)
-    venues = sum(1 for u in users if u.role == Role.VENUE)
+    by_role = dict(db.query(User.role, func.count(User.id)).filter(User.offer_accepted_at != None).group_by(User.role).all())
+    total_accepted = sum(by_role.values())
+    advertisers = by_role.get(Role.ADVERTISER, 0)
+    venues = by_role.get(Role.VENUE, 0)
     
     return templates.TemplateResponse("admin_users_offers.html", {
         "request": request, "user": user, "users": users,
@@ -3,17 +3,33 @@ Public API для омниканальности - интеграция digital
 Доступ к контенту ТВ через QR-коды, API для мобильных приложений и веб-сайтов.
 """
 
-from datetime import datetime
+import asyncio
+import hashlib
+import json
+from datetime import datetime, timedelta
 from fastapi import APIRouter, Depends, HTTPException, Request, Query
-from fastapi.responses import JSONResponse, RedirectResponse
+from sqlalchemy import or_
+from fastapi.responses import RedirectResponse, Response, StreamingResponse
 from sqlalchemy.orm import Session
 from pydantic import BaseModel, Field
 from typing import Optional, List
 
+from app.db import SessionLocal
 from app.deps import get_db
-from app.models import TV, TVLink, TVStats
+from app.models import TV, TVLink, TVLinkChange, LinkChangeAction
+from app.services.content_cache import CachedTVContent, content_cache, content_etag
+from app.services.content_events import content_event_hub
+from app.services.event_log import encode_event, event_log, utc_naive
+from app.services.http_cache import etag_matches
+from app.services.hyperloglog import HyperLogLog
+from app.services.response_encoding import EncodedBody, FastJSONResponse, encoded_bodies, select_encoding
+from app.services.stats_buffer import stats_buffer
+from app.services.stats_guard import client_fingerprint, stats_guard
+from app.services.stats_service import SketchKey, StatsKey, StatsService, VALID_EVENTS, new_sketch, stats_key
+from app.services.tv_resolver import MAX_TV_ID, tv_resolver
+from app.settings import settings
 
-router = APIRouter(prefix="/api/public", tags=["Public API"])
+router = APIRouter(prefix="/api/public", tags=["Public API"], default_response_class=FastJSONResponse)
 
 
 # ─────────────────────────────────────────────────────────────
@@ -29,6 +45,7 @@ class TVLinkResponse(BaseModel):
     image_url: Optional[str] = None
     position: int
     advertiser_name: Optional[str] = None
+    tracking_url: str = Field(description="Ссылка для QR-кода: редирект с учётом клика")
 
     class Config:
         from_attributes = True
@@ -50,6 +67,35 @@ class TVContentResponse(BaseModel):
         from_attributes = True
 
 
+class TVContentDeltaResponse(BaseModel):
+    """Изменения контента ТВ с версии клиента."""
+    tv_id: int
+    tv_code: str
+    tv_name: str
+    venue_name: Optional[str] = None
+    address: Optional[str] = None
+    city: Optional[str] = None
+    since: int
+    content_version: int
+    full: bool = Field(description="Полный снимок: список ссылок нужно заменить на added")
+    added: List[TVLinkResponse] = []
+    updated: List[TVLinkResponse] = []
+    removed: List[int] = []
+    updated_at: datetime
+
+
+class ScreensManifestRequest(BaseModel):
+    """Запрос манифеста нескольких ТВ (коды или ID)."""
+    codes: List[str] = Field(..., min_length=1, max_length=settings.SCREENS_MANIFEST_MAX_TVS)
+
+
+class ScreensManifestResponse(BaseModel):
+    """Контент нескольких ТВ одним ответом."""
+    screens: List[TVContentResponse] = []
+    versions: dict[str, int] = Field(description="tv_code -> content_version")
+    missing: List[str] = Field(default=[], description="Не найденные или неактивные ТВ")
+
+
 class QRRedirectResponse(BaseModel):
     """Ответ для QR-кода - редирект или данные."""
     redirect_url: Optional[str] = None
@@ -59,13 +105,397 @@ class QRRedirectResponse(BaseModel):
 
 class StatsRequest(BaseModel):
     """Запрос на отправку статистики от ТВ-плеера."""
-    tv_id: int
+    tv_id: int = Field(..., ge=0, le=MAX_TV_ID)
     tv_code: Optional[str] = None
-    link_id: Optional[int] = None
+    link_id: Optional[int] = Field(None, ge=1, le=MAX_TV_ID)
     event_type: str = Field(..., description="impression, click, view")
     timestamp: Optional[datetime] = None
     device_info: Optional[str] = None
     user_agent: Optional[str] = None
+    device_id: Optional[str] = Field(None, max_length=128, description="Стабильный ID устройства для подсчёта уникальных зрителей")
+
+
+class StatsBatchRequest(BaseModel):
+    """Пакет событий статистики от ТВ-плеера (в т.ч. по нескольким ТВ)."""
+    events: List[StatsRequest] = Field(..., min_length=1, max_length=settings.STATS_BATCH_MAX_EVENTS)
+
+
+class StatsUploadEvent(StatsRequest):
+    """Событие из офлайн-буфера плеера: с исходным временем и ключом идемпотентности."""
+    event_id: str = Field(..., min_length=1, max_length=64, description="Уникальный ID события на этом ТВ")
+    timestamp: datetime = Field(..., description="Время события по часам плеера")
+
+
+class StatsUploadRequest(BaseModel):
+    """Выгрузка накопленных офлайн событий (повторная отправка безопасна)."""
+    events: List[StatsUploadEvent] = Field(..., min_length=1, max_length=settings.STATS_UPLOAD_MAX_EVENTS)
+
+
+class StatsBatchResult(BaseModel):
+    """Результат обработки одного события пакета."""
+    index: int
+    status: str = Field(description="accepted, duplicate, dropped или rejected")
+    error: Optional[str] = None
+
+
+class StatsBatchResponse(BaseModel):
+    """Ответ на пакет событий статистики."""
+    status: str
+    accepted: int
+    rejected: int
+    duplicates: int = 0
+    dropped: int = 0
+    results: List[StatsBatchResult]
+
+
+# ─────────────────────────────────────────────────────────────
+# Helpers
+# ─────────────────────────────────────────────────────────────
+
+def _build_tv_content(db: Session, tv: TV, links: Optional[List[TVLink]] = None) -> TVContentResponse:
+    """
+    Собрать контент ТВ: данные экрана и активные ссылки рекламодателей.
+    
+    links - уже загруженные активные ссылки ТВ (по position), если есть.
+    """
+    if links is None:
+        links = db.query(TVLink).filter(
+            TVLink.tv_id == tv.id,
+            TVLink.is_active == True
+        ).order_by(TVLink.position).all()
+    
+    return TVContentResponse(
+        tv_id=tv.id,
+        tv_code=tv.code,
+        tv_name=tv.name,
+        venue_name=tv.venue_name,
+        address=tv.address,
+        city=tv.city,
+        links=[TVLinkResponse(
+            id=link.id,
+            title=link.title,
+            url=link.url,
+            description=link.description,
+            image_url=link.image_url,
+            position=link.position,
+            advertiser_name=link.advertiser_name,
+            tracking_url=f"/r/{link.id}"
+        ) for link in links],
+        content_version=tv.content_version or 0,
+        updated_at=tv.updated_at or datetime.utcnow()
+    )
+
+
+def _get_tv_content_entry(db: Session, tv: TV, identifier: Optional[str] = None) -> CachedTVContent:
+    """
+    Сериализованный контент активного ТВ из кеша или из БД (с кешированием).
+    
+    identifier - строка, по которой ТВ был найден; сохраняется как ключ кеша.
+    """
+    entry = content_cache.get_by_id(tv.id)
+    if entry is None:
+        payload = _build_tv_content(db, tv).model_dump(mode="json")
+        entry = content_cache.set(payload, *([identifier] if identifier else []))
+    elif identifier:
+        content_cache.add_alias(identifier, tv.id)
+    return entry
+
+
+def _load_tv_content_entry(tv_id: int) -> Optional[CachedTVContent]:
+    """Контент активного ТВ по ID в отдельной сессии (для долгоживущих соединений)."""
+    entry = content_cache.get_by_id(tv_id)
+    if entry is not None:
+        return entry
+    db = SessionLocal()
+    try:
+        tv = db.query(TV).filter(TV.id == tv_id).first()
+        if not tv or not tv.is_active:
+            return None
+        return _get_tv_content_entry(db, tv)
+    finally:
+        db.close()
+
+
+def _sse_message(event: str, data: dict) -> str:
+    """Сообщение в формате Server-Sent Events."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+# Заголовки условных ответов: версию проверять всегда, тело зависит от Accept-Encoding
+_CONDITIONAL_HEADERS = {"Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+
+
+def _not_modified(request: Request, tv: TV) -> Optional[Response]:
+    """Пустой 304, если клиент уже имеет текущую версию контента ТВ (без загрузки ссылок)."""
+    etag = content_etag(tv.id, tv.content_version or 0)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=_CONDITIONAL_HEADERS | {"ETag": etag})
+    return None
+
+
+def _conditional_json(request: Request, body: EncodedBody, etag: str) -> Response:
+    """
+    JSON-ответ с ETag или пустой 304, если клиент уже имеет эту версию.
+    
+    body - заранее сериализованное и сжатое тело; вариант выбирается
+    по Accept-Encoding без повторного сжатия.
+    """
+    headers = _CONDITIONAL_HEADERS | {"ETag": etag}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    content, encoding = select_encoding(body, request.headers.get("accept-encoding"))
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=content, media_type="application/json", headers=headers)
+
+
+def _content_delta(db: Session, payload: dict, since: int) -> dict:
+    """
+    Тело TVContentDeltaResponse: изменения ссылок между since и версией payload.
+    
+    Текущее состояние ссылок берётся из сериализованного контента, из журнала
+    TVLinkChange - только ID изменённых ссылок. Если клиент отстал больше,
+    чем хранит журнал (или прислал неизвестную версию), отдаётся полный снимок.
+    """
+    version = payload["content_version"]
+    delta = {
+        key: payload[key]
+        for key in ("tv_id", "tv_code", "tv_name", "venue_name", "address", "city", "updated_at")
+    }
+    delta.update(since=since, content_version=version, full=False, added=[], updated=[], removed=[])
+    
+    if since == version:
+        return delta
+    
+    if since <= 0 or since > version or since < version - settings.CONTENT_DELTA_MAX_VERSIONS:
+        delta.update(full=True, added=payload["links"])
+        return delta
+    
+    changes = db.query(TVLinkChange.link_id, TVLinkChange.action).filter(
+        TVLinkChange.tv_id == payload["tv_id"],
+        TVLinkChange.version > since,
+        TVLinkChange.version <= version,
+    ).all()
+    changed_ids = {change.link_id for change in changes}
+    created_ids = {change.link_id for change in changes if change.action == LinkChangeAction.CREATED}
+    
+    current_ids = set()
+    for link in payload["links"]:
+        current_ids.add(link["id"])
+        if link["id"] in changed_ids:
+            # Ссылка, повторно включённая после since, приходит в updated - применять как upsert
+            delta["added" if link["id"] in created_ids else "updated"].append(link)
+    
+    # Ссылки, созданные и удалённые после since, клиент не видел
+    delta["removed"] = sorted(changed_ids - current_ids - created_ids)
+    return delta
+
+
+def _screens_manifest(db: Session, request: Request, identifiers: List[str]) -> Response:
+    """
+    Манифест нескольких ТВ: закешированный контент и два запроса на остальные.
+    
+    ТВ ищутся одним запросом по кодам и ID, активные ссылки всех найденных
+    ТВ - вторым. ETag манифеста составлен из ETag всех экранов.
+    """
+    identifiers = list(dict.fromkeys(i.strip() for i in identifiers if i.strip()))
+    if not identifiers:
+        raise HTTPException(status_code=400, detail="Не указаны коды ТВ")
+    if len(identifiers) > settings.SCREENS_MANIFEST_MAX_TVS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Не более {settings.SCREENS_MANIFEST_MAX_TVS} ТВ за запрос"
+        )
+    
+    entries: dict[str, CachedTVContent] = {}
+    for identifier in identifiers:
+        cached = content_cache.get(identifier)
+        if cached:
+            entries[identifier] = cached
+    
+    misses = [i for i in identifiers if i not in entries]
+    tvs = {
+        identifier: tv
+        for identifier, tv in tv_resolver.resolve_many(db, misses).items()
+        if tv.is_active
+    }
+    if tvs:
+        links_by_tv: dict[int, List[TVLink]] = {tv.id: [] for tv in tvs.values()}
+        links = db.query(TVLink).filter(
+            TVLink.tv_id.in_(links_by_tv),
+            TVLink.is_active == True
+        ).order_by(TVLink.tv_id, TVLink.position).all()
+        for link in links:
+            links_by_tv[link.tv_id].append(link)
+        for identifier, tv in tvs.items():
+            payload = _build_tv_content(db, tv, links_by_tv[tv.id]).model_dump(mode="json")
+            entries[identifier] = content_cache.set(payload, identifier)
+    
+    screens = {}
+    for identifier in identifiers:
+        entry = entries.get(identifier)
+        if entry:
+            screens.setdefault(entry.payload["tv_id"], entry)
+    
+    content = {
+        "screens": [entry.payload for entry in screens.values()],
+        "versions": {entry.payload["tv_code"]: entry.payload["content_version"] for entry in screens.values()},
+        "missing": [i for i in identifiers if i not in entries],
+    }
+    digest = hashlib.sha1(",".join(entry.etag for entry in screens.values()).encode()).hexdigest()[:16]
+    etag = f'"m-{digest}"'
+    body = encoded_bodies.get_or_encode(f"screens:{','.join(identifiers)}:{etag}", content)
+    return _conditional_json(request, body, etag)
+
+
+def _qr_body(entry: CachedTVContent, qr_code: str) -> EncodedBody:
+    """Готовое тело QRRedirectResponse на основе закешированного контента ТВ."""
+    content = {
+        "redirect_url": f"/tv/{entry.payload['tv_code']}",
+        "tv_data": entry.payload,
+        "qr_code": qr_code,
+    }
+    return encoded_bodies.get_or_encode(f"qr:{qr_code}:{entry.etag}", content)
+
+
+def _event_time(timestamp: Optional[datetime], now: datetime) -> Optional[datetime]:
+    """
+    Время события по часам плеера (UTC), если оно в окне опоздания.
+
+    None - время не передано, старше STATS_LATE_EVENT_WINDOW_HOURS или
+    опережает сервер больше чем на STATS_CLOCK_SKEW_SECONDS.
+    """
+    if timestamp is None:
+        return None
+    moment = utc_naive(timestamp)
+    if moment < now - timedelta(hours=settings.STATS_LATE_EVENT_WINDOW_HOURS):
+        return None
+    if moment > now + timedelta(seconds=settings.STATS_CLOCK_SKEW_SECONDS):
+        return None
+    return moment
+
+
+def _ingest_stats_events(db: Session, request: Request, events: list, upload: bool = False) -> StatsBatchResponse:
+    """
+    Проверить и записать пакет событий статистики.
+
+    Все ТВ и ссылки проверяются двумя IN-запросами, события раскладываются
+    по своему дню и часу и записываются одной операцией (журнал, буфер
+    или транзакция). Пакет (upload=False) до обращения к БД проходит
+    stats_guard: повтор с тем же timestamp и превышение лимита устройства
+    отбрасываются (dropped). upload=True - события офлайн-буфера: время события
+    обязательно должно быть в окне опоздания, а повторы по (ТВ, event_id)
+    отсекаются общей для всех воркеров таблицей StatsUploadedEvent: ID
+    записываются в той же транзакции, что и счётчики (или фиксируются
+    только после передачи событий в буфер / журнал).
+    """
+    # ТВ по ID и по коду - одним запросом
+    tv_ids = {e.tv_id for e in events if e.tv_id}
+    tv_codes = {e.tv_code for e in events if not e.tv_id and e.tv_code}
+    tvs_by_id = {}
+    tvs_by_code = {}
+    if tv_ids or tv_codes:
+        for row in db.query(TV.id, TV.code).filter(or_(TV.id.in_(tv_ids), TV.code.in_(tv_codes))).all():
+            tvs_by_id[row.id] = row
+            tvs_by_code[row.code] = row
+    
+    service = StatsService(db)
+    links = service.get_links(e.link_id for e in events)
+    
+    now = datetime.utcnow()
+    counts: dict[StatsKey, int] = {}
+    sketches: dict[SketchKey, HyperLogLog] = {}
+    records: list[bytes] = []
+    event_keys: set[tuple[int, str]] = set()
+    duplicates = 0
+    results: list[Optional[StatsBatchResult]] = [None] * len(events)
+    dropped = 0
+    valid = []
+    for index, event in enumerate(events):
+        # Пакет проходит тот же фильтр повторов и лимит устройства, что и одиночные события
+        if not upload:
+            reason = stats_guard.check(
+                str(event.tv_id or event.tv_code), event.link_id, _device_fingerprint(request, event),
+                event.event_type, event_time=event.timestamp, dedup=event.timestamp is not None,
+            )
+            if reason:
+                dropped += 1
+                results[index] = StatsBatchResult(index=index, status="dropped", error=reason)
+                continue
+        
+        error = None
+        tv = tvs_by_id.get(event.tv_id) if event.tv_id else tvs_by_code.get(event.tv_code)
+        occurred_at = _event_time(event.timestamp, now)
+        if event.event_type not in VALID_EVENTS:
+            error = f"Неверный тип события. Допустимые: {', '.join(VALID_EVENTS)}"
+        elif not tv:
+            error = "ТВ не найден"
+        elif event.link_id is not None and (
+            not links.get(event.link_id) or links[event.link_id].tv_id != tv.id
+        ):
+            error = "Ссылка не найдена на этом ТВ"
+        elif upload and occurred_at is None:
+            error = "Время события вне окна приёма"
+        
+        if error:
+            results[index] = StatsBatchResult(index=index, status="rejected", error=error)
+            continue
+        
+        if upload:
+            event_key = (tv.id, event.event_id)
+            if event_key in event_keys:
+                duplicates += 1
+                results[index] = StatsBatchResult(index=index, status="duplicate")
+                continue
+            event_keys.add(event_key)
+        valid.append((index, event, tv, occurred_at))
+    
+    # ID выгрузки, уже принятые любым воркером, не учитываются повторно
+    claimed = service.claim_uploaded_events(event_keys, now) if upload else set()
+    
+    for index, event, tv, occurred_at in valid:
+        if upload and (tv.id, event.event_id) not in claimed:
+            duplicates += 1
+            results[index] = StatsBatchResult(index=index, status="duplicate")
+            continue
+        
+        occurred_at = occurred_at or now
+        key = stats_key(tv.id, event.link_id, occurred_at, event.event_type)
+        counts[key] = counts.get(key, 0) + 1
+        fingerprint = _device_fingerprint(request, event)
+        if settings.STATS_EVENT_LOG:
+            records.append(encode_event(tv.id, event.link_id, occurred_at, event.event_type, fingerprint))
+        elif event.event_type == "view":
+            sketch_key = SketchKey(tv.id, event.link_id, key.stat_date)
+            if sketch_key not in sketches:
+                sketches[sketch_key] = new_sketch()
+            sketches[sketch_key].add(fingerprint)
+        results[index] = StatsBatchResult(index=index, status="accepted")
+    
+    if counts:
+        if settings.STATS_EVENT_LOG:
+            event_log.append_many(records)
+        elif settings.STATS_WRITE_BEHIND:
+            stats_buffer.add_counts(counts, sketches)
+        else:
+            service.apply_increments(counts, links, sketches)
+        # ID выгрузки фиксируются только после записи событий: повтор после ошибки не теряется
+        db.commit()
+    
+    accepted = sum(counts.values())
+    return StatsBatchResponse(
+        status="ok",
+        accepted=accepted,
+        rejected=len(events) - accepted - duplicates - dropped,
+        duplicates=duplicates,
+        dropped=dropped,
+        results=results,
+    )
+
+
+def _device_fingerprint(request: Request, event: StatsRequest) -> str:
+    """Отпечаток устройства события (уникальные зрители, лимиты приёма)."""
+    return client_fingerprint(request, event.device_id, event.user_agent, event.device_info)
 
 
 # ─────────────────────────────────────────────────────────────
@@ -75,6 +505,7 @@ class StatsRequest(BaseModel):
 @router.get("/screen/{identifier}", response_model=TVContentResponse)
 async def get_tv_content(
     identifier: str,
+    request: Request,
     format: str = Query("json", description="Формат ответа: json или html"),
     db: Session = Depends(get_db),
 ):
@@ -89,16 +520,17 @@ async def get_tv_content(
     - Для ТВ-плееров: JSON формат для отображения контента
     - Для веб-сайтов: можно использовать HTML формат для редиректа
     - Версионирование контента для кеширования на клиенте
+    - ETag / If-None-Match: при неизменном контенте возвращается 304 без тела
     """
-    # Попытка найти по коду
-    tv = db.query(TV).filter(TV.code == identifier).first()
+    # Быстрый путь: контент уже в кеше
+    cached = content_cache.get(identifier)
+    if cached:
+        if format.lower() == "html":
+            return RedirectResponse(url=f"/tv/{cached.payload['tv_code']}", status_code=302)
+        return _conditional_json(request, cached.body, cached.etag)
     
-    # Если не найден по коду, пробуем по ID
-    if not tv:
-        try:
-            tv = db.query(TV).filter(TV.id == int(identifier)).first()
-        except (ValueError, TypeError):
-            pass
+    # Поиск по коду или ID одним запросом
+    tv = tv_resolver.resolve(db, identifier)
     
     if not tv:
         raise HTTPException(status_code=404, detail="ТВ не найден")
@@ -106,46 +538,147 @@ async def get_tv_content(
     if not tv.is_active:
         raise HTTPException(status_code=403, detail="ТВ неактивен")
     
-    # Получаем активные ссылки рекламодателей
-    links = db.query(TVLink).filter(
-        TVLink.tv_id == tv.id,
-        TVLink.is_active == True
-    ).order_by(TVLink.position).all()
-    
-    # Версия контента (можно использовать updated_at или счетчик)
-    content_version = int(tv.updated_at.timestamp()) if tv.updated_at else 0
-    
-    # Формируем ответ
-    response_data = TVContentResponse(
-        tv_id=tv.id,
-        tv_code=tv.code,
-        tv_name=tv.name,
-        venue_name=tv.venue_name,
-        address=tv.address,
-        city=tv.city,
-        links=[TVLinkResponse(
-            id=link.id,
-            title=link.title,
-            url=link.url,
-            description=link.description,
-            image_url=link.image_url,
-            position=link.position,
-            advertiser_name=link.advertiser_name
-        ) for link in links],
-        content_version=content_version,
-        updated_at=tv.updated_at or datetime.utcnow()
-    )
-    
     # Если запрошен HTML формат, редиректим на публичную страницу
     if format.lower() == "html":
         return RedirectResponse(url=f"/tv/{tv.code}", status_code=302)
     
-    return response_data
+    not_modified = _not_modified(request, tv)
+    if not_modified:
+        return not_modified
+    
+    entry = _get_tv_content_entry(db, tv, identifier)
+    return _conditional_json(request, entry.body, entry.etag)
+
+
+@router.get("/screens", response_model=ScreensManifestResponse)
+async def get_screens_manifest(
+    request: Request,
+    codes: str = Query(..., description="Коды или ID ТВ через запятую"),
+    db: Session = Depends(get_db),
+):
+    """
+    Получить контент нескольких ТВ одним запросом (площадки с несколькими
+    экранами, партнёрские приложения).
+    
+    - /api/public/screens?codes=a,b,c
+    - versions - content_version каждого ТВ для последующих /delta и /version
+    - missing - коды, по которым ТВ не найден или неактивен
+    - ETag / If-None-Match для манифеста целиком
+    """
+    return _screens_manifest(db, request, codes.split(","))
+
+
+@router.post("/screens", response_model=ScreensManifestResponse)
+async def post_screens_manifest(
+    body: ScreensManifestRequest,
+    request: Request,
+    db: Session = Depends(get_db),
+):
+    """Манифест нескольких ТВ для длинных списков кодов (аналог GET /screens)."""
+    return _screens_manifest(db, request, body.codes)
+
+
+@router.get("/screen/{identifier}/delta", response_model=TVContentDeltaResponse)
+async def get_tv_content_delta(
+    identifier: str,
+    since: int = Query(..., ge=0, description="content_version, которая уже есть у клиента"),
+    db: Session = Depends(get_db),
+):
+    """
+    Получить только изменения ссылок ТВ с версии since.
+    
+    - added / updated - ссылки целиком, removed - ID удалённых или отключённых
+    - если версия совпадает с текущей, списки пустые
+    - если клиент отстал больше, чем на CONTENT_DELTA_MAX_VERSIONS версий,
+      возвращается full=true и все активные ссылки в added
+    """
+    cached = content_cache.get(identifier)
+    if cached:
+        payload = cached.payload
+    else:
+        tv = tv_resolver.resolve(db, identifier)
+        
+        if not tv:
+            raise HTTPException(status_code=404, detail="ТВ не найден")
+        
+        if not tv.is_active:
+            raise HTTPException(status_code=403, detail="ТВ неактивен")
+        
+        payload = _get_tv_content_entry(db, tv, identifier).payload
+    
+    return FastJSONResponse(
+        content=_content_delta(db, payload, since),
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+@router.get("/screen/{identifier}/events")
+async def stream_content_version(identifier: str, request: Request):
+    """
+    SSE-поток версий контента ТВ для плееров (вместо опроса /version).
+    
+    Сразу после подключения отправляется событие `version` с текущими
+    content_version и etag, далее - при каждом изменении ТВ или его ссылок.
+    Раз в SSE_HEARTBEAT_SECONDS отправляется пинг и версия перепроверяется
+    (изменения, сделанные через другой воркер). Если ТВ удалён или
+    отключён, отправляется событие `unavailable` и поток закрывается.
+    """
+    db = SessionLocal()
+    try:
+        tv = tv_resolver.resolve(db, identifier)
+        
+        if not tv:
+            raise HTTPException(status_code=404, detail="ТВ не найден")
+        
+        if not tv.is_active:
+            raise HTTPException(status_code=403, detail="ТВ неактивен")
+        
+        tv_id = tv.id
+    finally:
+        db.close()
+    
+    async def event_stream():
+        changed = content_event_hub.subscribe(tv_id)
+        last_etag = None
+        try:
+            yield f"retry: {settings.SSE_HEARTBEAT_SECONDS * 1000}\n\n"
+            while not await request.is_disconnected():
+                entry = content_cache.get_by_id(tv_id)
+                if entry is None:
+                    entry = await asyncio.to_thread(_load_tv_content_entry, tv_id)
+                if entry is None:
+                    yield _sse_message("unavailable", {"tv_id": tv_id})
+                    return
+                
+                if entry.etag != last_etag:
+                    last_etag = entry.etag
+                    yield _sse_message("version", {
+                        "tv_id": tv_id,
+                        "content_version": entry.payload["content_version"],
+                        "etag": entry.etag,
+                    })
+                else:
+                    yield ": ping\n\n"
+                
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout=settings.SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                changed.clear()
+        finally:
+            content_event_hub.unsubscribe(tv_id, changed)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.get("/qr/{qr_code}", response_model=QRRedirectResponse)
 async def get_qr_content(
     qr_code: str,
+    request: Request,
     redirect: bool = Query(True, description="Редирект на HTML страницу или вернуть JSON"),
     db: Session = Depends(get_db),
 ):
@@ -158,21 +691,22 @@ async def get_qr_content(
     - Специальный QR-код формата "tv-{code}" или "tv-{id}"
     
     Если redirect=true, перенаправляет на HTML страницу.
-    Если redirect=false, возвращает JSON с данными.
+    Если redirect=false, возвращает JSON с данными (с ETag, как /screen).
     """
     # Очистка QR-кода (может содержать префиксы)
     clean_code = qr_code.strip()
     if clean_code.startswith("tv-"):
         clean_code = clean_code[3:]
     
-    # Поиск ТВ
-    tv = db.query(TV).filter(TV.code == clean_code).first()
+    # Быстрый путь: контент уже в кеше
+    cached = content_cache.get(clean_code)
+    if cached:
+        if redirect:
+            return RedirectResponse(url=f"/tv/{cached.payload['tv_code']}", status_code=302)
+        return _conditional_json(request, _qr_body(cached, qr_code), cached.etag)
     
-    if not tv:
-        try:
-            tv = db.query(TV).filter(TV.id == int(clean_code)).first()
-        except (ValueError, TypeError):
-            pass
+    # Поиск ТВ
+    tv = tv_resolver.resolve(db, clean_code)
     
     if not tv:
         raise HTTPException(status_code=404, detail="ТВ не найден по QR-коду")
@@ -185,38 +719,12 @@ async def get_qr_content(
         return RedirectResponse(url=f"/tv/{tv.code}", status_code=302)
     
     # Иначе возвращаем JSON
-    links = db.query(TVLink).filter(
-        TVLink.tv_id == tv.id,
-        TVLink.is_active == True
-    ).order_by(TVLink.position).all()
-    
-    content_version = int(tv.updated_at.timestamp()) if tv.updated_at else 0
+    not_modified = _not_modified(request, tv)
+    if not_modified:
+        return not_modified
     
-    tv_data = TVContentResponse(
-        tv_id=tv.id,
-        tv_code=tv.code,
-        tv_name=tv.name,
-        venue_name=tv.venue_name,
-        address=tv.address,
-        city=tv.city,
-        links=[TVLinkResponse(
-            id=link.id,
-            title=link.title,
-            url=link.url,
-            description=link.description,
-            image_url=link.image_url,
-            position=link.position,
-            advertiser_name=link.advertiser_name
-        ) for link in links],
-        content_version=content_version,
-        updated_at=tv.updated_at or datetime.utcnow()
-    )
-    
-    return QRRedirectResponse(
-        redirect_url=f"/tv/{tv.code}",
-        tv_data=tv_data,
-        qr_code=qr_code
-    )
+    entry = _get_tv_content_entry(db, tv, clean_code)
+    return _conditional_json(request, _qr_body(entry, qr_code), entry.etag)
 
 
 @router.post("/stats", response_model=dict)
@@ -233,89 +741,108 @@ async def submit_tv_stats(
     - click: клик по ссылке (переход)
     - view: просмотр страницы с рекламодателями
     
-    Статистика сохраняется в TVStats для аналитики.
+    Статистика сохраняется в TVStats для аналитики. В режиме
+    STATS_WRITE_BEHIND событие только принимается в буфер, а запись
+    в БД выполняется пакетно фоновой задачей. Повторы одного события
+    устройства и превышение лимита отбрасываются (status: dropped).
     """
     # Валидация типа события
-    valid_events = ["impression", "click", "view"]
-    if stats.event_type not in valid_events:
+    if stats.event_type not in VALID_EVENTS:
         raise HTTPException(
             status_code=400,
-            detail=f"Неверный тип события. Допустимые: {', '.join(valid_events)}"
+            detail=f"Неверный тип события. Допустимые: {', '.join(VALID_EVENTS)}"
         )
     
+    # Дубли и превышение лимита устройства отбрасываются до обращения к БД
+    fingerprint = _device_fingerprint(request, stats)
+    dropped = stats_guard.check(str(stats.tv_id or stats.tv_code), stats.link_id, fingerprint, stats.event_type)
+    if dropped:
+        return {
+            "status": "dropped",
+            "message": "Событие отброшено",
+            "reason": dropped,
+            "event_type": stats.event_type,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+    
     # Поиск ТВ
     tv = None
     if stats.tv_id:
-        tv = db.query(TV).filter(TV.id == stats.tv_id).first()
+        tv = db.query(TV.id).filter(TV.id == stats.tv_id).first()
     elif stats.tv_code:
-        tv = db.query(TV).filter(TV.code == stats.tv_code).first()
+        tv = db.query(TV.id).filter(TV.code == stats.tv_code).first()
     
     if not tv:
         raise HTTPException(status_code=404, detail="ТВ не найден")
     
-    # Получаем User-Agent из запроса, если не передан
-    user_agent = stats.user_agent or request.headers.get("user-agent", "")
-    
-    # Получаем advertiser_id из TVLink если указан link_id
-    advertiser_id = None
-    if stats.link_id:
-        link = db.query(TVLink).filter(TVLink.id == stats.link_id).first()
-        if link:
-            advertiser_id = link.advertiser_id
-    
-    # Сохраняем статистику
-    today = datetime.utcnow().date()
-    
-    # Ищем существующую запись за сегодня
-    existing_stat = db.query(TVStats).filter(
-        TVStats.tv_id == tv.id,
-        TVStats.stat_date == today,
-        TVStats.tv_link_id == stats.link_id if stats.link_id else None
-    ).first()
-    
-    if existing_stat:
-        # Обновляем существующую запись
-        if stats.event_type == "impression":
-            existing_stat.impressions += 1
-        elif stats.event_type == "click":
-            existing_stat.clicks += 1
-        elif stats.event_type == "view":
-            existing_stat.unique_views += 1
-        existing_stat.updated_at = datetime.utcnow()
+    # Время плеера учитывается, если оно в окне опоздания
+    now = datetime.utcnow()
+    occurred_at = _event_time(stats.timestamp, now) or now
+    
+    if settings.STATS_EVENT_LOG:
+        # Событие пишется в журнал на диске и сворачивается в TVStats фоновой задачей
+        event_log.append(tv.id, stats.link_id, occurred_at, stats.event_type, fingerprint)
+        message = "Статистика принята"
+    elif settings.STATS_WRITE_BEHIND:
+        # Событие принимается в буфер и записывается фоновой задачей
+        stats_buffer.add(tv.id, stats.link_id, occurred_at, stats.event_type, fingerprint=fingerprint)
+        message = "Статистика принята"
     else:
-        # Создаем новую запись
-        new_stat = TVStats(
-            tv_id=tv.id,
-            tv_link_id=stats.link_id,
-            advertiser_id=advertiser_id,
-            stat_date=today,
-            impressions=1 if stats.event_type == "impression" else 0,
-            clicks=1 if stats.event_type == "click" else 0,
-            unique_views=1 if stats.event_type == "view" else 0,
-            screen_time_seconds=0
-        )
-        db.add(new_stat)
-    
-    # Обновляем счетчики в TVLink если это клик или показ
-    if stats.link_id:
-        link = db.query(TVLink).filter(TVLink.id == stats.link_id).first()
-        if link:
-            if stats.event_type == "impression":
-                link.impressions = (link.impressions or 0) + 1
-            elif stats.event_type == "click":
-                link.clicks = (link.clicks or 0) + 1
-    
-    db.commit()
+        key = stats_key(tv.id, stats.link_id, occurred_at, stats.event_type)
+        sketches = {}
+        if stats.event_type == "view":
+            sketch = sketches[SketchKey(tv.id, stats.link_id, key.stat_date)] = new_sketch()
+            sketch.add(fingerprint)
+        StatsService(db).apply_increments({key: 1}, sketches=sketches)
+        db.commit()
+        message = "Статистика сохранена"
     
     return {
         "status": "ok",
-        "message": "Статистика сохранена",
+        "message": message,
         "tv_id": tv.id,
         "event_type": stats.event_type,
         "timestamp": datetime.utcnow().isoformat()
     }
 
 
+@router.post("/stats/batch", response_model=StatsBatchResponse)
+async def submit_tv_stats_batch(
+    batch: StatsBatchRequest,
+    request: Request,
+    db: Session = Depends(get_db),
+):
+    """
+    Отправить пакет событий статистики одним запросом.
+    
+    События могут относиться к разным ТВ и ссылкам. Все ТВ и ссылки
+    проверяются двумя IN-запросами, одинаковые события агрегируются и
+    записываются одной транзакцией (или принимаются в буфер в режиме
+    STATS_WRITE_BEHIND). Для каждого события возвращается accepted,
+    dropped (повтор события устройства с тем же временем или превышение
+    лимита) или rejected. Переданное время события учитывается, если оно
+    в окне опоздания.
+    """
+    return _ingest_stats_events(db, request, batch.events)
+
+
+@router.post("/stats/upload", response_model=StatsBatchResponse)
+async def upload_offline_stats(
+    upload: StatsUploadRequest,
+    request: Request,
+    db: Session = Depends(get_db),
+):
+    """
+    Выгрузить события, накопленные плеером без связи.
+    
+    Каждое событие учитывается в день и час своего времени (timestamp),
+    если оно не старше STATS_LATE_EVENT_WINDOW_HOURS. event_id делает
+    повторную выгрузку после обрыва безопасной: уже принятые события
+    возвращаются со статусом duplicate и не учитываются повторно.
+    """
+    return _ingest_stats_events(db, request, upload.events, upload=True)
+
+
 @router.get("/screen/{identifier}/version")
 async def get_content_version(
     identifier: str,
@@ -326,22 +853,23 @@ async def get_content_version(
     Используется для оптимизации - клиент может проверить версию
     перед загрузкой полного контента.
     """
-    tv = db.query(TV).filter(TV.code == identifier).first()
+    cached = content_cache.get(identifier)
+    if cached:
+        return {
+            "tv_id": cached.payload["tv_id"],
+            "tv_code": cached.payload["tv_code"],
+            "content_version": cached.payload["content_version"],
+            "updated_at": cached.payload["updated_at"]
+        }
     
-    if not tv:
-        try:
-            tv = db.query(TV).filter(TV.id == int(identifier)).first()
-        except (ValueError, TypeError):
-            pass
+    tv = tv_resolver.resolve(db, identifier)
     
     if not tv:
         raise HTTPException(status_code=404, detail="ТВ не найден")
     
-    content_version = int(tv.updated_at.timestamp()) if tv.updated_at else 0
-    
     return {
         "tv_id": tv.id,
         "tv_code": tv.code,
-        "content_version": content_version,
+        "content_version": tv.content_version or 0,
         "updated_at": tv.updated_at.isoformat() if tv.updated_at else None
     }
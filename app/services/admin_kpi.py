@@ -0,0 +1,108 @@
+"""
+Снимок KPI админки: пользователи, ТВ, выручка и ожидающие платежи.
+
+Показатели считаются агрегатными запросами (COUNT/SUM) и кешируются
+в памяти процесса на ADMIN_KPI_TTL_SECONDS; фоновая задача обновляет
+снимок каждые ADMIN_KPI_REFRESH_SECONDS, поэтому страницы админки
+обычно берут готовый снимок, не обращаясь к истории платежей.
+Админские действия с платежами сбрасывают снимок (invalidate).
+"""
+
+import asyncio
+import threading
+import time
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+
+from app.db import SessionLocal
+from app.models import Payment, PaymentStatus, Role, TV, User
+from app.settings import settings
+
+
+class KPISnapshot(NamedTuple):
+    total_users: int
+    advertisers: int
+    venues: int
+    total_tvs: int
+    total_revenue: float
+    month_revenue: float
+    pending_count: int
+    computed_at: datetime
+
+
+def compute_kpis(db: Session, now: Optional[datetime] = None) -> KPISnapshot:
+    """Посчитать KPI тремя агрегатными запросами."""
+    now = now or datetime.utcnow()
+    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+    users_by_role = dict(db.query(User.role, func.count(User.id)).group_by(User.role).all())
+    total_tvs = db.query(func.count(TV.id)).scalar() or 0
+
+    succeeded = Payment.status == PaymentStatus.SUCCEEDED
+    revenue = db.query(
+        func.coalesce(func.sum(case((succeeded, Payment.amount), else_=0)), 0),
+        func.coalesce(func.sum(case((succeeded & (Payment.paid_at >= month_start), Payment.amount), else_=0)), 0),
+        func.coalesce(func.sum(case((Payment.status.in_([PaymentStatus.PENDING, PaymentStatus.WAITING]), 1), else_=0)), 0),
+    ).one()
+
+    return KPISnapshot(
+        total_users=sum(users_by_role.values()),
+        advertisers=users_by_role.get(Role.ADVERTISER, 0),
+        venues=users_by_role.get(Role.VENUE, 0),
+        total_tvs=total_tvs,
+        total_revenue=float(revenue[0]),
+        month_revenue=float(revenue[1]),
+        pending_count=int(revenue[2]),
+        computed_at=now,
+    )
+
+
+class AdminKPICache:
+    """Снимок KPI с TTL и фоновым обновлением."""
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._snapshot: Optional[KPISnapshot] = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, db: Session) -> KPISnapshot:
+        """Актуальный снимок; при отсутствии или истечении TTL - пересчитать в db."""
+        with self._lock:
+            if self._snapshot is not None and time.monotonic() < self._expires_at:
+                return self._snapshot
+        return self._store(compute_kpis(db))
+
+    def _store(self, snapshot: KPISnapshot) -> KPISnapshot:
+        with self._lock:
+            self._snapshot = snapshot
+            self._expires_at = time.monotonic() + self.ttl_seconds
+        return snapshot
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._snapshot = None
+            self._expires_at = 0.0
+
+    def refresh(self) -> Optional[KPISnapshot]:
+        """Пересчитать снимок в отдельной сессии."""
+        db = SessionLocal()
+        try:
+            return self._store(compute_kpis(db))
+        except Exception as e:
+            print(f"Error refreshing admin KPIs: {e}")
+            return None
+        finally:
+            db.close()
+
+    async def run(self, interval_seconds: float) -> None:
+        """Фоновая задача: периодически обновлять снимок, не блокируя event loop."""
+        while True:
+            await asyncio.to_thread(self.refresh)
+            await asyncio.sleep(interval_seconds)
+
+
+admin_kpis = AdminKPICache(ttl_seconds=settings.ADMIN_KPI_TTL_SECONDS)
@@ -0,0 +1,76 @@
+"""
+Сводка кабинета рекламодателя: итоги по платежам, подпискам и размещениям.
+
+Итоги считаются агрегатными запросами (SUM/COUNT) в БД, а не суммированием
+загруженных строк, поэтому стоимость страниц кабинета не зависит от
+числа платежей и размещений. Списки отдаются постранично (pagination).
+"""
+
+from typing import Optional
+
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session, joinedload
+
+from app.models import Payment, PaymentStatus, Subscription, TVLink
+from app.services.pagination import KeysetPage, Page, keyset_paginate, paginate
+
+
+class AdvertiserSummaryService:
+    def __init__(self, db: Session):
+        self.db = db
+
+    # ─── Итоги ───
+
+    def campaign_totals(self, advertiser_id: int) -> dict:
+        """Показы, клики, число размещений и активных размещений - одним запросом."""
+        row = self.db.query(
+            func.coalesce(func.sum(TVLink.impressions), 0),
+            func.coalesce(func.sum(TVLink.clicks), 0),
+            func.count(TVLink.id),
+            func.coalesce(func.sum(case((TVLink.is_active.is_(True), 1), else_=0)), 0),
+        ).filter(TVLink.advertiser_id == advertiser_id).one()
+        return {
+            "total_impressions": int(row[0]),
+            "total_clicks": int(row[1]),
+            "campaigns_count": int(row[2]),
+            "active_count": int(row[3]),
+        }
+
+    def payment_totals(self, advertiser_id: int) -> dict:
+        """Сумма успешных платежей, число платежей и успешных платежей."""
+        succeeded = Payment.status == PaymentStatus.SUCCEEDED
+        row = self.db.query(
+            func.coalesce(func.sum(case((succeeded, Payment.amount), else_=0)), 0),
+            func.count(Payment.id),
+            func.coalesce(func.sum(case((succeeded, 1), else_=0)), 0),
+        ).filter(Payment.user_id == advertiser_id).one()
+        return {
+            "total_paid": float(row[0]),
+            "payments_count": int(row[1]),
+            "success_count": int(row[2]),
+        }
+
+    def subscription_totals(self, advertiser_id: int) -> dict:
+        """Число подписок и потраченная на них сумма."""
+        row = self.db.query(
+            func.count(Subscription.id),
+            func.coalesce(func.sum(Subscription.price), 0),
+        ).filter(Subscription.advertiser_id == advertiser_id).one()
+        return {
+            "subscriptions_count": int(row[0]),
+            "total_spent": float(row[1]),
+        }
+
+    # ─── Списки ───
+
+    def campaigns_page(self, advertiser_id: int, page: Optional[int] = None, per_page: Optional[int] = None, total: Optional[int] = None) -> Page:
+        """Размещения рекламодателя (новые первыми) вместе с ТВ."""
+        query = self.db.query(TVLink).options(joinedload(TVLink.tv)).filter(
+            TVLink.advertiser_id == advertiser_id
+        ).order_by(TVLink.created_at.desc(), TVLink.id.desc())
+        return paginate(query, page, per_page, total)
+
+    def payments_page(self, advertiser_id: int, after: Optional[str] = None, before: Optional[str] = None, per_page: Optional[int] = None) -> KeysetPage:
+        """Платежи рекламодателя (новые первыми), keyset-пагинация по (created_at, id)."""
+        query = self.db.query(Payment).filter(Payment.user_id == advertiser_id)
+        return keyset_paginate(query, Payment.created_at, Payment.id, after, before, per_page)
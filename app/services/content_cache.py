@@ -0,0 +1,192 @@
+"""
+In-process кеш контента ТВ-экранов для Public API.
+
+Плееры опрашивают /api/public/screen/{identifier} постоянно, а контент меняется
+редко. Кеш хранит уже сериализованный ответ (dict) по ТВ и отдаёт его без
+запросов к БД. Записи сбрасываются при любом изменении TV/TVLink через
+invalidate_tv_content(), а TTL страхует от устаревания при нескольких
+воркерах uvicorn (инвалидация видна только в процессе, где произошла запись).
+Вместе с контентом хранится готовое JSON-тело и его gzip/brotli-варианты.
+Так же кешируются отрендеренные HTML-витрины /tv/{tv_code} для QR-сканов.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, NamedTuple, Optional
+
+from app.services.content_events import content_event_hub
+from app.services.link_redirects import link_target_cache
+from app.services.response_encoding import EncodedBody, dumps_json, encode_body
+from app.services.tv_resolver import tv_resolver
+from app.settings import settings
+
+
+class CachedTVContent(NamedTuple):
+    """Закешированный контент ТВ, его ETag и готовое (сжатое) JSON-тело."""
+    payload: dict[str, Any]
+    etag: str
+    body: EncodedBody
+
+
+class RenderedShowcase(NamedTuple):
+    """Готовая HTML-витрина ТВ (со сжатыми вариантами) и её ETag."""
+    body: EncodedBody
+    etag: str
+
+
+def make_rendered_showcase(html: str) -> RenderedShowcase:
+    """Закодировать и один раз сжать витрину ТВ."""
+    body = html.encode("utf-8")
+    digest = hashlib.sha1(body).hexdigest()[:16]
+    return RenderedShowcase(body=encode_body(body), etag=f'"{digest}"')
+
+
+def content_etag(tv_id: int, content_version: int) -> str:
+    """
+    Сильный ETag контента ТВ: ID и TV.content_version.
+
+    Версия увеличивается при любом изменении ссылок и отображаемых полей,
+    поэтому ETag можно проверить по одной строке TV, не загружая ссылки.
+    """
+    return f'"{tv_id}-{content_version}"'
+
+
+def make_content_etag(payload: dict[str, Any]) -> str:
+    """ETag сериализованного контента ТВ."""
+    return content_etag(payload["tv_id"], payload["content_version"])
+
+
+class TVKeyedCache:
+    """Ограниченный LRU-кеш записей по ID ТВ с дополнительными ключами (код, ID)."""
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[int, tuple[float, Any]]" = OrderedDict()
+        self._aliases: dict[str, int] = {}          # code / str(id) -> tv_id
+        self._keys: dict[int, set[str]] = {}        # tv_id -> aliases
+        self._lock = threading.Lock()
+
+    def get(self, identifier: str) -> Optional[Any]:
+        """Вернуть запись по коду или ID ТВ, если она есть и не устарела."""
+        with self._lock:
+            tv_id = self._aliases.get(identifier)
+            if tv_id is None:
+                return None
+            return self._get(tv_id)
+
+    def get_by_id(self, tv_id: int) -> Optional[Any]:
+        """Вернуть запись по ID ТВ, если она есть и не устарела."""
+        with self._lock:
+            return self._get(tv_id)
+
+    def put(self, tv_id: int, entry: Any, *identifiers: str) -> Any:
+        """Сохранить запись ТВ под переданными ключами и вернуть её."""
+        if self.max_size <= 0:
+            return entry
+        aliases = set(identifiers)
+        with self._lock:
+            self._drop(tv_id)
+            self._entries[tv_id] = (time.monotonic() + self.ttl_seconds, entry)
+            self._keys[tv_id] = aliases
+            for alias in aliases:
+                self._aliases[alias] = tv_id
+            while len(self._entries) > self.max_size:
+                oldest_id = next(iter(self._entries))
+                self._drop(oldest_id)
+        return entry
+
+    def add_alias(self, identifier: str, tv_id: int) -> None:
+        """Добавить ключ для уже закешированного ТВ."""
+        with self._lock:
+            if tv_id in self._entries:
+                self._aliases[identifier] = tv_id
+                self._keys[tv_id].add(identifier)
+
+    def invalidate(self, tv_id: int) -> None:
+        """Сбросить запись ТВ."""
+        with self._lock:
+            self._drop(tv_id)
+
+    def clear(self) -> None:
+        """Полностью очистить кеш."""
+        with self._lock:
+            self._entries.clear()
+            self._aliases.clear()
+            self._keys.clear()
+
+    def _get(self, tv_id: int) -> Optional[Any]:
+        item = self._entries.get(tv_id)
+        if item is None:
+            return None
+        expires_at, entry = item
+        if expires_at < time.monotonic():
+            self._drop(tv_id)
+            return None
+        self._entries.move_to_end(tv_id)
+        return entry
+
+    def _drop(self, tv_id: int) -> None:
+        self._entries.pop(tv_id, None)
+        for alias in self._keys.pop(tv_id, ()):
+            if self._aliases.get(alias) == tv_id:
+                del self._aliases[alias]
+
+
+class TVContentCache(TVKeyedCache):
+    """Кеш сериализованного контента ТВ по коду и ID."""
+
+    def set(self, payload: dict[str, Any], *identifiers: str) -> CachedTVContent:
+        """
+        Сохранить контент ТВ и вернуть запись с ETag.
+
+        Ключами служат tv_code и переданные идентификаторы, по которым ТВ
+        был найден в БД (код имеет приоритет над ID, поэтому str(tv_id)
+        не добавляется автоматически).
+        """
+        entry = CachedTVContent(
+            payload=payload,
+            etag=make_content_etag(payload),
+            body=encode_body(dumps_json(payload)),
+        )
+        return self.put(payload["tv_id"], entry, payload["tv_code"], *identifiers)
+
+
+content_cache = TVContentCache(
+    max_size=settings.CONTENT_CACHE_SIZE,
+    ttl_seconds=settings.CONTENT_CACHE_TTL_SECONDS,
+)
+
+# Отрендеренные витрины /tv/{tv_code} (RenderedShowcase)
+showcase_cache = TVKeyedCache(
+    max_size=settings.CONTENT_CACHE_SIZE,
+    ttl_seconds=settings.CONTENT_CACHE_TTL_SECONDS,
+)
+
+
+def invalidate_tv_content(*tv_ids: Optional[int]) -> None:
+    """
+    Сбросить закешированный контент ТВ после изменения TV или TVLink.
+
+    Вызывается из роутов после db.commit(). Вместе с контентом сбрасываются
+    витрина ТВ и адреса его ссылок для /r/{link_id}, подписчики SSE получают
+    уведомление о новой версии.
+    """
+    for tv_id in tv_ids:
+        if tv_id is not None:
+            content_cache.invalidate(tv_id)
+            showcase_cache.invalidate(tv_id)
+            link_target_cache.invalidate_tv(tv_id)
+            tv_resolver.forget(tv_id)
+            content_event_hub.publish(tv_id)
+
+
+def invalidate_all_tv_content() -> None:
+    """Сбросить контент всех ТВ (создание ТВ, массовые удаления и т.п.)."""
+    content_cache.clear()
+    showcase_cache.clear()
+    link_target_cache.clear()
+    tv_resolver.clear()
+    content_event_hub.publish_all()
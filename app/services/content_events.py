@@ -0,0 +1,64 @@
+"""
+Хаб уведомлений об изменении контента ТВ для SSE-подписчиков (ТВ-плееров).
+
+Каждое SSE-соединение подписывается на свой ТВ и получает asyncio.Event.
+При изменении TV/TVLink событие взводится, и обработчик соединения
+отправляет плееру новую версию контента. Событие не несёт данных, поэтому
+несколько изменений подряд схлопываются в одно уведомление.
+"""
+
+import asyncio
+import threading
+
+
+class ContentEventHub:
+    """Fan-out уведомлений об изменении контента по tv_id в пределах воркера."""
+
+    def __init__(self):
+        self._subscribers: dict[int, set[tuple[asyncio.AbstractEventLoop, asyncio.Event]]] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, tv_id: int) -> asyncio.Event:
+        """Подписаться на изменения контента ТВ (вызывать из event loop)."""
+        event = asyncio.Event()
+        with self._lock:
+            self._subscribers.setdefault(tv_id, set()).add((asyncio.get_running_loop(), event))
+        return event
+
+    def unsubscribe(self, tv_id: int, event: asyncio.Event) -> None:
+        """Отписаться от изменений контента ТВ."""
+        with self._lock:
+            subscribers = self._subscribers.get(tv_id)
+            if not subscribers:
+                return
+            for item in [item for item in subscribers if item[1] is event]:
+                subscribers.discard(item)
+            if not subscribers:
+                del self._subscribers[tv_id]
+
+    def subscribers_count(self) -> int:
+        """Количество активных подписок."""
+        with self._lock:
+            return sum(len(s) for s in self._subscribers.values())
+
+    def publish(self, tv_id: int) -> None:
+        """Уведомить подписчиков ТВ (потокобезопасно)."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(tv_id, ()))
+        self._notify(subscribers)
+
+    def publish_all(self) -> None:
+        """Уведомить всех подписчиков."""
+        with self._lock:
+            subscribers = [item for items in self._subscribers.values() for item in items]
+        self._notify(subscribers)
+
+    @staticmethod
+    def _notify(subscribers) -> None:
+        for loop, event in subscribers:
+            if loop.is_closed():
+                continue
+            loop.call_soon_threadsafe(event.set)
+
+
+content_event_hub = ContentEventHub()
@@ -0,0 +1,75 @@
+"""
+Версия контента ТВ (TV.content_version) и журнал изменений ссылок для плееров.
+
+Версия - монотонный счётчик, который увеличивается в той же транзакции, что
+и изменение ссылок TVLink или отображаемых полей TV. Увеличение выполняется
+в SQL (content_version + 1), поэтому параллельные изменения не теряются.
+Каждое изменение ссылки записывается в TVLinkChange с новой версией ТВ -
+по журналу плееры получают дельту вместо полного списка ссылок. Журнал
+хранит только последние CONTENT_DELTA_MAX_VERSIONS версий каждого ТВ.
+"""
+
+from sqlalchemy import func, inspect, update
+from sqlalchemy.orm import Session
+
+from app.models import TV, TVLink, TVLinkChange
+from app.settings import settings
+
+# Поля TV и TVLink, которые попадают в контент экрана
+TV_CONTENT_FIELDS = ("code", "name", "venue_name", "address", "city", "is_active")
+LINK_CONTENT_FIELDS = (
+    "title", "url", "description", "image_url", "position", "is_active", "advertiser_name",
+)
+
+
+def content_fields_changed(obj) -> bool:
+    """Изменены ли (до commit) поля TV или TVLink, которые видит плеер."""
+    fields = LINK_CONTENT_FIELDS if isinstance(obj, TVLink) else TV_CONTENT_FIELDS
+    state = inspect(obj)
+    return any(state.attrs[field].history.has_changes() for field in fields)
+
+
+def bump_content_version(db: Session, *tv_ids: int) -> dict[int, int]:
+    """
+    Атомарно увеличить версию контента ТВ (без commit).
+
+    Возвращает новые версии {tv_id: content_version}.
+    """
+    tv_ids = {tv_id for tv_id in tv_ids if tv_id is not None}
+    if not tv_ids:
+        return {}
+    stmt = (
+        update(TV)
+        .where(TV.id.in_(tv_ids))
+        .values(content_version=func.coalesce(TV.content_version, 0) + 1)
+        .returning(TV.id, TV.content_version)
+        .execution_options(synchronize_session=False)
+    )
+    return {row.id: row.content_version for row in db.execute(stmt)}
+
+
+def record_link_changes(db: Session, action: str, *links) -> None:
+    """
+    Увеличить версию ТВ и записать изменение ссылок в журнал (без commit).
+
+    links - объекты TVLink или строки с полями id и tv_id. Новые ссылки
+    должны быть добавлены в сессию: для получения id выполняется flush.
+    """
+    if not links:
+        return
+    if any(link.id is None for link in links):
+        db.flush()
+
+    versions = bump_content_version(db, *(link.tv_id for link in links))
+    db.add_all([
+        TVLinkChange(tv_id=link.tv_id, link_id=link.id, version=versions[link.tv_id], action=action)
+        for link in links
+        if link.tv_id in versions
+    ])
+
+    # Журнал компактный: старые версии не нужны, плеер получит полный снимок
+    for tv_id, version in versions.items():
+        db.query(TVLinkChange).filter(
+            TVLinkChange.tv_id == tv_id,
+            TVLinkChange.version <= version - settings.CONTENT_DELTA_MAX_VERSIONS,
+        ).delete(synchronize_session=False)
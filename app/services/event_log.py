@@ -0,0 +1,415 @@
+"""
+Журнал сырых событий статистики ТВ-плееров (append-only, на локальном диске).
+
+Каждое событие - запись фиксированного размера (32 байта): время в
+микросекундах UTC, ID ТВ, ID ссылки, тип события и 64-битный хеш
+устройства (тот же, что попадает в HyperLogLog-скетчи). Каждый процесс
+uvicorn пишет свой сегмент "<создан>-<pid>.open"; по числу записей или
+возрасту сегмент закрывается и переименовывается в
+"<min_ts>-<max_ts>-<создан>-<pid>.seg", поэтому поиск по времени
+отбрасывает сегменты по имени, не открывая их.
+
+Фоновая задача сворачивает закрытые сегменты в TVStats через
+StatsService.apply_increments (события удалённых ТВ пропускаются).
+Имя сегмента сначала занимается в StatsEventSegment вставкой
+ON CONFLICT DO NOTHING в той же транзакции, поэтому повторная свёртка
+(другим воркером или после сбоя) невозможна. Файлы хранятся
+EVENT_LOG_RETENTION_DAYS для разбора споров с рекламодателями.
+"""
+
+import asyncio
+import os
+import struct
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Iterable, Iterator, NamedTuple, Optional
+
+from app.db import SessionLocal
+from app.models import StatsEventSegment
+from app.services.hyperloglog import hash_value
+from app.services.stats_service import SketchKey, StatsService, dialect_insert, new_sketch, stats_key
+from app.settings import settings
+
+# ts_us, tv_id, link_id (0 - без ссылки), код события, выравнивание, хеш устройства (0 - неизвестно)
+RECORD = struct.Struct("<qIIB7xQ")
+
+EVENT_CODES = {"impression": 1, "click": 2, "view": 3}
+EVENT_NAMES = {code: name for name, code in EVENT_CODES.items()}
+
+OPEN_SUFFIX = ".open"
+SEGMENT_SUFFIX = ".seg"
+
+# Записей на одно чтение при сканировании сегмента
+READ_CHUNK_RECORDS = 8192
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def utc_naive(moment: datetime) -> datetime:
+    """Время в UTC без tzinfo (naive datetime считается UTC)."""
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def to_us(moment: datetime) -> int:
+    """Микросекунды UTC от эпохи."""
+    return (utc_naive(moment) - EPOCH) // timedelta(microseconds=1)
+
+
+def from_us(us: int) -> datetime:
+    return EPOCH + timedelta(microseconds=us)
+
+
+class LoggedEvent(NamedTuple):
+    """Событие из журнала."""
+    occurred_at: datetime
+    tv_id: int
+    link_id: Optional[int]
+    event_type: str
+    device_hash: int
+
+
+def encode_event(
+    tv_id: int,
+    link_id: Optional[int],
+    occurred_at: datetime,
+    event_type: str,
+    fingerprint: Optional[str] = None,
+) -> bytes:
+    """Запись журнала для события."""
+    return RECORD.pack(
+        to_us(occurred_at),
+        tv_id,
+        link_id or 0,
+        EVENT_CODES[event_type],
+        hash_value(fingerprint) if fingerprint else 0,
+    )
+
+
+def read_records(path: Path) -> Iterator[tuple]:
+    """
+    Сырые записи сегмента (ts_us, tv_id, link_id, code, device_hash).
+
+    Недописанная последняя запись (сбой во время записи) пропускается.
+    """
+    chunk_size = RECORD.size * READ_CHUNK_RECORDS
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            usable = len(chunk) - len(chunk) % RECORD.size
+            yield from RECORD.iter_unpack(chunk[:usable])
+            if usable < len(chunk):
+                return
+
+
+def segment_range(path: Path) -> Optional[tuple[int, int]]:
+    """(min_ts_us, max_ts_us) закрытого сегмента по имени файла."""
+    if path.suffix != SEGMENT_SUFFIX:
+        return None
+    min_us, max_us, _ = path.stem.split("-", 2)
+    return int(min_us), int(max_us)
+
+
+def close_segment(path: Path) -> Optional[Path]:
+    """Переименовать открытый сегмент в закрытый (пустой - удалить)."""
+    min_us = max_us = None
+    for ts_us, *_ in read_records(path):
+        min_us = ts_us if min_us is None else min(min_us, ts_us)
+        max_us = ts_us if max_us is None else max(max_us, ts_us)
+    if min_us is None:
+        path.unlink(missing_ok=True)
+        return None
+    closed = path.with_name(f"{min_us}-{max_us}-{path.stem}{SEGMENT_SUFFIX}")
+    os.replace(path, closed)
+    return closed
+
+
+class SegmentWriter:
+    """Текущий открытый сегмент процесса."""
+
+    def __init__(self, directory: Path, max_records: int, max_seconds: float):
+        self.directory = directory
+        self.max_records = max_records
+        self.max_seconds = max_seconds
+        self._file = None
+        self._path: Optional[Path] = None
+        self._count = 0
+        self._min_us = 0
+        self._max_us = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> Optional[Path]:
+        return self._path
+
+    def append(self, records: Iterable[bytes]) -> int:
+        """Дописать записи в сегмент (с закрытием по размеру)."""
+        written = 0
+        with self._lock:
+            for record in records:
+                if self._file is None:
+                    self._open()
+                self._file.write(record)
+                ts_us = RECORD.unpack_from(record)[0]
+                if self._count == 0:
+                    self._min_us = self._max_us = ts_us
+                else:
+                    self._min_us = min(self._min_us, ts_us)
+                    self._max_us = max(self._max_us, ts_us)
+                self._count += 1
+                written += 1
+                if self._count >= self.max_records:
+                    self._close()
+            if self._file is not None:
+                self._file.flush()
+        return written
+
+    def rotate(self, force: bool = False) -> Optional[Path]:
+        """Закрыть сегмент, если он старше max_seconds (или force)."""
+        with self._lock:
+            if self._file is None:
+                return None
+            if not force and time.monotonic() - self._opened_at < self.max_seconds:
+                return None
+            return self._close()
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def _open(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._path = self.directory / f"{time.time_ns() // 1000}-{os.getpid()}{OPEN_SUFFIX}"
+        self._file = open(self._path, "ab")
+        self._count = 0
+        self._opened_at = time.monotonic()
+
+    def _close(self) -> Path:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        closed = self._path.with_name(f"{self._min_us}-{self._max_us}-{self._path.stem}{SEGMENT_SUFFIX}")
+        os.replace(self._path, closed)
+        self._file = None
+        self._path = None
+        self._count = 0
+        return closed
+
+
+class EventLog:
+    """Журнал событий: запись, поиск по ТВ и времени, свёртка в TVStats."""
+
+    def __init__(self, directory: str, max_records: int, max_seconds: float, retention_days: int):
+        self.directory = Path(directory)
+        self.retention_days = retention_days
+        self.writer = SegmentWriter(self.directory, max_records, max_seconds)
+        self._compact_lock = threading.Lock()
+
+    # ─── Запись ───
+
+    def append(
+        self,
+        tv_id: int,
+        link_id: Optional[int],
+        occurred_at: datetime,
+        event_type: str,
+        fingerprint: Optional[str] = None,
+    ) -> None:
+        """Записать одно событие."""
+        self.writer.append([encode_event(tv_id, link_id, occurred_at, event_type, fingerprint)])
+
+    def append_many(self, records: Iterable[bytes]) -> int:
+        """Записать пакет событий (encode_event)."""
+        return self.writer.append(records)
+
+    # ─── Поиск ───
+
+    def segments(self) -> list[Path]:
+        """Все сегменты журнала (закрытые и открытые)."""
+        if not self.directory.exists():
+            return []
+        return sorted(
+            p for p in self.directory.iterdir()
+            if p.suffix in (SEGMENT_SUFFIX, OPEN_SUFFIX)
+        )
+
+    def scan(
+        self,
+        tv_id: int,
+        start: datetime,
+        end: datetime,
+        link_id: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> list[LoggedEvent]:
+        """
+        События ТВ за [start, end), упорядоченные по времени.
+
+        Закрытые сегменты вне периода отбрасываются по имени файла,
+        остальные читаются блоками без разбора записей других ТВ.
+        """
+        start_us, end_us = to_us(start), to_us(end)
+        self.writer.flush()
+
+        found = []
+        for path in self.segments():
+            bounds = segment_range(path)
+            if bounds is not None and (bounds[1] < start_us or bounds[0] >= end_us):
+                continue
+            try:
+                for ts_us, record_tv_id, record_link_id, code, device_hash in read_records(path):
+                    if record_tv_id != tv_id or not start_us <= ts_us < end_us:
+                        continue
+                    if link_id is not None and record_link_id != link_id:
+                        continue
+                    found.append((ts_us, record_link_id, code, device_hash))
+            except FileNotFoundError:
+                # Сегмент закрыт или удалён другим процессом во время поиска
+                continue
+
+        found.sort()
+        if limit is not None:
+            found = found[:limit]
+        return [
+            LoggedEvent(
+                occurred_at=from_us(ts_us),
+                tv_id=tv_id,
+                link_id=record_link_id or None,
+                event_type=EVENT_NAMES.get(code, "unknown"),
+                device_hash=device_hash,
+            )
+            for ts_us, record_link_id, code, device_hash in found
+        ]
+
+    # ─── Свёртка ───
+
+    def compact(self, force_rotate: bool = False) -> int:
+        """
+        Свернуть закрытые сегменты в TVStats.
+
+        Текущий сегмент процесса закрывается по возрасту (или force_rotate),
+        брошенные открытые сегменты остановленных процессов закрываются.
+        Возвращает количество свёрнутых событий.
+        """
+        with self._compact_lock:
+            self.writer.rotate(force=force_rotate)
+            self._close_abandoned()
+
+            closed = [p for p in self.segments() if p.suffix == SEGMENT_SUFFIX]
+            if not closed:
+                return 0
+
+            db = SessionLocal()
+            try:
+                done = {
+                    row.name for row in db.query(StatsEventSegment.name).filter(
+                        StatsEventSegment.name.in_([p.name for p in closed])
+                    )
+                }
+            finally:
+                db.close()
+
+            applied = 0
+            for path in closed:
+                if path.name not in done:
+                    applied += self._compact_segment(path)
+            self._prune(closed, done)
+            return applied
+
+    def _compact_segment(self, path: Path) -> int:
+        counts = {}
+        sketches = {}
+        records = 0
+        for ts_us, tv_id, link_id, code, device_hash in read_records(path):
+            event_type = EVENT_NAMES.get(code)
+            if event_type is None:
+                continue
+            key = stats_key(tv_id, link_id or None, from_us(ts_us), event_type)
+            counts[key] = counts.get(key, 0) + 1
+            if device_hash and event_type == "view":
+                sketch_key = SketchKey(tv_id, link_id or None, key.stat_date)
+                if sketch_key not in sketches:
+                    sketches[sketch_key] = new_sketch()
+                sketches[sketch_key].add_hash(device_hash)
+            records += 1
+
+        db = SessionLocal()
+        try:
+            # Сначала занять имя сегмента: если вставка не прошла, его уже свернул другой воркер
+            stmt = dialect_insert(db)(StatsEventSegment).values(
+                name=path.name, records=records, compacted_at=datetime.utcnow(),
+            ).on_conflict_do_nothing(
+                index_elements=[StatsEventSegment.name]
+            ).returning(StatsEventSegment.name)
+            if db.execute(stmt).first() is None:
+                db.rollback()
+                return 0
+            applied = StatsService(db).apply_increments(counts, sketches=sketches)
+            db.commit()
+            return applied
+        except Exception as e:
+            db.rollback()
+            print(f"Error compacting event log segment {path.name}: {e}")
+            return 0
+        finally:
+            db.close()
+
+    def _close_abandoned(self) -> None:
+        """Закрыть открытые сегменты, в которые давно никто не пишет."""
+        max_age = self.writer.max_seconds * 3
+        now = time.time()
+        for path in self.segments():
+            if path.suffix != OPEN_SUFFIX or path == self.writer.path:
+                continue
+            try:
+                if now - path.stat().st_mtime > max_age:
+                    close_segment(path)
+            except FileNotFoundError:
+                continue
+
+    def _prune(self, closed: list[Path], done: set[str]) -> None:
+        """Удалить свёрнутые сегменты старше срока хранения."""
+        if self.retention_days <= 0:
+            return
+        cutoff_us = to_us(datetime.utcnow() - timedelta(days=self.retention_days))
+        expired = [
+            path for path in closed
+            if path.name in done and segment_range(path)[1] < cutoff_us
+        ]
+        if not expired:
+            return
+
+        for path in expired:
+            path.unlink(missing_ok=True)
+        db = SessionLocal()
+        try:
+            db.query(StatsEventSegment).filter(
+                StatsEventSegment.name.in_([p.name for p in expired])
+            ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def close(self) -> None:
+        """Закрыть текущий сегмент и свернуть его (остановка приложения)."""
+        self.compact(force_rotate=True)
+
+    async def run(self, interval_seconds: float) -> None:
+        """Фоновая задача: периодически сворачивать сегменты, не блокируя event loop."""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            await asyncio.to_thread(self.compact)
+
+
+event_log = EventLog(
+    directory=settings.EVENT_LOG_DIR,
+    max_records=settings.EVENT_LOG_SEGMENT_MAX_RECORDS,
+    max_seconds=settings.EVENT_LOG_SEGMENT_MAX_SECONDS,
+    retention_days=settings.EVENT_LOG_RETENTION_DAYS,
+)
@@ -0,0 +1,32 @@
+"""
+Условные запросы и выбор кодировки ответа (ETag / If-None-Match, Accept-Encoding).
+"""
+
+from typing import Optional
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Проверить заголовок If-None-Match против ETag ответа."""
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+def accepts_encoding(accept_encoding: Optional[str], coding: str) -> bool:
+    """Клиент принимает кодировку coding (с учётом q=0 и '*')."""
+    if not accept_encoding:
+        return False
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip()] = quality
+    quality = accepted.get(coding, accepted.get("*", 0.0))
+    return quality > 0
@@ -0,0 +1,150 @@
+"""
+Кеш адресов ссылок рекламодателей для редиректа /r/{link_id}.
+
+Витрина ТВ и QR-коды ведут на /r/{link_id}: сервер засчитывает клик в буфер
+статистики и отвечает 302 на URL рекламодателя. Адрес берётся из in-process
+кеша, поэтому повторные переходы не обращаются к БД. Записи ТВ сбрасываются
+через invalidate_tv_content() вместе с контентом экрана, TTL страхует
+от устаревания при нескольких воркерах uvicorn. Ненайденные ID коротко
+кешируются (TV_NOT_FOUND_TTL_SECONDS), чтобы перебор случайных ссылок не
+доходил до БД.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+from app.db import SessionLocal
+from app.models import TV, TVLink
+from app.settings import settings
+
+
+class LinkTarget(NamedTuple):
+    """Адрес перехода по ссылке и ТВ, на котором она размещена."""
+    link_id: int
+    tv_id: int
+    url: str
+
+
+class LinkTargetCache:
+    """Ограниченный LRU-кеш активных ссылок по ID с отрицательным кешем."""
+
+    def __init__(self, max_size: int, ttl_seconds: float, not_found_ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.not_found_ttl_seconds = not_found_ttl_seconds
+        self._entries: "OrderedDict[int, tuple[float, LinkTarget]]" = OrderedDict()
+        self._by_tv: dict[int, set[int]] = {}      # tv_id -> link_ids
+        self._missing: "OrderedDict[int, float]" = OrderedDict()   # link_id -> expires_at
+        self._lock = threading.Lock()
+
+    def get(self, link_id: int) -> Optional[LinkTarget]:
+        """Вернуть адрес ссылки, если он есть и не устарел."""
+        with self._lock:
+            item = self._entries.get(link_id)
+            if item is None:
+                return None
+            expires_at, target = item
+            if expires_at < time.monotonic():
+                self._drop(link_id)
+                return None
+            self._entries.move_to_end(link_id)
+            return target
+
+    def set(self, target: LinkTarget) -> None:
+        """Сохранить адрес ссылки."""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._drop(target.link_id)
+            self._missing.pop(target.link_id, None)
+            self._entries[target.link_id] = (time.monotonic() + self.ttl_seconds, target)
+            self._by_tv.setdefault(target.tv_id, set()).add(target.link_id)
+            while len(self._entries) > self.max_size:
+                self._drop(next(iter(self._entries)))
+
+    def is_missing(self, link_id: int) -> bool:
+        """ID недавно не был найден в БД."""
+        with self._lock:
+            expires_at = self._missing.get(link_id)
+            if expires_at is None:
+                return False
+            if expires_at < time.monotonic():
+                del self._missing[link_id]
+                return False
+            return True
+
+    def remember_missing(self, link_id: int) -> None:
+        """Запомнить ненайденный ID на not_found_ttl_seconds."""
+        if self.max_size <= 0 or self.not_found_ttl_seconds <= 0:
+            return
+        with self._lock:
+            self._missing[link_id] = time.monotonic() + self.not_found_ttl_seconds
+            self._missing.move_to_end(link_id)
+            while len(self._missing) > self.max_size:
+                self._missing.popitem(last=False)
+
+    def invalidate_tv(self, tv_id: int) -> None:
+        """Сбросить все ссылки ТВ (и ненайденные ID: ссылка могла появиться)."""
+        with self._lock:
+            for link_id in list(self._by_tv.get(tv_id, ())):
+                self._drop(link_id)
+            self._missing.clear()
+
+    def clear(self) -> None:
+        """Полностью очистить кеш."""
+        with self._lock:
+            self._entries.clear()
+            self._by_tv.clear()
+            self._missing.clear()
+
+    def _drop(self, link_id: int) -> None:
+        item = self._entries.pop(link_id, None)
+        if item is None:
+            return
+        tv_id = item[1].tv_id
+        link_ids = self._by_tv.get(tv_id)
+        if link_ids is not None:
+            link_ids.discard(link_id)
+            if not link_ids:
+                del self._by_tv[tv_id]
+
+
+link_target_cache = LinkTargetCache(
+    max_size=settings.LINK_CACHE_SIZE,
+    ttl_seconds=settings.CONTENT_CACHE_TTL_SECONDS,
+    not_found_ttl_seconds=settings.TV_NOT_FOUND_TTL_SECONDS,
+)
+
+
+def resolve_link_target(link_id: int) -> Optional[LinkTarget]:
+    """
+    Адрес активной ссылки на активном ТВ: из кеша или одним запросом к БД.
+
+    Возвращает None, если ссылка не найдена, отключена или ТВ неактивен.
+    """
+    target = link_target_cache.get(link_id)
+    if target is not None:
+        return target
+    if link_target_cache.is_missing(link_id):
+        return None
+
+    db = SessionLocal()
+    try:
+        row = db.query(TVLink.id, TVLink.tv_id, TVLink.url).join(
+            TV, TV.id == TVLink.tv_id
+        ).filter(
+            TVLink.id == link_id,
+            TVLink.is_active == True,
+            TV.is_active == True,
+        ).first()
+    finally:
+        db.close()
+
+    if row is None:
+        link_target_cache.remember_missing(link_id)
+        return None
+    target = LinkTarget(link_id=row.id, tv_id=row.tv_id, url=row.url)
+    link_target_cache.set(target)
+    return target
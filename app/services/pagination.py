@@ -0,0 +1,172 @@
+"""
+Постраничный вывод списков в кабинетах.
+
+- paginate(): LIMIT/OFFSET + COUNT, для коротких списков с номерами страниц;
+- keyset_paginate(): поиск по ключу (created_at, id) с курсорами "дальше" /
+  "назад" - для больших таблиц. Стоимость страницы не зависит от её
+  номера, а курсор стабилен при вставке новых строк.
+"""
+
+import base64
+import math
+from datetime import datetime
+from typing import Any, Optional
+
+from sqlalchemy import and_, or_
+
+from app.settings import settings
+
+
+class Page:
+    """Страница списка: элементы, номер, размер и общее количество."""
+
+    def __init__(self, items: list, page: int, per_page: int, total: int):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+
+    @property
+    def pages(self) -> int:
+        return max(1, math.ceil(self.total / self.per_page))
+
+    @property
+    def has_prev(self) -> bool:
+        return self.page > 1
+
+    @property
+    def has_next(self) -> bool:
+        return self.page < self.pages
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __bool__(self) -> bool:
+        return bool(self.items)
+
+
+def clamp_page(page: Optional[int], per_page: Optional[int] = None) -> tuple[int, int]:
+    """Номер страницы (с 1) и размер страницы в допустимых пределах."""
+    per_page = min(max(per_page or settings.PAGE_SIZE, 1), settings.PAGE_SIZE_MAX)
+    return max(page or 1, 1), per_page
+
+
+def paginate(query: Any, page: Optional[int] = None, per_page: Optional[int] = None, total: Optional[int] = None) -> Page:
+    """
+    Загрузить одну страницу запроса.
+
+    total - уже посчитанное количество (например, из агрегатного запроса),
+    иначе выполняется query.count(). Номер страницы за пределами списка
+    приводится к последней странице.
+    """
+    page, per_page = clamp_page(page, per_page)
+    if total is None:
+        total = query.order_by(None).count()
+    page = min(page, max(1, math.ceil(total / per_page)))
+    items = query.offset((page - 1) * per_page).limit(per_page).all() if total else []
+    return Page(items, page, per_page, total)
+
+
+# ─────────────────────────────────────────────────────────────
+# Keyset (seek) pagination
+# ─────────────────────────────────────────────────────────────
+
+def encode_cursor(sort_value: datetime, row_id: int) -> str:
+    """Курсор строки: (значение сортировки, id) в urlsafe base64."""
+    raw = f"{sort_value.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[tuple[datetime, int]]:
+    """Разобрать курсор; None - курсора нет или он повреждён (тогда первая страница)."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        sort_value, row_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(sort_value), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+class KeysetPage:
+    """Страница keyset-пагинации: элементы и курсоры соседних страниц."""
+
+    def __init__(self, items: list, per_page: int, next_cursor: Optional[str], prev_cursor: Optional[str]):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self) -> bool:
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __bool__(self) -> bool:
+        return bool(self.items)
+
+
+def keyset_paginate(
+    query: Any,
+    sort_column: Any,
+    id_column: Any,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+    per_page: Optional[int] = None,
+) -> KeysetPage:
+    """
+    Страница запроса, упорядоченного по (sort_column, id_column) по убыванию.
+
+    after - курсор последней строки предыдущей страницы (идём к более старым),
+    before - курсор первой строки следующей страницы (возвращаемся к новым).
+    Фильтры накладываются на query заранее; sort_column не должен быть NULL.
+    Для скорости нужен индекс (фильтр..., sort_column, id_column).
+    """
+    _, per_page = clamp_page(1, per_page)
+    after_key = decode_cursor(after)
+    before_key = decode_cursor(before) if after_key is None else None
+
+    if before_key is not None:
+        sort_value, row_id = before_key
+        query = query.filter(or_(
+            sort_column > sort_value,
+            and_(sort_column == sort_value, id_column > row_id),
+        )).order_by(sort_column.asc(), id_column.asc())
+    else:
+        if after_key is not None:
+            sort_value, row_id = after_key
+            query = query.filter(or_(
+                sort_column < sort_value,
+                and_(sort_column == sort_value, id_column < row_id),
+            ))
+        query = query.order_by(sort_column.desc(), id_column.desc())
+
+    rows = query.limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if before_key is not None:
+        rows.reverse()
+
+    def cursor_of(row) -> str:
+        return encode_cursor(getattr(row, sort_column.key), getattr(row, id_column.key))
+
+    if before_key is not None:
+        next_cursor = cursor_of(rows[-1]) if rows else None
+        prev_cursor = cursor_of(rows[0]) if rows and has_more else None
+    else:
+        next_cursor = cursor_of(rows[-1]) if rows and has_more else None
+        prev_cursor = cursor_of(rows[0]) if rows and after_key is not None else None
+    return KeysetPage(rows, per_page, next_cursor, prev_cursor)
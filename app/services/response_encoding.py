@@ -0,0 +1,89 @@
+"""
+Быстрая сериализация JSON и заранее сжатые варианты ответов Public API.
+
+Контент ТВ сериализуется и сжимается (gzip, brotli) один раз на версию при
+записи в кеш, а вариант для ответа выбирается по Accept-Encoding клиента.
+"""
+
+import gzip
+import threading
+from collections import OrderedDict
+from typing import Any, NamedTuple, Optional
+
+import brotli
+import orjson
+from fastapi.responses import JSONResponse
+
+from app.services.http_cache import accepts_encoding
+from app.settings import settings
+
+
+def dumps_json(content: Any) -> bytes:
+    """Сериализовать JSON-совместимые данные в UTF-8 (нестроковые ключи - как в json)."""
+    return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse с сериализацией через dumps_json."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps_json(content)
+
+
+class EncodedBody(NamedTuple):
+    """Тело ответа и его сжатые варианты (None - вариант не создавался)."""
+    identity: bytes
+    gzip: Optional[bytes] = None
+    br: Optional[bytes] = None
+
+
+def encode_body(body: bytes) -> EncodedBody:
+    """Сжать тело ответа gzip и brotli (маленькие тела не сжимаются)."""
+    if len(body) < settings.RESPONSE_COMPRESS_MIN_BYTES:
+        return EncodedBody(identity=body)
+    return EncodedBody(
+        identity=body,
+        gzip=gzip.compress(body, compresslevel=9, mtime=0),
+        br=brotli.compress(body, quality=11),
+    )
+
+
+def select_encoding(body: EncodedBody, accept_encoding: Optional[str]) -> tuple[bytes, Optional[str]]:
+    """Выбрать вариант тела по Accept-Encoding: brotli, затем gzip, затем без сжатия."""
+    if body.br is not None and accepts_encoding(accept_encoding, "br"):
+        return body.br, "br"
+    if body.gzip is not None and accepts_encoding(accept_encoding, "gzip"):
+        return body.gzip, "gzip"
+    return body.identity, None
+
+
+class EncodedBodyCache:
+    """
+    Небольшой LRU готовых тел составных ответов (манифест, QR) по ключу с ETag.
+
+    Ключ должен меняться вместе с содержимым, поэтому инвалидация не нужна:
+    устаревшие тела просто вытесняются.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._bodies: "OrderedDict[str, EncodedBody]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_encode(self, key: str, content: Any) -> EncodedBody:
+        """Вернуть готовое тело по ключу или сериализовать и сжать content."""
+        with self._lock:
+            body = self._bodies.get(key)
+            if body is not None:
+                self._bodies.move_to_end(key)
+                return body
+        body = encode_body(dumps_json(content))
+        if self.max_size > 0:
+            with self._lock:
+                self._bodies[key] = body
+                while len(self._bodies) > self.max_size:
+                    self._bodies.popitem(last=False)
+        return body
+
+
+encoded_bodies = EncodedBodyCache(max_size=settings.ENCODED_BODY_CACHE_SIZE)
@@ -0,0 +1,130 @@
+"""
+Write-behind буфер статистики ТВ-плееров.
+
+События принимаются в память и агрегируются по ключу
+(tv_id, link_id, stat_date, event_type, hour), отпечатки устройств просмотров -
+в HyperLogLog-скетчи по (tv_id, link_id, stat_date). Фоновая задача периодически
+сбрасывает накопленные приращения в БД одной транзакцией; при остановке
+приложения буфер сбрасывается полностью.
+"""
+
+import asyncio
+import threading
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy.exc import DataError, IntegrityError
+
+from app.db import SessionLocal
+from app.services.hyperloglog import HyperLogLog
+from app.services.stats_service import SketchKey, StatsKey, StatsService, new_sketch, stats_key
+
+
+class StatsBuffer:
+    """Потокобезопасный агрегирующий буфер событий статистики."""
+
+    def __init__(self):
+        self._counts: dict[StatsKey, int] = {}
+        self._sketches: dict[SketchKey, HyperLogLog] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def add(
+        self,
+        tv_id: int,
+        link_id: Optional[int],
+        occurred_at: datetime,
+        event_type: str,
+        count: int = 1,
+        fingerprint: Optional[str] = None,
+    ) -> None:
+        """
+        Принять событие (или count одинаковых событий) в буфер.
+
+        occurred_at - время события (UTC), определяет день и час статистики.
+
+        fingerprint - отпечаток устройства для подсчёта уникальных зрителей
+        (учитывается только для просмотров).
+        """
+        key = stats_key(tv_id, link_id, occurred_at, event_type)
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + count
+            if fingerprint and event_type == "view":
+                sketch_key = SketchKey(tv_id, link_id, key.stat_date)
+                sketch = self._sketches.get(sketch_key)
+                if sketch is None:
+                    sketch = self._sketches[sketch_key] = new_sketch()
+                sketch.add(fingerprint)
+
+    def pending(self) -> int:
+        """Количество событий, ожидающих записи."""
+        with self._lock:
+            return sum(self._counts.values())
+
+    def drain(self) -> tuple[dict[StatsKey, int], dict[SketchKey, HyperLogLog]]:
+        """Забрать все накопленные приращения и скетчи, очистив буфер."""
+        with self._lock:
+            counts, self._counts = self._counts, {}
+            sketches, self._sketches = self._sketches, {}
+        return counts, sketches
+
+    def add_counts(
+        self,
+        counts: dict[StatsKey, int],
+        sketches: Optional[dict[SketchKey, HyperLogLog]] = None,
+    ) -> None:
+        """Добавить агрегированные приращения (пакет событий или возврат после неудачной записи)."""
+        with self._lock:
+            for key, n in counts.items():
+                self._counts[key] = self._counts.get(key, 0) + n
+            for key, sketch in (sketches or {}).items():
+                current = self._sketches.get(key)
+                if current is None:
+                    self._sketches[key] = sketch
+                else:
+                    current.merge(sketch)
+
+    def flush(self) -> int:
+        """
+        Записать накопленные приращения в БД одной транзакцией.
+
+        При временной ошибке (соединение, блокировка) приращения
+        возвращаются в буфер и будут записаны при следующем сбросе.
+        Нарушение ограничений (например, ТВ удалён между проверкой и
+        записью) повторяется один раз с новой проверкой; если пакет снова
+        не записан, он отбрасывается, а не блокирует все следующие сбросы.
+        Возвращает количество записанных событий.
+        """
+        with self._flush_lock:
+            counts, sketches = self.drain()
+            if not counts:
+                return 0
+
+            for attempt in range(2):
+                db = SessionLocal()
+                try:
+                    applied = StatsService(db).apply_increments(counts, sketches=sketches)
+                    db.commit()
+                    return applied
+                except (IntegrityError, DataError) as e:
+                    db.rollback()
+                    if attempt:
+                        print(f"Dropping {sum(counts.values())} buffered stats events: {e}")
+                        return 0
+                except Exception as e:
+                    db.rollback()
+                    self.add_counts(counts, sketches)
+                    print(f"Error flushing stats buffer: {e}")
+                    return 0
+                finally:
+                    db.close()
+            return 0
+
+    async def run(self, interval_seconds: float) -> None:
+        """Фоновая задача: периодически сбрасывать буфер, не блокируя event loop."""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            await asyncio.to_thread(self.flush)
+
+
+stats_buffer = StatsBuffer()
@@ -0,0 +1,160 @@
+"""
+Защита приёма статистики от зацикленных плееров и перезагрузок витрины.
+
+Перед любой работой с БД событие проходит два фильтра в памяти процесса:
+- окно повторов: одинаковое событие (ТВ, ссылка, устройство, тип) чаще
+  раза в STATS_DEDUP_WINDOW_SECONDS считается дублем;
+- token bucket по (ТВ, ссылка, устройство): STATS_RATE_LIMIT_PER_MINUTE
+  событий в минуту с запасом STATS_RATE_LIMIT_BURST.
+
+В пакете (/stats/batch) окно повторов различает события по времени
+плеера: одинаковые (ТВ, ссылка, устройство, тип, timestamp) - дубль, а
+события без timestamp ограничивает только token bucket. Выгрузка
+офлайн-буфера (/stats/upload) не проверяется: её повторы отсекаются
+по event_id.
+
+Отброшенные события не пишутся никуда, а считаются по причинам для
+мониторинга (/api/admin/stats/ingest). Оба фильтра - ограниченные LRU,
+поэтому память не растёт от числа устройств.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+from fastapi import Request
+
+from app.services.hyperloglog import hash_value
+from app.settings import settings
+
+DROP_DUPLICATE = "duplicate"
+DROP_RATE_LIMITED = "rate_limited"
+
+
+def client_fingerprint(
+    request: Request,
+    device_id: Optional[str] = None,
+    user_agent: Optional[str] = None,
+    device_info: Optional[str] = None,
+) -> str:
+    """
+    Отпечаток устройства: device_id плеера, а без него - IP клиента,
+    User-Agent и Client Hints. Только хешируется и нигде не хранится.
+    """
+    if device_id:
+        return f"id:{device_id}"
+    headers = request.headers
+    ip = headers.get("x-real-ip") or (request.client.host if request.client else "")
+    parts = [
+        ip,
+        user_agent or headers.get("user-agent", ""),
+        headers.get("sec-ch-ua", ""),
+        headers.get("sec-ch-ua-platform", ""),
+        headers.get("sec-ch-ua-model", ""),
+        device_info or "",
+    ]
+    return "fp:" + "|".join(parts)
+
+
+class TokenBucketLimiter:
+    """Token bucket на ключ с ограниченным числом ключей (LRU)."""
+
+    def __init__(self, rate_per_second: float, burst: int, max_keys: int):
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[tuple, tuple[float, float]]" = OrderedDict()  # key -> (tokens, updated_at)
+
+    def allow(self, key: tuple, now: float) -> bool:
+        """Списать токен; False - лимит ключа исчерпан."""
+        tokens, updated_at = self._buckets.get(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated_at) * self.rate_per_second)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return allowed
+
+
+class RecentEvents:
+    """Множество недавно принятых событий с окном повторов (LRU)."""
+
+    def __init__(self, window_seconds: float, max_keys: int):
+        self.window_seconds = window_seconds
+        self.max_keys = max_keys
+        self._seen: "OrderedDict[tuple, float]" = OrderedDict()  # key -> seen_at
+
+    def is_duplicate(self, key: tuple, now: float) -> bool:
+        """Событие уже было в окне; иначе запомнить его."""
+        seen_at = self._seen.get(key)
+        if seen_at is not None and now - seen_at < self.window_seconds:
+            return True
+        self._seen[key] = now
+        self._seen.move_to_end(key)
+        while len(self._seen) > self.max_keys:
+            self._seen.popitem(last=False)
+        return False
+
+
+class StatsGuard:
+    """Окно повторов + token bucket перед записью статистики, со счётчиками отброшенных."""
+
+    def __init__(self, rate_per_minute: float, burst: int, dedup_window_seconds: float, max_keys: int):
+        self.enabled = rate_per_minute > 0 or dedup_window_seconds > 0
+        self.limiter = TokenBucketLimiter(rate_per_minute / 60, burst, max_keys) if rate_per_minute > 0 else None
+        self.recent = RecentEvents(dedup_window_seconds, max_keys) if dedup_window_seconds > 0 else None
+        self._accepted = 0
+        self._dropped = {DROP_DUPLICATE: 0, DROP_RATE_LIMITED: 0}
+        self._lock = threading.Lock()
+
+    def check(
+        self,
+        tv: str,
+        link_id: Optional[int],
+        fingerprint: str,
+        event_type: str,
+        event_time: Optional[datetime] = None,
+        dedup: bool = True,
+    ) -> Optional[str]:
+        """
+        Пропустить событие или вернуть причину отбрасывания.
+
+        tv - ID или код ТВ из запроса (проверка идёт до поиска ТВ в БД).
+        event_time - время события по часам плеера, входит в ключ окна
+        повторов (пакеты); dedup=False - только token bucket.
+        """
+        if not self.enabled:
+            return None
+        device = hash_value(fingerprint)
+        now = time.monotonic()
+        with self._lock:
+            reason = None
+            if dedup and self.recent is not None and self.recent.is_duplicate(
+                (tv, link_id, device, event_type, event_time), now
+            ):
+                reason = DROP_DUPLICATE
+            elif self.limiter is not None and not self.limiter.allow((tv, link_id, device), now):
+                reason = DROP_RATE_LIMITED
+            if reason is None:
+                self._accepted += 1
+            else:
+                self._dropped[reason] += 1
+            return reason
+
+    def counters(self) -> dict:
+        """Принятые и отброшенные (по причинам) события с запуска процесса."""
+        with self._lock:
+            return {"accepted": self._accepted, "dropped": dict(self._dropped)}
+
+
+stats_guard = StatsGuard(
+    rate_per_minute=settings.STATS_RATE_LIMIT_PER_MINUTE,
+    burst=settings.STATS_RATE_LIMIT_BURST,
+    dedup_window_seconds=settings.STATS_DEDUP_WINDOW_SECONDS,
+    max_keys=settings.STATS_GUARD_MAX_KEYS,
+)
@@ -0,0 +1,200 @@
+"""
+Запросы статистики за период: (рекламодатель | ТВ | ссылка) × (даты) × (день / неделя / месяц).
+
+Данные берутся из дневных строк TVStats одним GROUP BY по дате (или по
+ссылке) - по покрывающему индексу, без чтения всей истории: для
+рекламодателя (advertiser_id, stat_date, tv_id, tv_link_id, impressions,
+clicks), для ТВ и ссылки на ТВ (tv_id, stat_date, tv_link_id,
+impressions, clicks). Ссылку без tv_id ищет индекс tv_link_id с чтением
+строк, поэтому вместе с link_id передаётся ТВ или рекламодатель. Недели и
+месяцы собираются из дней в Python: дней в периоде немного, а запрос
+остаётся переносимым между SQLite и PostgreSQL. Дни старше срока
+хранения дневной статистики берутся из месячных строк (TVStatsMonthly):
+месяц, пересекающийся с периодом, учитывается целиком на обоих концах
+(как в StatsRollupService.totals) и относится к периоду, в который
+попадает начало месяца (первый неполный - к первому периоду).
+
+Ряды плотные: каждый период диапазона присутствует, пустые - с нулями,
+так что их можно сразу отдавать в графики.
+"""
+
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models import TVStats, TVStatsMonthly
+from app.services.stats_rollup import StatsRollupService, add_months, month_start
+
+GRANULARITIES = ("day", "week", "month")
+
+
+def period_start(day: date, granularity: str) -> date:
+    """Начало периода, содержащего day (неделя - с понедельника)."""
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return month_start(day)
+    return day
+
+
+def next_period(start: date, granularity: str) -> date:
+    if granularity == "week":
+        return start + timedelta(days=7)
+    if granularity == "month":
+        return add_months(start, 1)
+    return start + timedelta(days=1)
+
+
+def period_label(start: date, granularity: str) -> str:
+    if granularity == "month":
+        return start.strftime("%m.%Y")
+    if granularity == "week":
+        return f"{start.strftime('%d.%m')}–{(start + timedelta(days=6)).strftime('%d.%m')}"
+    return start.strftime("%d.%m")
+
+
+def auto_granularity(date_from: date, date_to: date) -> str:
+    """Гранулярность графика по длине периода: до 2 месяцев - дни, до года - недели."""
+    days = (date_to - date_from).days + 1
+    if days <= 62:
+        return "day"
+    if days <= 366:
+        return "week"
+    return "month"
+
+
+def _ctr(impressions: int, clicks: int) -> float:
+    return round(clicks / impressions * 100, 2) if impressions else 0
+
+
+class StatsQueryService:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def _daily_from(self, date_from: date) -> date:
+        """Первый день периода, который ещё хранится в дневной статистике."""
+        daily_cutoff = StatsRollupService(self.db).daily_cutoff(datetime.utcnow().date())
+        if daily_cutoff is None:
+            return date_from
+        return max(date_from, daily_cutoff)
+
+    @staticmethod
+    def _filter(query, model, advertiser_id, tv_id, link_id):
+        return StatsRollupService._filter(query, model, advertiser_id, tv_id, link_id)
+
+    def series(
+        self,
+        date_from: date,
+        date_to: date,
+        granularity: str = "day",
+        advertiser_id: Optional[int] = None,
+        tv_id: Optional[int] = None,
+        link_id: Optional[int] = None,
+    ) -> list[dict]:
+        """
+        Плотный ряд показов и кликов по периодам [date_from, date_to].
+
+        Элемент: period (date начала), label, impressions, clicks, ctr.
+        Месяцы старше хранения дней учитываются целиком (см. модуль).
+        """
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Unknown granularity: {granularity}")
+
+        buckets: dict[date, list[int]] = {}
+        start = period_start(date_from, granularity)
+        while start <= date_to:
+            buckets[start] = [0, 0]
+            start = next_period(start, granularity)
+
+        def add(day: date, impressions, clicks) -> None:
+            bucket = buckets[period_start(max(day, date_from), granularity)]
+            bucket[0] += int(impressions or 0)
+            bucket[1] += int(clicks or 0)
+
+        daily_from = self._daily_from(date_from)
+        if date_from < daily_from:
+            query = self.db.query(
+                TVStatsMonthly.stat_month,
+                func.sum(TVStatsMonthly.impressions),
+                func.sum(TVStatsMonthly.clicks),
+            ).filter(
+                TVStatsMonthly.stat_month >= month_start(date_from),
+                TVStatsMonthly.stat_month < min(daily_from, date_to + timedelta(days=1)),
+            )
+            query = self._filter(query, TVStatsMonthly, advertiser_id, tv_id, link_id)
+            for stat_month, impressions, clicks in query.group_by(TVStatsMonthly.stat_month):
+                add(stat_month, impressions, clicks)
+
+        if daily_from <= date_to:
+            query = self.db.query(
+                TVStats.stat_date,
+                func.sum(TVStats.impressions),
+                func.sum(TVStats.clicks),
+            ).filter(
+                TVStats.stat_date >= daily_from,
+                TVStats.stat_date <= date_to,
+            )
+            query = self._filter(query, TVStats, advertiser_id, tv_id, link_id)
+            for stat_date, impressions, clicks in query.group_by(TVStats.stat_date):
+                add(stat_date, impressions, clicks)
+
+        return [
+            {
+                "period": start,
+                "label": period_label(start, granularity),
+                "impressions": impressions,
+                "clicks": clicks,
+                "ctr": _ctr(impressions, clicks),
+            }
+            for start, (impressions, clicks) in buckets.items()
+        ]
+
+    def by_link(
+        self,
+        date_from: date,
+        date_to: date,
+        advertiser_id: Optional[int] = None,
+        tv_id: Optional[int] = None,
+    ) -> dict[int, dict]:
+        """Показы, клики и CTR за период по ссылкам: tv_link_id -> dict (месяцы старше хранения дней - целиком)."""
+        totals: dict[int, list[int]] = {}
+
+        def collect(query, model):
+            query = self._filter(query, model, advertiser_id, tv_id, None)
+            for link_id, impressions, clicks in query.filter(model.tv_link_id.isnot(None)).group_by(model.tv_link_id):
+                item = totals.setdefault(link_id, [0, 0])
+                item[0] += int(impressions or 0)
+                item[1] += int(clicks or 0)
+
+        daily_from = self._daily_from(date_from)
+        if date_from < daily_from:
+            collect(self.db.query(
+                TVStatsMonthly.tv_link_id, func.sum(TVStatsMonthly.impressions), func.sum(TVStatsMonthly.clicks),
+            ).filter(
+                TVStatsMonthly.stat_month >= month_start(date_from),
+                TVStatsMonthly.stat_month < min(daily_from, date_to + timedelta(days=1)),
+            ), TVStatsMonthly)
+        if daily_from <= date_to:
+            collect(self.db.query(
+                TVStats.tv_link_id, func.sum(TVStats.impressions), func.sum(TVStats.clicks),
+            ).filter(
+                TVStats.stat_date >= daily_from,
+                TVStats.stat_date <= date_to,
+            ), TVStats)
+
+        return {
+            link_id: {"impressions": impressions, "clicks": clicks, "ctr": _ctr(impressions, clicks)}
+            for link_id, (impressions, clicks) in totals.items()
+        }
+
+    def first_date(self, advertiser_id: Optional[int] = None, tv_id: Optional[int] = None) -> Optional[date]:
+        """Первый день, за который есть статистика (с учётом месячных строк)."""
+        dates = []
+        for model, column in ((TVStatsMonthly, TVStatsMonthly.stat_month), (TVStats, TVStats.stat_date)):
+            query = self._filter(self.db.query(func.min(column)), model, advertiser_id, tv_id, None)
+            value = query.scalar()
+            if value is not None:
+                dates.append(value)
+        return min(dates) if dates else None
@@ -0,0 +1,352 @@
+"""
+Свёртки статистики ТВ по гранулярностям и сроки хранения.
+
+События пишутся сразу в почасовую (TVStatsHourly) и дневную (TVStats)
+таблицы. Фоновая задача пересчитывает месячные строки TVStatsMonthly из
+дневных за последние STATS_ROLLUP_LOOKBACK_DAYS и удаляет данные старше
+сроков хранения каждой гранулярности. Дневные строки удаляются только
+целыми месяцами и только после свёртки, поэтому итоги не теряются.
+
+Запросы за период берут самую мелкую таблицу, которая покрывает период
+целиком: часы для коротких недавних периодов, дни, а для дат старше
+хранения дней - месяцы.
+"""
+
+import asyncio
+import math
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import func, literal_column
+from sqlalchemy.orm import Session
+
+from app.db import SessionLocal
+from app.models import StatsUploadedEvent, TVStats, TVStatsHourly, TVStatsMonthly, TVStatsSketch
+from app.services.stats_service import dialect_insert, load_sketch, new_sketch
+from app.settings import settings
+
+# Максимальная длина периода (в днях), для которого берётся почасовая таблица
+HOURLY_MAX_RANGE_DAYS = 2
+
+
+def month_start(day: date) -> date:
+    """Первое число месяца."""
+    return day.replace(day=1)
+
+
+def add_months(day: date, months: int) -> date:
+    """Первое число месяца, отстоящего на months от месяца day."""
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+class StatsRollupService:
+    def __init__(self, db: Session):
+        self.db = db
+
+    # ─── Сроки хранения ───
+
+    def hourly_cutoff(self, today: date) -> Optional[date]:
+        """Первый день, за который хранится почасовая статистика (None - бессрочно)."""
+        if settings.STATS_HOURLY_RETENTION_DAYS <= 0:
+            return None
+        return today - timedelta(days=settings.STATS_HOURLY_RETENTION_DAYS)
+
+    def daily_cutoff(self, today: date) -> Optional[date]:
+        """Первый день, за который хранится дневная статистика (всегда начало месяца)."""
+        if settings.STATS_DAILY_RETENTION_DAYS <= 0:
+            return None
+        return month_start(today - timedelta(days=settings.STATS_DAILY_RETENTION_DAYS))
+
+    def monthly_cutoff(self, today: date) -> Optional[date]:
+        """Первый месяц, за который хранится месячная статистика."""
+        if settings.STATS_MONTHLY_RETENTION_MONTHS <= 0:
+            return None
+        return add_months(today, -settings.STATS_MONTHLY_RETENTION_MONTHS)
+
+    # ─── Свёртка ───
+
+    def rollup_months(self, date_from: date, date_to: date) -> int:
+        """
+        Пересчитать месячные строки за месяцы, пересекающие [date_from, date_to].
+
+        Строки перезаписываются суммами дневных (идемпотентно), уникальные
+        зрители - оценкой объединения дневных скетчей. Возвращает количество
+        записанных строк.
+        """
+        written = 0
+        month = month_start(date_from)
+        while month <= date_to:
+            written += self._rollup_month(month)
+            month = add_months(month, 1)
+        return written
+
+    def _rollup_month(self, month: date) -> int:
+        month_end = add_months(month, 1) - timedelta(days=1)
+        rows = self.db.query(
+            TVStats.tv_id,
+            TVStats.tv_link_id,
+            func.max(TVStats.advertiser_id).label("advertiser_id"),
+            func.coalesce(func.sum(TVStats.impressions), 0).label("impressions"),
+            func.coalesce(func.sum(TVStats.clicks), 0).label("clicks"),
+            func.coalesce(func.sum(TVStats.screen_time_seconds), 0).label("screen_time_seconds"),
+            func.coalesce(func.sum(TVStats.unique_views), 0).label("unique_views"),
+        ).filter(
+            TVStats.stat_date >= month,
+            TVStats.stat_date <= month_end,
+        ).group_by(TVStats.tv_id, TVStats.tv_link_id).all()
+        if not rows:
+            return 0
+
+        sketches = {}
+        for sketch_row in self.db.query(TVStatsSketch).filter(
+            TVStatsSketch.stat_date >= month,
+            TVStatsSketch.stat_date <= month_end,
+        ):
+            sketch = load_sketch(sketch_row.registers)
+            if sketch is None:
+                continue
+            key = (sketch_row.tv_id, sketch_row.tv_link_id)
+            sketches.setdefault(key, new_sketch()).merge(sketch)
+
+        now = datetime.utcnow()
+        values = []
+        for row in rows:
+            sketch = sketches.get((row.tv_id, row.tv_link_id))
+            values.append({
+                "tv_id": row.tv_id,
+                "tv_link_id": row.tv_link_id,
+                "advertiser_id": row.advertiser_id,
+                "stat_month": month,
+                "impressions": row.impressions,
+                "clicks": row.clicks,
+                "screen_time_seconds": row.screen_time_seconds,
+                # Без скетчей (данные до HLL) - сумма дневных значений
+                "unique_views": sketch.estimate() if sketch is not None else row.unique_views,
+                "updated_at": now,
+            })
+
+        insert = dialect_insert(self.db)
+        stmt = insert(TVStatsMonthly).values(values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[
+                TVStatsMonthly.tv_id,
+                func.coalesce(TVStatsMonthly.tv_link_id, literal_column("0")),
+                TVStatsMonthly.stat_month,
+            ],
+            set_={
+                column: getattr(stmt.excluded, column)
+                for column in ("advertiser_id", "impressions", "clicks",
+                               "screen_time_seconds", "unique_views", "updated_at")
+            },
+        )
+        self.db.execute(stmt)
+        return len(values)
+
+    def prune(self, today: date) -> dict[str, int]:
+        """
+        Удалить статистику старше сроков хранения (без commit).
+
+        Дневные строки и скетчи перед удалением сворачиваются в месяцы.
+        ID выгруженных событий хранятся окно опоздания: более старую
+        выгрузку отклонит проверка времени события.
+        Возвращает количество удалённых строк по гранулярностям.
+        """
+        deleted = {"hourly": 0, "daily": 0, "monthly": 0}
+
+        received_before = datetime.combine(today, datetime.min.time()) - timedelta(
+            hours=settings.STATS_LATE_EVENT_WINDOW_HOURS
+        )
+        deleted["uploaded_events"] = self.db.query(StatsUploadedEvent).filter(
+            StatsUploadedEvent.received_at < received_before
+        ).delete(synchronize_session=False)
+
+        cutoff = self.hourly_cutoff(today)
+        if cutoff is not None:
+            deleted["hourly"] = self.db.query(TVStatsHourly).filter(
+                TVStatsHourly.stat_hour < datetime.combine(cutoff, datetime.min.time())
+            ).delete(synchronize_session=False)
+
+        cutoff = self.daily_cutoff(today)
+        if cutoff is not None:
+            oldest = self.db.query(func.min(TVStats.stat_date)).filter(
+                TVStats.stat_date < cutoff
+            ).scalar()
+            if oldest is not None:
+                self.rollup_months(oldest, cutoff - timedelta(days=1))
+                deleted["daily"] = self.db.query(TVStats).filter(
+                    TVStats.stat_date < cutoff
+                ).delete(synchronize_session=False)
+            self.db.query(TVStatsSketch).filter(
+                TVStatsSketch.stat_date < cutoff
+            ).delete(synchronize_session=False)
+
+        cutoff = self.monthly_cutoff(today)
+        if cutoff is not None:
+            deleted["monthly"] = self.db.query(TVStatsMonthly).filter(
+                TVStatsMonthly.stat_month < cutoff
+            ).delete(synchronize_session=False)
+
+        return deleted
+
+    def run(self, today: Optional[date] = None) -> dict[str, int]:
+        """Свернуть последние дни в месяцы и применить сроки хранения (без commit)."""
+        today = today or datetime.utcnow().date()
+        # Опоздавшие события плееров могут менять дни в пределах окна опоздания
+        lookback_days = max(
+            settings.STATS_ROLLUP_LOOKBACK_DAYS,
+            math.ceil(settings.STATS_LATE_EVENT_WINDOW_HOURS / 24),
+        )
+        date_from = today - timedelta(days=lookback_days)
+        # Месяцы до границы хранения дней уже свёрнуты и не пересчитываются
+        cutoff = self.daily_cutoff(today)
+        if cutoff is not None and date_from < cutoff:
+            date_from = cutoff
+
+        result = {"monthly_rows": self.rollup_months(date_from, today)}
+        result.update(self.prune(today))
+        return result
+
+    # ─── Запросы за период ───
+
+    def granularity(self, date_from: date, date_to: date, today: Optional[date] = None) -> str:
+        """Самая мелкая таблица, покрывающая период: hour, day или month."""
+        today = today or datetime.utcnow().date()
+        hourly_cutoff = self.hourly_cutoff(today)
+        if (date_to - date_from).days < HOURLY_MAX_RANGE_DAYS and (
+            hourly_cutoff is None or date_from >= hourly_cutoff
+        ):
+            return "hour"
+        daily_cutoff = self.daily_cutoff(today)
+        if daily_cutoff is None or date_from >= daily_cutoff:
+            return "day"
+        return "month"
+
+    def totals(
+        self,
+        date_from: date,
+        date_to: date,
+        advertiser_id: Optional[int] = None,
+        tv_id: Optional[int] = None,
+        link_id: Optional[int] = None,
+    ) -> dict[str, int]:
+        """
+        Показы и клики за период из самой мелкой таблицы, покрывающей его.
+
+        Для дат старше хранения дней берутся месячные строки. Месяц
+        делится только на дни, которых уже нет, поэтому месячная строка
+        учитывается целиком, если месяц пересекается с периодом, - на обоих
+        концах: и первый неполный месяц, и месяц с date_to, если date_to
+        старше хранения дней.
+        """
+        today = datetime.utcnow().date()
+        level = self.granularity(date_from, date_to, today)
+        if level == "hour":
+            return self._sum(
+                TVStatsHourly, TVStatsHourly.stat_hour,
+                datetime.combine(date_from, datetime.min.time()),
+                datetime.combine(date_to + timedelta(days=1), datetime.min.time()),
+                advertiser_id, tv_id, link_id,
+            )
+
+        daily_from = date_from
+        result = {"impressions": 0, "clicks": 0}
+        if level == "month":
+            daily_from = self.daily_cutoff(today)
+            result = self._sum(
+                TVStatsMonthly, TVStatsMonthly.stat_month,
+                month_start(date_from), min(daily_from, date_to + timedelta(days=1)),
+                advertiser_id, tv_id, link_id,
+            )
+        if daily_from <= date_to:
+            daily = self._sum(
+                TVStats, TVStats.stat_date, daily_from, date_to + timedelta(days=1),
+                advertiser_id, tv_id, link_id,
+            )
+            result = {key: result[key] + daily[key] for key in result}
+        return result
+
+    def _sum(self, model, period_column, start, end, advertiser_id, tv_id, link_id) -> dict[str, int]:
+        """Сумма показов и кликов в [start, end) с фильтрами."""
+        query = self.db.query(
+            func.coalesce(func.sum(model.impressions), 0),
+            func.coalesce(func.sum(model.clicks), 0),
+        ).filter(period_column >= start, period_column < end)
+        query = self._filter(query, model, advertiser_id, tv_id, link_id)
+        impressions, clicks = query.one()
+        return {"impressions": int(impressions), "clicks": int(clicks)}
+
+    @staticmethod
+    def _filter(query, model, advertiser_id, tv_id, link_id):
+        if advertiser_id is not None:
+            query = query.filter(model.advertiser_id == advertiser_id)
+        if tv_id is not None:
+            query = query.filter(model.tv_id == tv_id)
+        if link_id is not None:
+            query = query.filter(model.tv_link_id == link_id)
+        return query
+
+    def hourly_profile(
+        self,
+        date_from: date,
+        date_to: date,
+        advertiser_id: Optional[int] = None,
+        tv_id: Optional[int] = None,
+    ) -> list[dict]:
+        """
+        Показы, клики и просмотры по часу суток (0-23, UTC) за период.
+
+        Пустой список, если период выходит за срок хранения почасовой статистики.
+        """
+        hourly_cutoff = self.hourly_cutoff(datetime.utcnow().date())
+        if hourly_cutoff is not None and date_from < hourly_cutoff:
+            return []
+
+        hour = func.extract("hour", TVStatsHourly.stat_hour)
+        query = self.db.query(
+            hour.label("hour"),
+            func.coalesce(func.sum(TVStatsHourly.impressions), 0).label("impressions"),
+            func.coalesce(func.sum(TVStatsHourly.clicks), 0).label("clicks"),
+            func.coalesce(func.sum(TVStatsHourly.views), 0).label("views"),
+        ).filter(
+            TVStatsHourly.stat_hour >= datetime.combine(date_from, datetime.min.time()),
+            TVStatsHourly.stat_hour < datetime.combine(date_to + timedelta(days=1), datetime.min.time()),
+        )
+        query = self._filter(query, TVStatsHourly, advertiser_id, tv_id, None)
+        by_hour = {int(row.hour): row for row in query.group_by(hour).all()}
+
+        profile = []
+        for h in range(24):
+            row = by_hour.get(h)
+            impressions = int(row.impressions) if row else 0
+            clicks = int(row.clicks) if row else 0
+            profile.append({
+                "hour": h,
+                "impressions": impressions,
+                "clicks": clicks,
+                "views": int(row.views) if row else 0,
+                "ctr": round(clicks / impressions * 100, 2) if impressions else 0,
+            })
+        return profile
+
+
+def run_rollup() -> dict[str, int]:
+    """Выполнить свёртку и очистку в отдельной сессии."""
+    db = SessionLocal()
+    try:
+        result = StatsRollupService(db).run()
+        db.commit()
+        return result
+    except Exception as e:
+        db.rollback()
+        print(f"Error rolling up stats: {e}")
+        return {}
+    finally:
+        db.close()
+
+
+async def run_periodic_rollup(interval_seconds: float) -> None:
+    """Фоновая задача: периодически сворачивать и чистить статистику, не блокируя event loop."""
+    while True:
+        await asyncio.to_thread(run_rollup)
+        await asyncio.sleep(interval_seconds)
@@ -0,0 +1,360 @@
+"""
+Сервис записи статистики ТВ-плееров (TVStats и счётчики TVLink).
+
+Каждое событие пишется в дневную строку TVStats и в почасовую
+TVStatsHourly; свёртку дней в месяцы и очистку по срокам хранения
+выполняет stats_rollup.
+
+Уникальные зрители считаются HyperLogLog-скетчами по отпечатку устройства:
+скетч (ТВ, ссылка, день) хранится в TVStatsSketch, а TVStats.unique_views
+содержит его оценку. Уникальные за период - слияние дневных скетчей.
+
+ID событий офлайн-выгрузки (tv_id, event_id) записываются в общую для
+всех воркеров таблицу StatsUploadedEvent вставкой ON CONFLICT DO NOTHING:
+событие учитывается только тем запросом, чья вставка прошла.
+"""
+
+from datetime import date, datetime, time
+from typing import NamedTuple, Optional
+
+from sqlalchemy import func, literal_column
+from sqlalchemy.orm import Session
+
+from app.models import StatsUploadedEvent, TV, TVLink, TVStats, TVStatsHourly, TVStatsSketch
+from app.services.hyperloglog import HyperLogLog
+from app.settings import settings
+
+
+# Тип события -> колонка TVStats
+# (unique_views перезаписывается оценкой скетча, если он передан)
+EVENT_COLUMNS = {
+    "impression": "impressions",
+    "click": "clicks",
+    "view": "unique_views",
+}
+
+# Тип события -> денормализованный счётчик TVLink
+LINK_COUNTER_COLUMNS = {
+    "impression": "impressions",
+    "click": "clicks",
+}
+
+# Тип события -> колонка TVStatsHourly
+HOURLY_EVENT_COLUMNS = {
+    "impression": "impressions",
+    "click": "clicks",
+    "view": "views",
+}
+
+VALID_EVENTS = list(EVENT_COLUMNS)
+
+# Строк в одной вставке ID выгруженных событий
+UPLOADED_EVENTS_CHUNK = 1000
+
+
+class StatsKey(NamedTuple):
+    """Ключ агрегации событий статистики (день и час UTC)."""
+    tv_id: int
+    link_id: Optional[int]
+    stat_date: date
+    event_type: str
+    hour: int
+
+
+def stats_key(tv_id: int, link_id: Optional[int], occurred_at: datetime, event_type: str) -> StatsKey:
+    """Ключ агрегации события, произошедшего в occurred_at (UTC)."""
+    return StatsKey(tv_id, link_id, occurred_at.date(), event_type, occurred_at.hour)
+
+
+class SketchKey(NamedTuple):
+    """Ключ скетча уникальных зрителей (строка TVStats)."""
+    tv_id: int
+    link_id: Optional[int]
+    stat_date: date
+
+
+def new_sketch() -> HyperLogLog:
+    """Пустой скетч уникальных зрителей с точностью из настроек."""
+    return HyperLogLog(settings.STATS_HLL_PRECISION)
+
+
+def load_sketch(registers: Optional[bytes]) -> Optional[HyperLogLog]:
+    """Скетч из БД; None, если он записан с другой точностью."""
+    if registers and len(registers) != 1 << settings.STATS_HLL_PRECISION:
+        return None
+    return HyperLogLog.from_bytes(registers, settings.STATS_HLL_PRECISION)
+
+
+def dialect_insert(db: Session):
+    """insert() с поддержкой ON CONFLICT для текущей БД."""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"Upsert статистики не поддерживается для {dialect}")
+    return insert
+
+
+class StatsService:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def get_links(self, link_ids) -> dict:
+        """Загрузить (id, tv_id, advertiser_id) ссылок одним IN-запросом."""
+        link_ids = {link_id for link_id in link_ids if link_id is not None}
+        if not link_ids:
+            return {}
+        rows = self.db.query(TVLink.id, TVLink.tv_id, TVLink.advertiser_id).filter(
+            TVLink.id.in_(link_ids)
+        ).all()
+        return {row.id: row for row in rows}
+
+    def get_tv_ids(self, tv_ids) -> set[int]:
+        """ID существующих ТВ из tv_ids одним IN-запросом."""
+        tv_ids = set(tv_ids)
+        if not tv_ids:
+            return set()
+        return {row.id for row in self.db.query(TV.id).filter(TV.id.in_(tv_ids))}
+
+    def claim_uploaded_events(self, keys, now: Optional[datetime] = None) -> set[tuple[int, str]]:
+        """
+        Записать ID выгруженных событий (tv_id, event_id), без commit.
+
+        Возвращает ключи, которых ещё не было: их и нужно учитывать.
+        Параллельная вставка того же ключа в PostgreSQL ждёт завершения
+        первой транзакции, поэтому событие учитывается ровно один раз.
+        """
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return set()
+        now = now or datetime.utcnow()
+        insert = dialect_insert(self.db)
+        claimed: set[tuple[int, str]] = set()
+        for offset in range(0, len(keys), UPLOADED_EVENTS_CHUNK):
+            chunk = keys[offset:offset + UPLOADED_EVENTS_CHUNK]
+            stmt = insert(StatsUploadedEvent).values([
+                {"tv_id": tv_id, "event_id": event_id, "received_at": now}
+                for tv_id, event_id in chunk
+            ]).on_conflict_do_nothing(
+                index_elements=[StatsUploadedEvent.tv_id, StatsUploadedEvent.event_id]
+            ).returning(StatsUploadedEvent.tv_id, StatsUploadedEvent.event_id)
+            claimed.update((row.tv_id, row.event_id) for row in self.db.execute(stmt))
+        return claimed
+
+    def apply_increments(
+        self,
+        counts: dict[StatsKey, int],
+        links: Optional[dict] = None,
+        sketches: Optional[dict[SketchKey, HyperLogLog]] = None,
+    ) -> int:
+        """
+        Применить агрегированные приращения к TVStats и TVLink (без commit).
+
+        links - уже загруженные get_links() ссылки, если вызывающий код их
+        проверял. События удалённых ТВ (буфер и журнал хранят их до записи),
+        несуществующих ссылок или ссылок другого ТВ отбрасываются. sketches - скетчи зрителей событий view, они
+        объединяются с сохранёнными, а unique_views получает их оценку.
+        Возвращает количество применённых событий.
+        """
+        if not counts:
+            return 0
+
+        if links is None:
+            links = self.get_links(key.link_id for key in counts)
+        tv_ids = self.get_tv_ids(key.tv_id for key in counts)
+
+        # (tv_id, link_id, stat_date) -> {column: n}
+        stat_rows: dict[tuple, dict[str, int]] = {}
+        # (tv_id, link_id, stat_hour) -> {column: n}
+        hourly_rows: dict[tuple, dict[str, int]] = {}
+        link_counters: dict[int, dict[str, int]] = {}
+        applied = 0
+
+        for key, n in counts.items():
+            if n <= 0 or key.event_type not in EVENT_COLUMNS or key.tv_id not in tv_ids:
+                continue
+            if key.link_id is not None:
+                link = links.get(key.link_id)
+                if link is None or link.tv_id != key.tv_id:
+                    continue
+                column = LINK_COUNTER_COLUMNS.get(key.event_type)
+                if column:
+                    counters = link_counters.setdefault(key.link_id, {})
+                    counters[column] = counters.get(column, 0) + n
+            row = stat_rows.setdefault((key.tv_id, key.link_id, key.stat_date), {})
+            column = EVENT_COLUMNS[key.event_type]
+            row[column] = row.get(column, 0) + n
+            stat_hour = datetime.combine(key.stat_date, time(key.hour))
+            row = hourly_rows.setdefault((key.tv_id, key.link_id, stat_hour), {})
+            column = HOURLY_EVENT_COLUMNS[key.event_type]
+            row[column] = row.get(column, 0) + n
+            applied += n
+
+        if stat_rows:
+            self._upsert_increments(
+                TVStats, "stat_date", stat_rows, links,
+                columns=("impressions", "clicks", "unique_views"),
+                defaults={"screen_time_seconds": 0, "created_at": datetime.utcnow()},
+            )
+            self._upsert_increments(
+                TVStatsHourly, "stat_hour", hourly_rows, links,
+                columns=("impressions", "clicks", "views"),
+            )
+
+        if sketches:
+            # Скетчи только для строк, которые реально записаны
+            self._merge_sketches({
+                key: sketch for key, sketch in sketches.items()
+                if (key.tv_id, key.link_id, key.stat_date) in stat_rows
+            })
+
+        for link_id, counters in link_counters.items():
+            self.db.query(TVLink).filter(TVLink.id == link_id).update(
+                {
+                    getattr(TVLink, column): func.coalesce(getattr(TVLink, column), 0) + n
+                    for column, n in counters.items()
+                },
+                synchronize_session=False,
+            )
+
+        return applied
+
+    def unique_viewers(
+        self,
+        date_from: date,
+        date_to: date,
+        tv_id: Optional[int] = None,
+        link_id: Optional[int] = None,
+        advertiser_id: Optional[int] = None,
+    ) -> int:
+        """
+        Оценка уникальных зрителей за период слиянием дневных скетчей.
+
+        Без link_id учитываются все скетчи ТВ (просмотры страницы и ссылок),
+        advertiser_id - скетчи ссылок рекламодателя.
+        """
+        query = self.db.query(TVStatsSketch.registers).filter(
+            TVStatsSketch.stat_date >= date_from,
+            TVStatsSketch.stat_date <= date_to,
+        )
+        if tv_id is not None:
+            query = query.filter(TVStatsSketch.tv_id == tv_id)
+        if link_id is not None:
+            query = query.filter(TVStatsSketch.tv_link_id == link_id)
+        if advertiser_id is not None:
+            query = query.join(TVLink, TVLink.id == TVStatsSketch.tv_link_id).filter(
+                TVLink.advertiser_id == advertiser_id
+            )
+
+        total = new_sketch()
+        for row in query:
+            sketch = load_sketch(row.registers)
+            if sketch is not None:
+                total.merge(sketch)
+        return total.estimate()
+
+    def _merge_sketches(self, sketches: dict[SketchKey, HyperLogLog]) -> None:
+        """
+        Объединить скетчи зрителей с сохранёнными и обновить TVStats.unique_views.
+
+        Недостающие строки создаются через INSERT ... ON CONFLICT DO NOTHING,
+        затем строки читаются с блокировкой (SELECT ... FOR UPDATE), поэтому
+        параллельные воркеры не теряют регистры друг друга.
+        """
+        if not sketches:
+            return
+
+        insert = dialect_insert(self.db)
+        now = datetime.utcnow()
+        stmt = insert(TVStatsSketch).values([
+            {
+                "tv_id": key.tv_id,
+                "tv_link_id": key.link_id,
+                "stat_date": key.stat_date,
+                "registers": b"",
+                "updated_at": now,
+            }
+            for key in sketches
+        ])
+        self.db.execute(stmt.on_conflict_do_nothing(
+            index_elements=[
+                TVStatsSketch.tv_id,
+                func.coalesce(TVStatsSketch.tv_link_id, literal_column("0")),
+                TVStatsSketch.stat_date,
+            ],
+        ))
+
+        rows = self.db.query(TVStatsSketch).filter(
+            TVStatsSketch.tv_id.in_({key.tv_id for key in sketches}),
+            TVStatsSketch.stat_date.in_({key.stat_date for key in sketches}),
+        ).with_for_update().all()
+
+        for row in rows:
+            sketch = sketches.get(SketchKey(row.tv_id, row.tv_link_id, row.stat_date))
+            if sketch is None:
+                continue
+            merged = load_sketch(row.registers)
+            if merged is None:
+                print(f"Error merging viewer sketch {row.id}: precision changed, sketch reset")
+                merged = new_sketch()
+            merged.merge(sketch)
+            row.registers = merged.to_bytes()
+            row.updated_at = now
+
+            self.db.query(TVStats).filter(
+                TVStats.tv_id == row.tv_id,
+                func.coalesce(TVStats.tv_link_id, literal_column("0")) == (row.tv_link_id or 0),
+                TVStats.stat_date == row.stat_date,
+            ).update({TVStats.unique_views: merged.estimate()}, synchronize_session=False)
+
+    def _upsert_increments(
+        self,
+        model,
+        period_column: str,
+        rows: dict[tuple, dict[str, int]],
+        links: dict,
+        columns: tuple,
+        defaults: Optional[dict] = None,
+    ) -> None:
+        """
+        Атомарно увеличить строки статистики одним INSERT ... ON CONFLICT DO UPDATE.
+
+        rows - {(tv_id, link_id, период): {колонка: приращение}}. Конфликт
+        определяется уникальным индексом (tv_id, COALESCE(tv_link_id, 0), период),
+        поэтому параллельные воркеры не создают дубликатов и не теряют приращения.
+        """
+        insert = dialect_insert(self.db)
+
+        now = datetime.utcnow()
+        values = []
+        for (tv_id, link_id, period), increments in rows.items():
+            link = links.get(link_id)
+            value = {
+                "tv_id": tv_id,
+                "tv_link_id": link_id,
+                "advertiser_id": link.advertiser_id if link else None,
+                period_column: period,
+                "updated_at": now,
+                **(defaults or {}),
+            }
+            for column in columns:
+                value[column] = increments.get(column, 0)
+            values.append(value)
+
+        stmt = insert(model).values(values)
+        set_ = {
+            column: func.coalesce(getattr(model, column), 0) + getattr(stmt.excluded, column)
+            for column in columns
+        }
+        set_["updated_at"] = stmt.excluded.updated_at
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[
+                model.tv_id,
+                func.coalesce(model.tv_link_id, literal_column("0")),
+                getattr(model, period_column),
+            ],
+            set_=set_,
+        )
+        self.db.execute(stmt)
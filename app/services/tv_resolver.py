@@ -0,0 +1,167 @@
+"""
+Поиск ТВ по коду или ID одним запросом (QR-коды, Public API, витрина, админка).
+
+Идентификатор сначала ищется как TV.code, затем как TV.id - код имеет
+приоритет. Резолвер помнит соответствие code -> id (повторный поиск идёт
+по первичному ключу) и коротко кеширует ненайденные идентификаторы, чтобы
+боты, перебирающие случайные QR-коды, не доходили до БД.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from app.models import TV
+from app.settings import settings
+
+# Максимальное значение Integer-колонки в PostgreSQL
+MAX_TV_ID = 2 ** 31 - 1
+
+
+def parse_tv_id(identifier: str) -> Optional[int]:
+    """ID ТВ из идентификатора или None, если это не допустимое число."""
+    if not identifier.isdigit():
+        return None
+    tv_id = int(identifier)
+    return tv_id if 0 < tv_id <= MAX_TV_ID else None
+
+
+class TVResolver:
+    """Поиск ТВ по коду или ID с кешем кодов и отрицательным кешем."""
+
+    def __init__(self, max_size: int, not_found_ttl_seconds: float):
+        self.max_size = max_size
+        self.not_found_ttl_seconds = not_found_ttl_seconds
+        self._codes: "OrderedDict[str, int]" = OrderedDict()       # code -> tv_id
+        self._code_of: dict[int, str] = {}                         # tv_id -> code
+        self._missing: "OrderedDict[str, float]" = OrderedDict()   # identifier -> expires_at
+        self._lock = threading.Lock()
+
+    def resolve(self, db: Session, identifier: str, use_negative_cache: bool = True) -> Optional[TV]:
+        """
+        Найти ТВ по коду или ID (не более одного запроса к БД).
+
+        use_negative_cache=False - не доверять кешу ненайденных
+        (например, в админке сразу после создания ТВ на другом воркере).
+        """
+        if use_negative_cache and self.is_missing(identifier):
+            return None
+
+        with self._lock:
+            known_id = self._codes.get(identifier)
+            if known_id is not None:
+                self._codes.move_to_end(identifier)
+
+        if known_id is not None:
+            tv = db.get(TV, known_id)
+            if tv is not None and tv.code == identifier:
+                return tv
+            self._forget_code(identifier)
+
+        tv_id = parse_tv_id(identifier)
+        condition = TV.code == identifier
+        if tv_id is not None:
+            condition = or_(condition, TV.id == tv_id)
+        tvs = db.query(TV).filter(condition).limit(2).all()
+
+        tv = next((t for t in tvs if t.code == identifier), None) or (tvs[0] if tvs else None)
+        if tv is None:
+            self._remember_missing(identifier)
+            return None
+        self._remember_code(tv.code, tv.id)
+        return tv
+
+    def resolve_many(self, db: Session, identifiers) -> dict[str, TV]:
+        """
+        Найти несколько ТВ по кодам или ID одним запросом.
+
+        Возвращает {identifier: TV} только для найденных; код имеет
+        приоритет над ID, как в resolve().
+        """
+        identifiers = {i for i in identifiers if not self.is_missing(i)}
+        if not identifiers:
+            return {}
+
+        ids = {tv_id for tv_id in map(parse_tv_id, identifiers) if tv_id is not None}
+        condition = TV.code.in_(identifiers)
+        if ids:
+            condition = or_(condition, TV.id.in_(ids))
+        tvs = db.query(TV).filter(condition).all()
+
+        by_code = {tv.code: tv for tv in tvs}
+        by_id = {tv.id: tv for tv in tvs}
+        found = {}
+        for identifier in identifiers:
+            tv = by_code.get(identifier) or by_id.get(parse_tv_id(identifier))
+            if tv is None:
+                self._remember_missing(identifier)
+            else:
+                found[identifier] = tv
+        for tv in tvs:
+            self._remember_code(tv.code, tv.id)
+        return found
+
+    def is_missing(self, identifier: str) -> bool:
+        """Идентификатор недавно не был найден в БД."""
+        with self._lock:
+            expires_at = self._missing.get(identifier)
+            if expires_at is None:
+                return False
+            if expires_at < time.monotonic():
+                del self._missing[identifier]
+                return False
+            return True
+
+    def forget(self, tv_id: int) -> None:
+        """Сбросить коды ТВ (изменение кода, удаление ТВ)."""
+        with self._lock:
+            code = self._code_of.pop(tv_id, None)
+            if code is not None:
+                self._codes.pop(code, None)
+
+    def clear(self) -> None:
+        """Полностью очистить кеши."""
+        with self._lock:
+            self._codes.clear()
+            self._code_of.clear()
+            self._missing.clear()
+
+    def _remember_code(self, code: str, tv_id: int) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            old_code = self._code_of.get(tv_id)
+            if old_code is not None and old_code != code:
+                self._codes.pop(old_code, None)
+            self._codes[code] = tv_id
+            self._codes.move_to_end(code)
+            self._code_of[tv_id] = code
+            self._missing.pop(code, None)
+            while len(self._codes) > self.max_size:
+                _, evicted_id = self._codes.popitem(last=False)
+                self._code_of.pop(evicted_id, None)
+
+    def _forget_code(self, code: str) -> None:
+        with self._lock:
+            tv_id = self._codes.pop(code, None)
+            if tv_id is not None and self._code_of.get(tv_id) == code:
+                del self._code_of[tv_id]
+
+    def _remember_missing(self, identifier: str) -> None:
+        if self.max_size <= 0 or self.not_found_ttl_seconds <= 0:
+            return
+        with self._lock:
+            self._missing[identifier] = time.monotonic() + self.not_found_ttl_seconds
+            self._missing.move_to_end(identifier)
+            while len(self._missing) > self.max_size:
+                self._missing.popitem(last=False)
+
+
+tv_resolver = TVResolver(
+    max_size=settings.TV_RESOLVER_CACHE_SIZE,
+    not_found_ttl_seconds=settings.TV_NOT_FOUND_TTL_SECONDS,
+)
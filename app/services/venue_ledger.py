@@ -0,0 +1,172 @@
+"""
+Журнал начислений и выплат площадок (venue_ledger) и их балансы.
+
+Журнал только дополняется: начисление пишется при создании подписки,
+списание - при проведении выплаты. Когда удаляется рекламодатель или ТВ,
+их подписки удаляются, а начисления по ним сторнируются (reversal):
+площадка теряет заработок по удалённым подпискам, как и при подсчёте
+по истории подписок. Записи удалённой площадки удаляются вместе с ней
+(ON DELETE CASCADE и явно в delete_venue). В той же транзакции строка
+VenueBalance увеличивается одним UPSERT (earned = earned + :amount), так
+что баланс атомарен при параллельных запросах нескольких воркеров.
+Страницы заработка читают баланс площадки и журнал постранично,
+а не суммируют всю историю подписок и выплат.
+"""
+
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Optional
+
+from sqlalchemy import case, extract, func
+from sqlalchemy.orm import Session
+
+from app.models import LedgerEntryType, Subscription, TV, VenueBalance, VenueLedgerEntry, VenuePayout
+from app.services.pagination import Page, paginate
+from app.services.stats_service import dialect_insert
+
+
+class VenueLedgerService:
+    def __init__(self, db: Session):
+        self.db = db
+
+    # ─── Запись (без commit) ───
+
+    def credit_subscription(self, subscription: Subscription, tv: TV) -> Optional[VenueLedgerEntry]:
+        """Начислить площадке долю от подписки (subscription уже добавлена в сессию)."""
+        if tv.venue_id is None:
+            return None
+        amount = Decimal(str(subscription.venue_payout or 0))
+        if subscription.id is None:
+            self.db.flush([subscription])
+        entry = VenueLedgerEntry(
+            venue_id=tv.venue_id,
+            tv_id=tv.id,
+            subscription_id=subscription.id,
+            entry_type=LedgerEntryType.CREDIT,
+            amount=amount,
+            entry_date=subscription.start_date,
+            description=f"Подписка #{subscription.id}: {tv.name}",
+        )
+        self.db.add(entry)
+        self._apply(tv.venue_id, earned=amount, subscriptions=1)
+        return entry
+
+    def debit_payout(self, payout: VenuePayout) -> VenueLedgerEntry:
+        """Списать проведённую выплату с баланса площадки."""
+        amount = Decimal(str(payout.amount))
+        paid_at = payout.paid_at or datetime.utcnow()
+        entry = VenueLedgerEntry(
+            venue_id=payout.venue_id,
+            tv_id=payout.tv_id,
+            payout_id=payout.id,
+            entry_type=LedgerEntryType.DEBIT,
+            amount=amount,
+            entry_date=paid_at.date(),
+            description=f"Выплата #{payout.id} за {payout.period_start.strftime('%d.%m.%Y')} — {payout.period_end.strftime('%d.%m.%Y')}",
+        )
+        self.db.add(entry)
+        self._apply(payout.venue_id, paid=amount)
+        return entry
+
+    def reverse_advertiser_credits(self, advertiser_id: int) -> int:
+        """Сторнировать начисления по подпискам рекламодателя (до удаления подписок)."""
+        return self._reverse_credits(Subscription.advertiser_id == advertiser_id, "рекламодатель удалён")
+
+    def reverse_tv_credits(self, tv_id: int) -> int:
+        """Сторнировать начисления по подпискам ТВ (до удаления ТВ вместе с подписками)."""
+        return self._reverse_credits(Subscription.tv_id == tv_id, "ТВ удалён")
+
+    def _reverse_credits(self, condition, reason: str) -> int:
+        """
+        Сторнировать начисления по подпискам, отобранным condition.
+
+        Сторно датируется датой начисления, чтобы помесячная разбивка
+        уменьшалась в том же месяце. Возвращает число сторнированных записей.
+        """
+        credits = self.db.query(VenueLedgerEntry).join(
+            Subscription, Subscription.id == VenueLedgerEntry.subscription_id
+        ).filter(
+            condition,
+            VenueLedgerEntry.entry_type == LedgerEntryType.CREDIT,
+        ).all()
+
+        per_venue: dict[int, list] = {}
+        for credit in credits:
+            self.db.add(VenueLedgerEntry(
+                venue_id=credit.venue_id,
+                tv_id=credit.tv_id,
+                entry_type=LedgerEntryType.REVERSAL,
+                amount=credit.amount,
+                entry_date=credit.entry_date,
+                description=f"Сторно подписки #{credit.subscription_id}: {reason}",
+            ))
+            totals = per_venue.setdefault(credit.venue_id, [Decimal("0"), 0])
+            totals[0] += credit.amount
+            totals[1] += 1
+        for venue_id, (amount, count) in per_venue.items():
+            self._apply(venue_id, earned=-amount, subscriptions=-count)
+        return len(credits)
+
+    def delete_venue(self, venue_id: int) -> None:
+        """Удалить журнал и баланс площадки (перед удалением самой площадки)."""
+        self.db.query(VenueLedgerEntry).filter(VenueLedgerEntry.venue_id == venue_id).delete(synchronize_session=False)
+        self.db.query(VenueBalance).filter(VenueBalance.venue_id == venue_id).delete(synchronize_session=False)
+
+    def _apply(self, venue_id: int, earned: Decimal = Decimal("0"), paid: Decimal = Decimal("0"), subscriptions: int = 0) -> None:
+        """Атомарно изменить баланс площадки (UPSERT с приращением)."""
+        insert = dialect_insert(self.db)
+        stmt = insert(VenueBalance).values(
+            venue_id=venue_id,
+            earned=earned,
+            paid=paid,
+            balance=earned - paid,
+            subscriptions_count=subscriptions,
+            updated_at=datetime.utcnow(),
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[VenueBalance.venue_id],
+            set_={
+                "earned": VenueBalance.earned + stmt.excluded.earned,
+                "paid": VenueBalance.paid + stmt.excluded.paid,
+                "balance": VenueBalance.balance + stmt.excluded.balance,
+                "subscriptions_count": VenueBalance.subscriptions_count + stmt.excluded.subscriptions_count,
+                "updated_at": stmt.excluded.updated_at,
+            },
+        )
+        self.db.execute(stmt)
+
+    # ─── Чтение ───
+
+    def balance(self, venue_id: int) -> VenueBalance:
+        """Баланс площадки (нулевой, если операций ещё не было)."""
+        row = self.db.query(VenueBalance).filter(VenueBalance.venue_id == venue_id).first()
+        if row is None:
+            row = VenueBalance(venue_id=venue_id, earned=Decimal("0"), paid=Decimal("0"), balance=Decimal("0"), subscriptions_count=0)
+        return row
+
+    def entries_page(self, venue_id: int, page: Optional[int] = None, per_page: Optional[int] = None) -> Page:
+        """Журнал площадки, новые записи первыми."""
+        query = self.db.query(VenueLedgerEntry).filter(
+            VenueLedgerEntry.venue_id == venue_id
+        ).order_by(VenueLedgerEntry.created_at.desc(), VenueLedgerEntry.id.desc())
+        return paginate(query, page, per_page)
+
+    def monthly_credits(self, venue_id: int, since: date) -> list[tuple[str, dict]]:
+        """Начисления за вычетом сторно по месяцам начала подписок с since: [("YYYY-MM", {earnings, count})], новые первыми."""
+        year = extract("year", VenueLedgerEntry.entry_date)
+        month = extract("month", VenueLedgerEntry.entry_date)
+        is_credit = VenueLedgerEntry.entry_type == LedgerEntryType.CREDIT
+        rows = self.db.query(
+            year, month,
+            func.sum(case((is_credit, VenueLedgerEntry.amount), else_=-VenueLedgerEntry.amount)),
+            func.sum(case((is_credit, 1), else_=-1)),
+        ).filter(
+            VenueLedgerEntry.venue_id == venue_id,
+            VenueLedgerEntry.entry_type.in_([LedgerEntryType.CREDIT, LedgerEntryType.REVERSAL]),
+            VenueLedgerEntry.entry_date >= since,
+        ).group_by(year, month).order_by(year.desc(), month.desc()).all()
+        return [
+            (f"{int(y):04d}-{int(m):02d}", {"earnings": float(earnings or 0), "count": int(count)})
+            for y, m, earnings, count in rows
+            if count > 0
+        ]
@@ -0,0 +1,134 @@
+"""
+Сводка кабинета площадки: показатели по каждому ТВ и итоги по площадке.
+
+Все показатели считаются сгруппированными запросами (GROUP BY tv_id) по
+всем ТВ площадки сразу, поэтому число запросов не зависит от числа экранов.
+Начислено / выплачено / к выплате берутся из баланса площадки
+(venue_ledger), а не суммируются по истории подписок и выплат.
+"""
+
+from datetime import date
+from decimal import Decimal
+from typing import NamedTuple, Optional
+
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+
+from app.models import Role, Subscription, TV, TVLink, User, VenueBalance, VenuePayout
+from app.services.pagination import Page, paginate
+from app.services.venue_ledger import VenueLedgerService
+
+
+class TVSummary(NamedTuple):
+    links_count: int = 0
+    active_subscriptions: int = 0
+    impressions: int = 0
+    clicks: int = 0
+    earnings: Decimal = Decimal("0")
+
+
+class VenueBalanceItem(NamedTuple):
+    venue: User
+    tv_count: int
+    total_earned: float
+    total_paid: float
+    pending: float
+
+
+class VenueSummaryService:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def tv_stats(self, venue_id: int, today: Optional[date] = None) -> dict[int, TVSummary]:
+        """
+        Показатели всех ТВ площадки: tv_id -> TVSummary (два запроса).
+
+        active_subscriptions - подписки, не закончившиеся к today;
+        earnings - сумма выплат площадке по всем подпискам ТВ.
+        """
+        today = today or date.today()
+        links = self.db.query(
+            TVLink.tv_id,
+            func.count(TVLink.id),
+            func.coalesce(func.sum(TVLink.impressions), 0),
+            func.coalesce(func.sum(TVLink.clicks), 0),
+        ).join(TV, TV.id == TVLink.tv_id).filter(
+            TV.venue_id == venue_id
+        ).group_by(TVLink.tv_id).all()
+
+        subscriptions = self.db.query(
+            Subscription.tv_id,
+            func.coalesce(func.sum(case((Subscription.end_date >= today, 1), else_=0)), 0),
+            func.coalesce(func.sum(Subscription.venue_payout), 0),
+        ).join(TV, TV.id == Subscription.tv_id).filter(
+            TV.venue_id == venue_id
+        ).group_by(Subscription.tv_id).all()
+
+        result: dict[int, TVSummary] = {}
+        for tv_id, links_count, impressions, clicks in links:
+            result[tv_id] = TVSummary(links_count=int(links_count), impressions=int(impressions), clicks=int(clicks))
+        for tv_id, active, earnings in subscriptions:
+            result[tv_id] = result.get(tv_id, TVSummary())._replace(
+                active_subscriptions=int(active), earnings=Decimal(str(earnings))
+            )
+        return result
+
+    def advertisers_count(self, venue_id: int) -> int:
+        """Число рекламодателей, оформлявших подписки на ТВ площадки."""
+        return self.db.query(func.count(func.distinct(Subscription.advertiser_id))).join(
+            TV, TV.id == Subscription.tv_id
+        ).filter(TV.venue_id == venue_id).scalar() or 0
+
+    def totals(self, venue_id: int, tv_stats: Optional[dict[int, TVSummary]] = None) -> dict:
+        """Итоги площадки: показы, клики, заработано, выплачено, к выплате, рекламодатели."""
+        if tv_stats is None:
+            tv_stats = self.tv_stats(venue_id)
+        balance = VenueLedgerService(self.db).balance(venue_id)
+        return {
+            "total_impressions": sum(s.impressions for s in tv_stats.values()),
+            "total_clicks": sum(s.clicks for s in tv_stats.values()),
+            "total_earnings": balance.earned,
+            "total_paid": balance.paid,
+            "pending": balance.balance,
+            "advertisers_count": self.advertisers_count(venue_id),
+        }
+
+    # ─── Все площадки (админка) ───
+
+    def balances_page(self, page: Optional[int] = None, per_page: Optional[int] = None) -> Page:
+        """
+        Площадки с числом ТВ, начислено / выплачено / к выплате.
+
+        Одна страница - один SQL-запрос: площадки с балансами из
+        venue_balances и числом ТВ из сгруппированного подзапроса.
+        """
+        tv_counts = self.db.query(
+            TV.venue_id.label("venue_id"),
+            func.count(TV.id).label("tv_count"),
+        ).group_by(TV.venue_id).subquery()
+
+        query = self.db.query(
+            User,
+            func.coalesce(tv_counts.c.tv_count, 0),
+            func.coalesce(VenueBalance.earned, 0),
+            func.coalesce(VenueBalance.paid, 0),
+            func.coalesce(VenueBalance.balance, 0),
+        ).outerjoin(tv_counts, tv_counts.c.venue_id == User.id).outerjoin(
+            VenueBalance, VenueBalance.venue_id == User.id
+        ).filter(User.role == Role.VENUE).order_by(User.id)
+
+        total = self.db.query(func.count(User.id)).filter(User.role == Role.VENUE).scalar() or 0
+        result = paginate(query, page, per_page, total)
+        result.items = [
+            VenueBalanceItem(venue, int(tv_count), float(earned), float(paid), float(pending))
+            for venue, tv_count, earned, paid, pending in result.items
+        ]
+        return result
+
+    def payout_totals(self) -> dict:
+        """Суммы выплат по всем площадкам: проведённые и ожидающие (pending, processing)."""
+        row = self.db.query(
+            func.coalesce(func.sum(case((VenuePayout.status == "paid", VenuePayout.amount), else_=0)), 0),
+            func.coalesce(func.sum(case((VenuePayout.status.in_(["pending", "processing"]), VenuePayout.amount), else_=0)), 0),
+        ).one()
+        return {"total_payouts": float(row[0]), "pending_payouts": float(row[1])}
@@ -93,6 +93,67 @@ class Settings(BaseSettings):
     TELEGRAM_BOT_TOKEN: str = ""
     TELEGRAM_CHAT_ID: str = ""
     
+    # ─────────────────────────────────────────────────────────────
+    # Кабинеты — постраничный вывод списков
+    # ─────────────────────────────────────────────────────────────
+    PAGE_SIZE: int = 50                     # Строк на странице по умолчанию
+    PAGE_SIZE_MAX: int = 200                # Макс. строк на странице
+    
+    # ─────────────────────────────────────────────────────────────
+    # Админка — снимок KPI
+    # ─────────────────────────────────────────────────────────────
+    ADMIN_KPI_TTL_SECONDS: float = 60.0     # Сколько живёт снимок KPI
+    ADMIN_KPI_REFRESH_SECONDS: float = 30.0 # Период фонового обновления снимка
+    
+    # ─────────────────────────────────────────────────────────────
+    # Public API (ТВ-плееры) — кеширование контента
+    # ─────────────────────────────────────────────────────────────
+    CONTENT_CACHE_SIZE: int = 5000          # Макс. кол-во ТВ в кеше (0 — кеш выключен)
+    CONTENT_CACHE_TTL_SECONDS: int = 30     # Страховочный TTL при нескольких воркерах
+    SSE_HEARTBEAT_SECONDS: int = 25         # Пинг SSE и перепроверка версии (< proxy_read_timeout nginx)
+    SHOWCASE_MAX_AGE_SECONDS: int = 30      # Cache-Control max-age витрины /tv/{tv_code}
+    CONTENT_DELTA_MAX_VERSIONS: int = 100   # Сколько версий ТВ хранит журнал изменений ссылок (дельта-синхронизация)
+    SCREENS_MANIFEST_MAX_TVS: int = 100     # Макс. ТВ в одном запросе /api/public/screens
+    RESPONSE_COMPRESS_MIN_BYTES: int = 512  # Тела меньше не сжимаются (gzip/brotli)
+    ENCODED_BODY_CACHE_SIZE: int = 1000     # Макс. готовых тел манифестов и QR-ответов в памяти
+    LINK_CACHE_SIZE: int = 20000            # Макс. кол-во ссылок в кеше редиректов /r/{link_id}
+    TV_RESOLVER_CACHE_SIZE: int = 50000     # Макс. кол-во кодов ТВ и ненайденных идентификаторов в памяти
+    TV_NOT_FOUND_TTL_SECONDS: int = 10      # Сколько помнить ненайденный код/ID ТВ или ссылки (защита от перебора QR)
+    
+    # ─────────────────────────────────────────────────────────────
+    # Public API (ТВ-плееры) — приём статистики
+    # ─────────────────────────────────────────────────────────────
+    STATS_WRITE_BEHIND: bool = True         # Буферизовать события и писать в БД пакетно
+    STATS_FLUSH_INTERVAL_SECONDS: float = 5.0  # Период сброса буфера статистики
+    STATS_BATCH_MAX_EVENTS: int = 1000      # Макс. событий в /api/public/stats/batch
+    STATS_HLL_PRECISION: int = 11           # Точность HLL уникальных зрителей (2^p байт на скетч, ~2.3%); не менять на живых данных
+    STATS_LATE_EVENT_WINDOW_HOURS: int = 48 # Насколько старые события (по времени плеера) ещё принимаются
+    STATS_CLOCK_SKEW_SECONDS: int = 300     # Допустимое опережение часов плеера
+    STATS_UPLOAD_MAX_EVENTS: int = 5000     # Макс. событий в /api/public/stats/upload (офлайн-буфер плеера)
+    STATS_RATE_LIMIT_PER_MINUTE: int = 60   # Событий в минуту на (ТВ, ссылка, устройство), сверх - отбрасываются (0 — без лимита)
+    STATS_RATE_LIMIT_BURST: int = 20        # Запас token bucket для всплесков
+    STATS_DEDUP_WINDOW_SECONDS: float = 1.0 # Одинаковое событие устройства чаще - дубль (0 — выключено)
+    STATS_GUARD_MAX_KEYS: int = 100000      # Макс. устройств в памяти лимитера и окна повторов
+    
+    # ─────────────────────────────────────────────────────────────
+    # Статистика — свёртки и хранение (0 — хранить бессрочно)
+    # ─────────────────────────────────────────────────────────────
+    STATS_HOURLY_RETENTION_DAYS: int = 35   # Почасовая статистика (tv_stats_hourly)
+    STATS_DAILY_RETENTION_DAYS: int = 0     # Дневная статистика и скетчи (удаляются целыми месяцами после свёртки)
+    STATS_MONTHLY_RETENTION_MONTHS: int = 0 # Месячная статистика (tv_stats_monthly)
+    STATS_ROLLUP_INTERVAL_SECONDS: int = 3600  # Период свёртки дней в месяцы и очистки по срокам хранения
+    STATS_ROLLUP_LOOKBACK_DAYS: int = 2     # За сколько последних дней пересчитываются месяцы (не меньше окна опоздания)
+    
+    # ─────────────────────────────────────────────────────────────
+    # Статистика — журнал сырых событий (аудит, споры с рекламодателями)
+    # ─────────────────────────────────────────────────────────────
+    STATS_EVENT_LOG: bool = False           # Писать события в журнал на диске; в TVStats они попадают при свёртке сегментов
+    EVENT_LOG_DIR: str = "data/event_log"   # Каталог сегментов журнала
+    EVENT_LOG_SEGMENT_MAX_RECORDS: int = 1_000_000  # Сегмент закрывается после N записей (32 байта на запись)
+    EVENT_LOG_SEGMENT_MAX_SECONDS: int = 60 # ... или через N секунд после первой записи
+    EVENT_LOG_COMPACT_INTERVAL_SECONDS: float = 15.0  # Период свёртки закрытых сегментов в TVStats
+    EVENT_LOG_RETENTION_DAYS: int = 400     # Сколько хранить свёрнутые сегменты (0 — бессрочно)
+    
     class Config:
         env_file = ".env"
         extra = "ignore"